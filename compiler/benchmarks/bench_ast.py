@@ -0,0 +1,58 @@
+"""
+AST memory per node
+
+    PYTHONPATH=src python benchmarks/bench_ast.py [statements]
+
+Parses lets of the form let xN = aN + N * b; and reports the memory
+retained by the resulting AST, including its tokens and names.
+"""
+
+import sys
+import tracemalloc
+from dataclasses import fields, is_dataclass
+from compiler.parser import parse
+
+
+def source(statements):
+    return "".join(
+        f"let x{i} = a{i % 100} + {i} * b;\n"
+        for i in range(statements)
+    )
+
+
+def count(program):
+    nodes = 0
+    pending = list(program.statements)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            pending += node
+        elif is_dataclass(node) and type(
+            node
+        ).__name__.startswith("Node"):
+            nodes += 1
+            pending += [
+                getattr(node, field.name)
+                for field in fields(node)
+            ]
+    return nodes
+
+
+def main():
+    statements = (
+        int(sys.argv[1]) if len(sys.argv) > 1 else 150_000
+    )
+    content = source(statements)
+    tracemalloc.start()
+    program = parse(content)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    nodes = count(program)
+    print(
+        f"{nodes:8d} nodes {size / 2**20:8.1f} MB"
+        f" {size / nodes:6.1f} B/node"
+    )
+
+
+if __name__ == "__main__":
+    main()
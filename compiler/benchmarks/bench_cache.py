@@ -0,0 +1,95 @@
+"""
+Cached builds against full builds of unchanged programs
+
+    PYTHONPATH=src python benchmarks/bench_cache.py
+
+A full build lowers the program to x86_64 assembly and, on an
+x86_64 host with as and ld, assembles and links it, as main does
+with the cross toolchain. A cached build hashes the source and
+options and copies the entry main would have stored.
+"""
+
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from compiler import cache, code_gen, main, peephole
+from compiler.arch import Arch
+from programs import lowered_chunk
+
+SIZES = [10, 1000, 10000]
+
+
+def build(src, toolchain):
+    lines = peephole.optimise(
+        code_gen.gas_lines(main.instructions(src)), Arch.x86_64
+    )
+    with open("vinyl.asm", "w") as stream:
+        stream.write(code_gen.render(lines) + "\n")
+    if toolchain:
+        subprocess.check_call(
+            ["as", "vinyl.asm", "-o", "vinyl.o"]
+        )
+        subprocess.check_call(
+            ["ld", "vinyl.o", "-o", "vinyl.exe"]
+        )
+    else:
+        for name in ("vinyl.o", "vinyl.exe"):
+            shutil.copy("vinyl.asm", name)
+
+
+def cached(src, store):
+    with open(src, "rb") as stream:
+        key = cache.key(stream.read(), arch="x86_64")
+    return store.restore(key, main.OUTPUTS), key
+
+
+def best(function, *args, runs=5):
+    seconds = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(*args)
+        elapsed = time.perf_counter() - start
+        seconds = (
+            elapsed if seconds is None else min(seconds, elapsed)
+        )
+    return seconds
+
+
+def run():
+    toolchain = platform.machine() == "x86_64" and all(
+        map(shutil.which, ("as", "ld"))
+    )
+    if not toolchain:
+        print("no as and ld for the host, timing code gen only")
+    store = cache.Cache("cache")
+    for size in SIZES:
+        src = f"program{size}.lp"
+        with open(src, "w") as stream:
+            stream.write(
+                "".join(lowered_chunk(i) for i in range(size))
+                + "exit(0);\n"
+            )
+        full = best(build, src, toolchain)
+        hit, key = cached(src, store)
+        store.store(key, main.OUTPUTS)
+        hit = best(cached, src, store)
+        print(
+            f"{size:>6} functions full {1e3 * full:9.2f} ms"
+            f" cached {1e3 * hit:7.2f} ms"
+            f" {full / hit:8.1f}x"
+        )
+    stats = store.stats()
+    print(f"cache: {stats.hits} hits {stats.misses} misses")
+
+
+if __name__ == "__main__":
+    directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as temporary:
+        os.chdir(temporary)
+        try:
+            run()
+        finally:
+            os.chdir(directory)
@@ -0,0 +1,84 @@
+"""
+Building executables with the built-in assembler against as and ld
+
+    PYTHONPATH=src python benchmarks/bench_elf.py
+
+The same x86_64 assembly is made an executable by assembler and elf
+in process, and by as and ld as subprocesses, and each executable is
+run once to check they agree. The as and ld path needs them on the
+host, running either needs an x86_64 host.
+"""
+
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from compiler import assembler, code_gen, dce, elf, fold, ir
+from compiler import peephole
+from compiler.arch import Arch
+from compiler.parser import parse
+from programs import lowered_chunk
+
+SIZES = [10, 100, 1000]
+
+
+def builtin(lines, name):
+    elf.write(assembler.assemble(lines), Arch.x86_64, name)
+
+
+def toolchain(lines, name):
+    with open(f"{name}.s", "w") as stream:
+        stream.write(code_gen.render(lines))
+    subprocess.check_call(["as", f"{name}.s", "-o", f"{name}.o"])
+    subprocess.check_call(["ld", f"{name}.o", "-o", name])
+
+
+def timed(build, lines, name, runs=5):
+    """Seconds per build, best of runs"""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        build(lines, name)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def main():
+    host = all(map(shutil.which, ("as", "ld")))
+    native = platform.machine() == "x86_64"
+    for size in SIZES:
+        source = (
+            "".join(lowered_chunk(i) for i in range(size))
+            + "exit(0);\n"
+        )
+        instructions = dce.eliminate(
+            fold.fold(ir.visit(parse(source)))
+        )
+        lines = list(
+            peephole.optimise(
+                code_gen.gas_lines(instructions), Arch.x86_64
+            )
+        )
+        builds = [("builtin", builtin)]
+        if host:
+            builds.append(("as+ld", toolchain))
+        with tempfile.TemporaryDirectory() as directory:
+            for label, build in builds:
+                name = os.path.join(directory, label)
+                seconds = timed(build, lines, name)
+                status = (
+                    subprocess.run([name]).returncode
+                    if native
+                    else "-"
+                )
+                print(
+                    f"{size:>5} chunks {label:>8}"
+                    f" {1e3 * seconds:9.2f} ms exit {status}"
+                )
+
+
+if __name__ == "__main__":
+    main()
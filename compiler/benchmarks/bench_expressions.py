@@ -0,0 +1,44 @@
+"""
+Expression parse time on long flat and deeply nested expressions
+
+    PYTHONPATH=src python benchmarks/bench_expressions.py
+"""
+
+import time
+from compiler.lexer import tokenize
+from compiler.parser import parse_binary
+
+SIZES = [10**3, 10**4, 10**5, 10**6]
+OPERATORS = ["+", "*", "-", "^", "/"]
+
+
+def flat(size):
+    terms = [str(i % 97) for i in range(size)]
+    return (
+        "".join(
+            term + f" {OPERATORS[i % len(OPERATORS)]} "
+            for i, term in enumerate(terms[:-1])
+        )
+        + terms[-1]
+    )
+
+
+def nested(size):
+    return "(" * size + "1 + 2" + ")" * size
+
+
+def main():
+    for shape in (flat, nested):
+        for size in SIZES:
+            tokens = tokenize(shape(size))
+            start = time.perf_counter()
+            parse_binary(tokens, 0)
+            seconds = time.perf_counter() - start
+            print(
+                f"{shape.__name__:>6} {size:8d}"
+                f" {seconds:7.3f} s {len(tokens) / seconds:10.0f} tokens/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
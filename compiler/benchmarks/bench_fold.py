@@ -0,0 +1,66 @@
+"""
+Instructions removed by constant folding and propagation
+
+    PYTHONPATH=src python benchmarks/bench_fold.py
+
+Lowers each program of a small corpus and reports its instruction
+count before and after fold.fold, and the time the pass takes.
+"""
+
+import time
+from pathlib import Path
+from compiler import fold, ir
+from compiler.parser import parse
+from programs import lowered_chunk
+
+SIZE = 10**4
+
+
+def chain(size):
+    """Lets each computed from the one before"""
+    return (
+        "let v0 = 1;\n"
+        + "".join(
+            f"let v{i} = v{i - 1} * 3 + {i} - v{i - 1} / 2;\n"
+            for i in range(1, size)
+        )
+        + f"exit(v{size - 1} ^ 2);\n"
+    )
+
+
+def functions(size):
+    """Functions returning sums of globals"""
+    return "let k = 6;\n" + "".join(
+        f"fn f{i}(x) {{ let y = k * {i}; return y + k; }}\nf{i}(k);\n"
+        for i in range(size)
+    )
+
+
+def corpus():
+    example = Path(__file__).parent.parent / "example.lp"
+    yield "example.lp", example.read_text()
+    yield "lowered", "".join(
+        lowered_chunk(i) for i in range(SIZE)
+    )
+    yield "chain", chain(SIZE)
+    yield "functions", functions(SIZE)
+
+
+def main():
+    total = removed = 0
+    for name, source in corpus():
+        instructions = list(ir.visit(parse(source)))
+        start = time.perf_counter()
+        folded = fold.fold(instructions)
+        seconds = time.perf_counter() - start
+        total += len(instructions)
+        removed += len(instructions) - len(folded)
+        print(
+            f"{name:>10} {len(instructions):8d} -> {len(folded):8d}"
+            f" instructions {seconds:7.3f} s"
+        )
+    print(f"{'total':>10} {removed:8d} of {total} removed")
+
+
+if __name__ == "__main__":
+    main()
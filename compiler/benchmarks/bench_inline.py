@@ -0,0 +1,87 @@
+"""
+Calls removed by inlining small functions
+
+    PYTHONPATH=src python benchmarks/bench_inline.py
+
+Each program is compiled to IR with fold and dce, with and without
+inline.inline first. Calls left and IR instructions are reported
+with the time inlining takes.
+"""
+
+import time
+from compiler import dce, fold, inline, ir
+from compiler.ir import Expression, Opcode
+from compiler.parser import parse
+
+SIZE = 10**4
+
+
+def helpers(size):
+    """Small functions called once each as statements"""
+    return "let k = 6;\n" + "".join(
+        f"fn f{i}(x) {{ let y = k * {i}; return y + k; }}\nf{i}(k);\n"
+        for i in range(size)
+    )
+
+
+def values(size):
+    """Lets computed by calls to small functions"""
+    return (
+        "fn scale(x, n) { return x * n + 1; }\n"
+        "fn add(a, b) { return a + b; }\n"
+        "let v0 = 1;\n"
+        + "".join(
+            f"let v{i} = add(scale(v{i - 1}, 3), {i});\n"
+            for i in range(1, size)
+        )
+        + f"exit(v{size - 1});\n"
+    )
+
+
+def recursive(size):
+    """Calls to a recursive function, which are kept"""
+    return "fn f(n) { return f(n - 1) + 1; }\n" + "".join(
+        f"f({i});\n" for i in range(size)
+    )
+
+
+def calls(instructions):
+    """Call instructions, with those in values"""
+    total = 0
+    pending = list(instructions)
+    while pending:
+        op, *operands = pending.pop()
+        total += op == Opcode.CALL
+        for operand in operands:
+            if type(operand) is list:
+                pending += operand
+            elif type(operand) is Expression:
+                pending.append((None, operand.lhs, operand.rhs))
+    return total
+
+
+def compile(program):
+    return dce.eliminate(fold.fold(ir.visit(program)))
+
+
+def main():
+    for name, source in [
+        ("helpers", helpers(SIZE)),
+        ("values", values(SIZE)),
+        ("recursive", recursive(SIZE)),
+    ]:
+        program = parse(source)
+        before = compile(program)
+        start = time.perf_counter()
+        inlined = inline.inline(program)
+        seconds = time.perf_counter() - start
+        after = compile(inlined)
+        print(
+            f"{name:>10} {calls(before):6d} -> {calls(after):6d} calls"
+            f" {len(before):7d} -> {len(after):7d} instructions"
+            f" {seconds:7.3f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
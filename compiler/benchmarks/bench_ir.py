@@ -0,0 +1,83 @@
+"""
+IR lowering rate on scaled up test_ir programs
+
+    PYTHONPATH=src python benchmarks/bench_ir.py
+
+Programs repeat the shapes of tests/test_ir.py, a function with a
+parameter, a call and a global let, or are one let with a long sum.
+Rates are repeats of the shape, or terms of the sum, per second.
+Sources are parsed before timing, so only ir.visit is measured,
+the best of three runs is reported. The memory retained by the
+lowered statements program is reported last.
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+from compiler import ir
+from compiler.parser import parse
+
+SIZES = [10**3, 10**4, 10**5, 10**6]
+
+
+def statements(size):
+    return "".join(
+        f"fn f{i}(x) {{ return x; }}\n"
+        f"f{i}(7, 42);\n"
+        f"let y{i} = 36 + 2;\n"
+        for i in range(size)
+    )
+
+
+def terms(size):
+    return "let y = " + "1 + " * size + "1;\n"
+
+
+def best(ast, runs=3):
+    # Collection is off while timing, as in timeit
+    times = []
+    gc.disable()
+    try:
+        for _ in range(runs):
+            start = time.perf_counter()
+            list(ir.visit(ast))
+            times.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return min(times)
+
+
+def retained(ast):
+    tracemalloc.start()
+    instructions = list(ir.visit(ast))
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(instructions), size
+
+
+def main():
+    for shape in (statements, terms):
+        for size in SIZES[: 3 if shape is statements else 4]:
+            ast = parse(shape(size))
+            try:
+                seconds = best(ast)
+            except RecursionError:
+                print(
+                    f"{shape.__name__:>10} {size:8d} RecursionError"
+                )
+                continue
+            print(
+                f"{shape.__name__:>10} {size:8d} {seconds:7.3f} s"
+                f" {size / seconds:10.0f} {shape.__name__}/s"
+            )
+    count, size = retained(parse(statements(SIZES[2])))
+    print(
+        f"{count:8d} instructions {size / 2**20:8.1f} MB"
+        f" {size / count:6.1f} B/instruction"
+    )
+
+
+if __name__ == "__main__":
+    sys.setrecursionlimit(10**4)
+    main()
@@ -0,0 +1,106 @@
+"""
+Running programs in process with the JIT against the VM and a
+native process
+
+    PYTHONPATH=src python benchmarks/bench_jit.py
+
+The same optimised IR is compiled once by each path, then run
+repeatedly. The JIT calls the generated code through ctypes, the VM
+interprets its bytecode and the native path spawns the executable
+as and ld built. Needs an x86_64 host, the native path needs as and
+ld as well.
+"""
+
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from compiler import code_gen, dce, fold, ir, jit, peephole, vm
+from compiler.arch import Arch
+from compiler.parser import parse
+
+RUNS = 1000
+
+
+def example():
+    return (
+        "let a = 100;\nlet b = 42;\nlet c = a + b;\nexit(c);\n"
+    )
+
+
+def calls(size):
+    """Calls to a one parameter function"""
+    return (
+        "fn f(x) { return x; }\n"
+        + "".join(f"f({i});\n" for i in range(size))
+        + "exit(7);\n"
+    )
+
+
+PROGRAMS = [
+    ("example", example()),
+    ("calls 100", calls(100)),
+    ("calls 10000", calls(10**4)),
+]
+
+
+def timed(run, runs=RUNS):
+    """Seconds per run, best of three batches, and status"""
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(runs):
+            status = run()
+        seconds = (time.perf_counter() - start) / runs
+        best = seconds if best is None else min(best, seconds)
+    return best, status
+
+
+def native(lines, directory):
+    name = os.path.join(directory, "program")
+    with open(f"{name}.s", "w") as stream:
+        stream.write(code_gen.render(lines))
+    subprocess.check_call(["as", f"{name}.s", "-o", f"{name}.o"])
+    subprocess.check_call(["ld", f"{name}.o", "-o", name])
+    return lambda: subprocess.run([name]).returncode
+
+
+def main():
+    if not jit.available():
+        print("skipped, needs an x86_64 host")
+        return
+    host = all(map(shutil.which, ("as", "ld")))
+    for name, source in PROGRAMS:
+        instructions = dce.eliminate(
+            fold.fold(ir.visit(parse(source)))
+        )
+        lines = list(
+            peephole.optimise(
+                code_gen.gas_lines(instructions), Arch.x86_64
+            )
+        )
+        start = time.perf_counter()
+        program = jit.Program(lines)
+        compiled = time.perf_counter() - start
+        seconds, status = timed(program)
+        print(
+            f"{name:>12} jit    {1e6 * seconds:10.2f} us"
+            f" compile {1e3 * compiled:8.2f} ms exit {status}"
+        )
+        bytecode = vm.translate(instructions)
+        seconds, status = timed(
+            lambda: vm.run(bytecode, io.StringIO()), 100
+        )
+        print(f"{name:>12} vm     {1e6 * seconds:10.2f} us")
+        if host:
+            with tempfile.TemporaryDirectory() as directory:
+                seconds, status = timed(
+                    native(lines, directory), 20
+                )
+            print(f"{name:>12} native {1e6 * seconds:10.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Lexer throughput in tokens/sec and MB/sec
+
+    PYTHONPATH=src python benchmarks/bench_lexer.py
+
+The reference lexer re-slices the remaining source for every keyword
+check, so it is only timed on the smaller inputs.
+"""
+
+import time
+from compiler.lexer import lex, Token, TokenKind, SYMBOLS
+from programs import program
+
+SIZES = [2**14, 2**16, 2**18, 2**20, 2**22]
+REFERENCE_LIMIT = 2**18
+
+
+def reference_lex(content):
+    # Lexer prior to the single-pass rewrite
+    keywords = {
+        "exit": TokenKind.EXIT,
+        "let": TokenKind.LET,
+        "fn": TokenKind.FUNCTION,
+        "print": TokenKind.PRINT,
+        "return": TokenKind.RETURN,
+    }
+    cursor = 0
+    while cursor < len(content):
+        if content[cursor] == "#":
+            begin = cursor
+            while cursor < len(content):
+                if content[cursor] == "\n":
+                    break
+                cursor += 1
+            yield Token(
+                TokenKind.COMMENT, content[begin : cursor + 1]
+            )
+            cursor += 1
+            continue
+        if content[cursor].isdigit():
+            begin = cursor
+            while cursor < len(content):
+                if not content[cursor].isdigit():
+                    break
+                cursor += 1
+            yield Token.int(content[begin:cursor])
+            continue
+        for key, kind in keywords.items():
+            if content[cursor:].startswith(key):
+                yield Token(kind, key)
+                cursor += len(key)
+                break
+        else:
+            if content[cursor].isalpha():
+                begin = cursor
+                while cursor < len(content):
+                    if not content[cursor].isalnum():
+                        break
+                    cursor += 1
+                yield Token.identifier(content[begin:cursor])
+            elif content[cursor] in SYMBOLS:
+                yield Token(
+                    SYMBOLS[content[cursor]], content[cursor]
+                )
+                cursor += 1
+            else:
+                cursor += 1
+
+
+def measure(fn, content):
+    start = time.perf_counter()
+    count = sum(1 for _ in fn(content))
+    return count, time.perf_counter() - start
+
+
+def report(name, content, count, seconds):
+    megabytes = len(content) / 2**20
+    print(
+        f"{name:>9} {megabytes:8.2f} MB {count:9d} tokens"
+        f" {count / seconds:12.0f} tokens/s"
+        f" {megabytes / seconds:8.2f} MB/s"
+    )
+
+
+def main():
+    for size in SIZES:
+        content = program(size)
+        count, seconds = measure(lex, content)
+        report("lex", content, count, seconds)
+        if size <= REFERENCE_LIMIT:
+            count, seconds = measure(reference_lex, content)
+            report("reference", content, count, seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Values removed by local value numbering
+
+    PYTHONPATH=src python benchmarks/bench_lvn.py
+
+Each repeat is a function computing a * b + k twice, in both
+operand orders, so half its arithmetic and loads are redundant.
+The rate should stay flat as size grows, the pass being linear.
+"""
+
+import gc
+import time
+from compiler import lvn, ssa
+from compiler.pseudo import AST, Add, Fn, Id, Let, Mul, Return
+
+SIZES = [10**3, 10**4, 10**5]
+
+
+def program(size):
+    statements = []
+    for i in range(size):
+        statements.append(
+            Fn(
+                Id(f"f{i}"),
+                [Id("a"), Id("b")],
+                [
+                    Let(
+                        Id("x"),
+                        Add(Mul(Id("a"), Id("b")), Id("k")),
+                    ),
+                    Let(
+                        Id("y"),
+                        Add(Id("k"), Mul(Id("b"), Id("a"))),
+                    ),
+                    Return(Add(Id("x"), Id("y"))),
+                ],
+            )
+        )
+    return AST(statements)
+
+
+def count(module):
+    return sum(
+        len(block.instructions)
+        for function in module.functions
+        for block in function.blocks
+    )
+
+
+def main():
+    for size in SIZES:
+        module = ssa.build(program(size))
+        before = count(module)
+        # Collection is off while timing, as in timeit
+        gc.disable()
+        start = time.perf_counter()
+        lvn.number(module)
+        seconds = time.perf_counter() - start
+        gc.enable()
+        after = count(module)
+        print(
+            f"{size:8d} repeats {before:8d} -> {after:8d}"
+            f" instructions {seconds:7.3f} s"
+            f" {before / seconds:10.0f} instructions/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
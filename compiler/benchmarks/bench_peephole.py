@@ -0,0 +1,83 @@
+"""
+Lines saved by the peephole optimiser, per rule
+
+    PYTHONPATH=src python benchmarks/bench_peephole.py
+
+Each corpus entry is the assembly of a backend before peephole
+optimisation. The line counts before and after are reported with
+the hits of each rule and the time the pass takes.
+"""
+
+import time
+from collections import Counter
+from compiler import code_gen, dce, fold, ir, peephole, ssa
+from compiler.arch import Arch
+from compiler.parser import parse
+from bench_registers import SHAPES
+from compiler.pseudo import AST, Fn, Id, Return
+
+SIZE = 10**3
+
+
+def sums(size):
+    """Exits of constant sums, lowered by code_gen_statements"""
+    return "".join(
+        f"{{ exit({' + '.join(map(str, range(i % 50 + 2)))}); }}\n"
+        for i in range(size)
+    )
+
+
+def corpus():
+    statements = parse(sums(SIZE)).statements
+    yield "sums", Arch.aarch64, code_gen.code_gen_statements(
+        statements
+    )
+    source = "let k = 6;\n" + "".join(
+        f"fn f{i}(x) {{ return x; }}\nf{i}(k);\n"
+        for i in range(SIZE)
+    )
+    instructions = dce.eliminate(
+        fold.fold(ir.visit(parse(source)))
+    )
+    yield "functions", Arch.x86_64, list(
+        code_gen.gas_lines(instructions)
+    )
+    yield "functions", Arch.aarch64, list(
+        code_gen.aarch64_lines(instructions)
+    )
+    module = ssa.build(
+        AST(
+            [
+                Fn(
+                    Id("f"),
+                    [Id("a")],
+                    [Return(SHAPES["balanced"])],
+                )
+            ]
+        )
+    )
+    for arch, lines in [
+        (Arch.x86_64, code_gen.gas_ssa_lines),
+        (Arch.aarch64, code_gen.aarch64_ssa_lines),
+    ]:
+        yield "ssa", arch, list(lines(module))
+
+
+def main():
+    for name, arch, lines in corpus():
+        hits = Counter()
+        start = time.perf_counter()
+        optimised = list(peephole.optimise(lines, arch, hits))
+        seconds = time.perf_counter() - start
+        rules = " ".join(
+            f"{rule}={count}"
+            for rule, count in sorted(hits.items())
+        )
+        print(
+            f"{name:>10} {arch.value:>8} {len(lines):7d} ->"
+            f" {len(optimised):7d} lines {seconds:7.3f} s  {rules}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Peak virtual registers of pseudo code for generated expressions
+
+    PYTHONPATH=src python benchmarks/bench_registers.py
+
+Each shape is lowered by pseudo.Visitor as a return value. The peak
+is the number of registers, one more than the highest index used.
+Spills are those values the x86_64 register file leaves on the
+stack after SSA construction and regalloc.
+"""
+
+import random
+from compiler import pseudo, regalloc, ssa
+from compiler.arch import Arch
+from compiler.pseudo import AST, Add, Fn, Id, Int, Mul, Return
+
+DEPTH = 400
+
+
+def left(size):
+    node = Int(0)
+    for i in range(1, size):
+        node = Add(node, Int(i))
+    return node
+
+
+def right(size):
+    node = Int(0)
+    for i in range(1, size):
+        node = Add(Int(i), node)
+    return node
+
+
+def balanced(depth):
+    if depth == 0:
+        return Id("a")
+    return Mul(balanced(depth - 1), balanced(depth - 1))
+
+
+def shuffled(size, seed=0):
+    generator = random.Random(seed)
+    nodes = [Int(i) for i in range(size)]
+    while len(nodes) > 1:
+        i = generator.randrange(len(nodes) - 1)
+        operator = generator.choice((Add, Mul))
+        nodes[i : i + 2] = [operator(nodes[i], nodes[i + 1])]
+    return nodes[0]
+
+
+SHAPES = {
+    "left": left(DEPTH),
+    "right": right(DEPTH),
+    "balanced": balanced(9),
+    "random": shuffled(2 * DEPTH),
+}
+
+
+def peak(instructions):
+    return 1 + max(
+        operand.i
+        for instruction in instructions
+        for operand in instruction[1:]
+        if type(operand) is pseudo.register
+    )
+
+
+def main():
+    registers = regalloc.REGISTER_FILES[Arch.x86_64]
+    for name, expression in SHAPES.items():
+        instructions = pseudo.Visitor().visit_value(
+            expression, 0
+        )[0]
+        function = ssa.build(
+            AST([Fn(Id("f"), [Id("a")], [Return(expression)])])
+        ).functions[0]
+        allocation = regalloc.allocate(function, registers)
+        print(
+            f"{name:>8} {len(instructions):6d} instructions"
+            f" {peak(instructions):5d} registers"
+            f" {len(allocation.slots):5d} spills"
+        )
+
+
+if __name__ == "__main__":
+    main()
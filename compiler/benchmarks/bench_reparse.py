@@ -0,0 +1,43 @@
+"""
+Reparse latency after a one-line edit
+
+    PYTHONPATH=src python benchmarks/bench_reparse.py
+
+Edits a line in the middle of generated programs and compares a
+full parse of the edited source with reparse.
+"""
+
+import time
+from compiler.parser import parse, reparse, Edit
+from programs import chunk
+
+LINES = [10**3, 10**4, 10**5]
+
+
+def main():
+    for lines in LINES:
+        # Each chunk is 9 lines long
+        content = "".join(chunk(i) for i in range(lines // 9))
+        program = parse(content)
+        middle = content.index("let g", len(content) // 2)
+        edit = Edit(middle + 4, 1, "h")
+
+        start = time.perf_counter()
+        reparsed = reparse(program, edit)
+        incremental = time.perf_counter() - start
+
+        edited = (
+            content[: middle + 4] + "h" + content[middle + 5 :]
+        )
+        start = time.perf_counter()
+        parse(edited)
+        full = time.perf_counter() - start
+
+        print(
+            f"{lines:7d} lines parse {full * 1000:9.2f} ms"
+            f" reparse {incremental * 1000:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
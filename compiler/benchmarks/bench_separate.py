@@ -0,0 +1,72 @@
+"""
+Incremental builds with an object per function
+
+    PYTHONPATH=src python benchmarks/bench_separate.py
+
+A generated program is built by separate.build with an empty object
+cache, then rebuilt after editing one function, which reassembles
+only that function's object. Objects are assembled with the host
+as on x86_64, otherwise the assembly is copied in its place, and
+are not linked.
+"""
+
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from compiler import cache, separate
+from compiler.arch import Arch
+from compiler.parser import parse
+from programs import lowered_chunk
+
+SIZES = [10, 100, 1000]
+
+
+def assembler():
+    if platform.machine() == "x86_64" and shutil.which("as"):
+        return lambda source, output: subprocess.check_call(
+            ["as", source, "-o", output]
+        )
+    print("no as for the host, copying assembly instead")
+    return shutil.copy
+
+
+def build(source, store, directory, assemble):
+    start = time.perf_counter()
+    _, rebuilt = separate.build(
+        parse(source), Arch.x86_64, store, directory, assemble
+    )
+    return time.perf_counter() - start, rebuilt
+
+
+def main():
+    assemble = assembler()
+    for size in SIZES:
+        source = (
+            "".join(lowered_chunk(i) for i in range(size))
+            + "exit(0);\n"
+        )
+        # The middle function returns its second parameter
+        middle = size // 2
+        edited = source.replace(
+            f"fn f{middle}(a, b) {{\n    return a;",
+            f"fn f{middle}(a, b) {{\n    return b;",
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            store = cache.Cache(os.path.join(directory, "cache"))
+            units = os.path.join(directory, "units")
+            cold, _ = build(source, store, units, assemble)
+            warm, _ = build(source, store, units, assemble)
+            edit, rebuilt = build(edited, store, units, assemble)
+        print(
+            f"{size:>5} functions cold {1e3 * cold:9.2f} ms"
+            f" unchanged {1e3 * warm:8.2f} ms"
+            f" edited {1e3 * edit:8.2f} ms"
+            f" ({rebuilt} rebuilt)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+SSA construction rate on generated pseudo programs
+
+    PYTHONPATH=src python benchmarks/bench_ssa.py
+
+Each repeat is a two parameter function, a let calling it and a
+let using the result, so construction should stay linear in size.
+"""
+
+import gc
+import time
+from compiler import ssa
+from compiler.pseudo import (
+    AST,
+    Add,
+    Call,
+    Fn,
+    Id,
+    Int,
+    Let,
+    Mul,
+    Return,
+)
+
+SIZES = [10**3, 10**4, 10**5]
+
+
+def program(size):
+    statements = []
+    for i in range(size):
+        statements += [
+            Fn(
+                Id(f"f{i}"),
+                [Id("a"), Id("b")],
+                [Return(Add(Mul(Id("a"), Id("b")), Int(i)))],
+            ),
+            Let(
+                Id(f"x{i}"), Call(Id(f"f{i}"), [Int(i), Int(2)])
+            ),
+            Let(Id(f"y{i}"), Add(Id(f"x{i}"), Int(1))),
+        ]
+    return AST(statements)
+
+
+def main():
+    for size in SIZES:
+        ast = program(size)
+        # Collection is off while timing, as in timeit
+        gc.disable()
+        start = time.perf_counter()
+        module = ssa.build(ast)
+        seconds = time.perf_counter() - start
+        gc.enable()
+        count = sum(
+            len(function.definitions)
+            for function in module.functions
+        )
+        print(
+            f"{size:8d} repeats {count:8d} values {seconds:7.3f} s"
+            f" {count / seconds:10.0f} values/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Statement parse rate on generated programs
+
+    PYTHONPATH=src python benchmarks/bench_statements.py
+
+Sources are tokenized before timing, so only the parser is measured.
+"""
+
+import time
+from compiler.lexer import tokenize
+from compiler.parser import (
+    parse_statements,
+    NodeFunction,
+    NodeBlock,
+)
+from programs import chunk
+
+SIZES = [10**3, 10**4, 5 * 10**4]
+
+
+def count(statements):
+    total = 0
+    pending = list(statements)
+    while pending:
+        statement = pending.pop()
+        total += 1
+        if isinstance(statement, NodeFunction):
+            pending += statement.body.statements
+        elif isinstance(statement, NodeBlock):
+            pending += statement.statements
+    return total
+
+
+def main():
+    for size in SIZES:
+        content = "".join(chunk(i) for i in range(size))
+        tokens = tokenize(content)
+        start = time.perf_counter()
+        program = list(parse_statements(tokens))
+        seconds = time.perf_counter() - start
+        statements = count(program)
+        print(
+            f"{statements:8d} statements {seconds:7.3f} s"
+            f" {statements / seconds:10.0f} statements/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Peak memory of the whole-file and streaming front ends
+
+    PYTHONPATH=src python benchmarks/bench_stream.py [megabytes]
+
+Writes a generated program to a temporary file and compiles it to
+x86_64 assembly lines without assembling, discarding the output.
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from compiler.arch import Arch
+from compiler.parser import parse
+from compiler.main import backend, stream_lines
+from compiler import ir
+from programs import lowered_chunk
+
+
+def write_program(path, size):
+    with open(path, "w") as stream:
+        written = 0
+        i = 0
+        while written < size:
+            written += stream.write(lowered_chunk(i))
+            i += 1
+        stream.write("exit(0);\n")
+
+
+def whole_file(path):
+    with open(path) as stream:
+        content = stream.read()
+    yield from backend(Arch.x86_64)(ir.visit(parse(content)))
+
+
+def streaming(path):
+    yield from stream_lines(path, Arch.x86_64)
+
+
+def measure(fn, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in fn(path):
+        pass
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, seconds
+
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "program.lp")
+        write_program(path, megabytes * 2**20)
+        for fn in (whole_file, streaming):
+            peak, seconds = measure(fn, path)
+            print(
+                f"{fn.__name__:>10} {megabytes} MB source"
+                f" peak {peak / 2**20:8.2f} MB {seconds:7.2f} s"
+            )
+
+
+if __name__ == "__main__":
+    main()
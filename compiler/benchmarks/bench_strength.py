@@ -0,0 +1,125 @@
+"""
+Run time of arithmetic by constants, with and without strength
+reduction
+
+    PYTHONPATH=src python benchmarks/bench_strength.py
+
+An arithmetic heavy function is compiled by the x86_64 SSA backend
+after lvn.number, then with strength.reduce as well, and called in
+a loop by a driver. Needs as and ld for an x86_64 host.
+"""
+
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from compiler import code_gen, lvn, peephole, ssa, strength
+from compiler.arch import Arch
+from compiler.pseudo import (
+    AST,
+    Add,
+    Div,
+    Fn,
+    Id,
+    Int,
+    Let,
+    Mul,
+    Pow,
+    Return,
+)
+
+CALLS = 10**6
+
+# Calls f with 1 to CALLS, exiting with the low byte of the sum
+DRIVER = f"""
+_start:
+\tmov\t${CALLS}, %rbx
+\txor\t%r12, %r12
+1:
+\tmov\t%rbx, %rdi
+\tcall\tf
+\tadd\t%rax, %r12
+\tdec\t%rbx
+\tjnz\t1b
+\tmovzx\t%r12b, %rdi
+\tmov\t$60, %rax
+\tsyscall
+"""
+
+
+def program(size=20):
+    """f(x) as a chain of lets multiplying, dividing and raising
+    by constants"""
+    body = [Let(Id("v0"), Id("x"))]
+    for i in range(1, size):
+        v = Id(f"v{i - 1}")
+        body.append(
+            Let(
+                Id(f"v{i}"),
+                Add(
+                    Add(
+                        Mul(v, Int(10 + i)),
+                        Div(v, Int(7 + 2 * i)),
+                    ),
+                    Add(Div(Pow(v, Int(5)), Int(1000)), Int(i)),
+                ),
+            )
+        )
+    body.append(Return(Id(f"v{size - 1}")))
+    return AST([Fn(Id("f"), [Id("x")], body)])
+
+
+def build(reduce, directory):
+    module = lvn.number(ssa.build(program()))
+    if reduce:
+        module = strength.reduce(module)
+    module.functions = [
+        function
+        for function in module.functions
+        if function.name != "_start"
+    ]
+    lines = peephole.optimise(
+        code_gen.gas_ssa_lines(module), Arch.x86_64
+    )
+    name = os.path.join(
+        directory, "reduced" if reduce else "plain"
+    )
+    with open(f"{name}.s", "w") as stream:
+        stream.write(code_gen.render(lines) + DRIVER)
+    subprocess.check_call(["as", f"{name}.s", "-o", f"{name}.o"])
+    subprocess.check_call(["ld", f"{name}.o", "-o", name])
+    return name
+
+
+def main():
+    if platform.machine() != "x86_64" or not (
+        shutil.which("as") and shutil.which("ld")
+    ):
+        print("skipped, needs as and ld on x86_64")
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        results = {}
+        for reduce in (False, True):
+            executable = build(reduce, directory)
+            best = None
+            for _ in range(5):
+                start = time.perf_counter()
+                status = subprocess.run([executable]).returncode
+                seconds = time.perf_counter() - start
+                best = (
+                    seconds
+                    if best is None
+                    else min(best, seconds)
+                )
+            results[reduce] = best
+            print(
+                f"{'reduced' if reduce else 'plain':>8}"
+                f" {best:7.3f} s exit {status}"
+            )
+        print(f" speedup {results[False] / results[True]:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
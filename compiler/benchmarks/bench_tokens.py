@@ -0,0 +1,50 @@
+"""
+Token stream memory and parse time
+
+    PYTHONPATH=src python benchmarks/bench_tokens.py
+
+Compares a list of Token objects from lex with the Tokens buffer from
+tokenize, then times parse on the same inputs.
+"""
+
+import time
+import tracemalloc
+from compiler.lexer import lex, tokenize
+from compiler.parser import parse
+from programs import program
+
+SIZES = [2**16, 2**18, 2**20]
+
+
+def allocated(fn, content):
+    tracemalloc.start()
+    result = fn(content)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def main():
+    for size in SIZES:
+        content = program(size)
+        tokens, listed = allocated(
+            lambda text: list(lex(text)), content
+        )
+        count = len(tokens)
+        del tokens
+        _, packed = allocated(tokenize, content)
+
+        start = time.perf_counter()
+        parse(content)
+        seconds = time.perf_counter() - start
+
+        print(
+            f"{len(content) / 2**20:6.2f} MB {count:8d} tokens"
+            f" list {listed / count:6.1f} B/token"
+            f" buffer {packed / count:5.1f} B/token"
+            f" parse {seconds:6.3f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Running programs on the bytecode VM against the native path
+
+    PYTHONPATH=src python benchmarks/bench_vm.py
+
+Both paths start from the same optimised IR. The VM path translates
+and runs it in process. The native path emits x86_64 with gas_lines,
+assembles and links it with the host as and ld, as main does with
+the cross toolchain, then runs the executable. Native times are
+only taken on an x86_64 host with as and ld.
+"""
+
+import io
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from compiler import code_gen, dce, fold, ir, peephole, vm
+from compiler.arch import Arch
+from compiler.parser import parse
+
+
+def example():
+    return (
+        "let a = 100;\nlet b = 42;\nlet c = a + b;\nexit(c);\n"
+    )
+
+
+def calls(size):
+    """Calls to a one parameter function"""
+    return (
+        "fn f(x) { return x; }\n"
+        + "".join(f"f({i});\n" for i in range(size))
+        + "exit(7);\n"
+    )
+
+
+PROGRAMS = [
+    ("example", example()),
+    ("calls 100", calls(100)),
+    ("calls 10000", calls(10**4)),
+]
+
+
+def native(instructions, directory):
+    """Seconds to assemble, link and run, and to run, and status"""
+    start = time.perf_counter()
+    name = os.path.join(directory, "program")
+    lines = peephole.optimise(
+        code_gen.gas_lines(instructions), Arch.x86_64
+    )
+    with open(f"{name}.s", "w") as stream:
+        stream.write(code_gen.render(lines))
+    subprocess.check_call(["as", f"{name}.s", "-o", f"{name}.o"])
+    subprocess.check_call(["ld", f"{name}.o", "-o", name])
+    ran = time.perf_counter()
+    status = subprocess.run([name]).returncode
+    end = time.perf_counter()
+    return end - start, end - ran, status
+
+
+def main():
+    host = platform.machine() == "x86_64" and all(
+        map(shutil.which, ("as", "ld"))
+    )
+    for name, source in PROGRAMS:
+        instructions = dce.eliminate(
+            fold.fold(ir.visit(parse(source)))
+        )
+        start = time.perf_counter()
+        program = vm.translate(instructions)
+        ran = time.perf_counter()
+        status = vm.run(program, io.StringIO())
+        end = time.perf_counter()
+        print(
+            f"{name:>12} vm     {1e3 * (end - start):8.2f} ms"
+            f" run {1e3 * (end - ran):8.2f} ms exit {status}"
+        )
+        if host:
+            with tempfile.TemporaryDirectory() as directory:
+                total, running, status = native(
+                    instructions, directory
+                )
+            print(
+                f"{name:>12} native {1e3 * total:8.2f} ms"
+                f" run {1e3 * running:8.2f} ms exit {status}"
+            )
+
+
+if __name__ == "__main__":
+    main()
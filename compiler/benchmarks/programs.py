@@ -0,0 +1,42 @@
+"""
+Generated Vinyl programs for benchmarks
+"""
+
+
+def chunk(i: int) -> str:
+    return (
+        f"# Chunk {i}\n"
+        f"fn f{i}(a, b) {{\n"
+        f"    let x{i} = a + b;\n"
+        f"    print({i});\n"
+        f"    return x{i};\n"
+        f"}}\n"
+        f"let g{i} = {i} + 1;\n"
+        f"print({i});\n"
+        f"f{i}(1, 2);\n"
+    )
+
+
+def program(size: int) -> str:
+    """Vinyl source of at least size characters"""
+    chunks = []
+    length = 0
+    i = 0
+    while length < size:
+        text = chunk(i)
+        chunks.append(text)
+        length += len(text)
+        i += 1
+    return "".join(chunks) + "exit(0);\n"
+
+
+def lowered_chunk(i: int) -> str:
+    """Chunk using only statements the ir module can lower"""
+    return (
+        f"# Chunk {i}\n"
+        f"fn f{i}(a, b) {{\n"
+        f"    return a;\n"
+        f"}}\n"
+        f"let g{i} = {i} + 1;\n"
+        f"f{i}(1, 2);\n"
+    )
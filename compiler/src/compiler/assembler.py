@@ -0,0 +1,1242 @@
+"""
+Assembler for the x86_64 and aarch64 code the backends emit
+
+Lines are encoded into sections of bytes, with the symbols they
+define and fixups where they refer to symbols. Only the
+instructions and directives the backends use are known, see
+X86_64_ENCODERS, AARCH64_ENCODERS and DIRECTIVES.
+
+x86_64 lines are AT&T syntax. References to symbols are PC
+relative, an absolute memory operand is taken as relative to rip,
+so the code runs wherever it is placed. aarch64 references are PC
+relative too, adrp with a :lo12: offset for data, and ldr of an
+=constant is a mov and movk sequence rather than a literal pool
+load.
+"""
+
+import re
+from collections import namedtuple
+from dataclasses import dataclass, field
+from compiler.arch import Arch
+
+# A field at offset in section referring to the address of symbol
+# plus addend, encoded as kind says, see RELOCATIONS
+Fixup = namedtuple(
+    "Fixup",
+    "section offset symbol addend kind",
+    defaults=("pc32",),
+)
+
+Register = namedtuple("Register", "number")
+Immediate = namedtuple("Immediate", "value")
+# base of None with a symbol is relative to rip
+Memory = namedtuple(
+    "Memory", "base index scale displacement symbol"
+)
+
+REGISTERS = {
+    name: number
+    for number, name in enumerate(
+        (
+            "rax",
+            "rcx",
+            "rdx",
+            "rbx",
+            "rsp",
+            "rbp",
+            "rsi",
+            "rdi",
+            *(f"r{i}" for i in range(8, 16)),
+        )
+    )
+}
+
+MEMORY = re.compile(
+    r"^(?P<displacement>[^(]*)"
+    r"(?:\(%(?P<base>\w+)?(?:,\s*%(?P<index>\w+)"
+    r"(?:,\s*(?P<scale>\d))?)?\))?$"
+)
+
+
+class AssemblerError(Exception):
+    pass
+
+
+@dataclass(slots=True)
+class Chunk:
+    """Code of one section or subsection as it is assembled"""
+
+    code: bytearray = field(default_factory=bytearray)
+    symbols: dict = field(default_factory=dict)
+    fixups: list = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class Object:
+    """Sections of bytes, the offsets of symbols in them by name
+    and the fixups left to apply once sections are placed"""
+
+    sections: dict = field(default_factory=dict)
+    symbols: dict = field(default_factory=dict)
+    fixups: list = field(default_factory=list)
+    globals: set = field(default_factory=set)
+
+
+def assemble(lines, arch: Arch = Arch.x86_64):
+    """Object of assembly lines for arch"""
+    assembler = Assembler(arch)
+    for line in lines:
+        # Emitters may return several lines in one string
+        for text in line.split("\n"):
+            assembler.line(text)
+    return assembler.finish()
+
+
+class Assembler:
+    def __init__(self, arch: Arch = Arch.x86_64):
+        self.comment, self.encoder = SYNTAX[arch]
+        self.chunks = {}
+        self.globals = set()
+        # Generated code repeats its lines, encodings are kept by
+        # mnemonic and operands
+        self.encoded = {}
+        self.switch("text", 0)
+
+    def switch(self, section, subsection):
+        key = (section, subsection)
+        if key not in self.chunks:
+            self.chunks[key] = Chunk()
+        self.chunk = self.chunks[key]
+        self.section = section
+
+    def line(self, text):
+        text = text.split(self.comment, 1)[0].strip()
+        while text:
+            name, colon, rest = text.partition(":")
+            if not colon or not is_symbol(name.strip()):
+                break
+            self.label(name.strip())
+            text = rest.strip()
+        if not text:
+            return
+        mnemonic, *operands = text.split(None, 1)
+        operands = operands[0] if operands else ""
+        if mnemonic.startswith("."):
+            directive = DIRECTIVES.get(mnemonic)
+            if directive is None:
+                raise AssemblerError(
+                    f"Unknown directive: {text}"
+                )
+            directive(self, operands)
+            return
+        encoded = self.encoded.get((mnemonic, operands))
+        if encoded is None:
+            encoded = self.encode(text, mnemonic, operands)
+            self.encoded[mnemonic, operands] = encoded
+        code, fixups = encoded
+        start = len(self.chunk.code)
+        self.chunk.code += code
+        for offset, symbol, addend, kind in fixups:
+            self.chunk.fixups.append(
+                (start + offset, symbol, addend, kind)
+            )
+
+    def encode(self, text, mnemonic, operands):
+        encode = self.encoder(mnemonic)
+        if encode is None:
+            raise AssemblerError(f"Unknown instruction: {text}")
+        try:
+            return encode(*split(operands))
+        except (
+            AttributeError,
+            KeyError,
+            TypeError,
+            ValueError,
+        ) as error:
+            raise AssemblerError(
+                f"Can not encode: {text}"
+            ) from error
+
+    def label(self, name):
+        if any(name in c.symbols for c in self.chunks.values()):
+            raise AssemblerError(f"Symbol defined twice: {name}")
+        self.chunk.symbols[name] = len(self.chunk.code)
+
+    def emit(self, data):
+        self.chunk.code += data
+
+    def finish(self):
+        """Object with subsections placed after their section"""
+        result = Object(globals=self.globals)
+        for (section, _), chunk in sorted(self.chunks.items()):
+            code = result.sections.setdefault(
+                section, bytearray()
+            )
+            base = len(code)
+            code += chunk.code
+            for name, offset in chunk.symbols.items():
+                result.symbols[name] = (section, base + offset)
+            for offset, symbol, addend, kind in chunk.fixups:
+                result.fixups.append(
+                    Fixup(
+                        section,
+                        base + offset,
+                        symbol,
+                        addend,
+                        kind,
+                    )
+                )
+        return result
+
+
+def link(program, addresses):
+    """Sections of an Object with fixups applied, placed at the
+    addresses of addresses by section name"""
+    sections = {
+        name: bytearray(code)
+        for name, code in program.sections.items()
+    }
+    for fixup in program.fixups:
+        if fixup.symbol not in program.symbols:
+            raise AssemblerError(
+                f"Unknown symbol: {fixup.symbol}"
+            )
+        section, offset = program.symbols[fixup.symbol]
+        target = addresses[section] + offset + fixup.addend
+        place = addresses[fixup.section] + fixup.offset
+        try:
+            RELOCATIONS[fixup.kind](
+                sections[fixup.section],
+                fixup.offset,
+                target,
+                place,
+            )
+        except ValueError as error:
+            raise AssemblerError(
+                f"Out of range: {fixup.symbol}"
+            ) from error
+    return sections
+
+
+def relocate_pc32(code, offset, target, place):
+    value = target - place
+    if not fits(value, 32):
+        raise ValueError(value)
+    code[offset : offset + 4] = value.to_bytes(
+        4, "little", signed=True
+    )
+
+
+def relocation(encode):
+    """Relocation patching the aarch64 instruction at offset with
+    encode(target, place), the bits to set in it"""
+
+    def relocate(code, offset, target, place):
+        word = int.from_bytes(
+            code[offset : offset + 4], "little"
+        )
+        word |= encode(target, place)
+        code[offset : offset + 4] = word.to_bytes(4, "little")
+
+    return relocate
+
+
+def displacement(bits, shift):
+    # A word offset to the target in bits bits, at bit shift
+    def encode(target, place):
+        value = target - place
+        if value % 4 or not fits(value >> 2, bits):
+            raise ValueError(value)
+        return ((value >> 2) & (2**bits - 1)) << shift
+
+    return encode
+
+
+def page(target, place):
+    # Offset of the target's 4 KiB page from that of the adrp
+    pages = (target >> 12) - (place >> 12)
+    if not fits(pages, 21):
+        raise ValueError(pages)
+    return (pages & 3) << 29 | (pages >> 2 & 0x7FFFF) << 5
+
+
+def low(scale):
+    # Low 12 bits of the target, scaled for a load or store
+    def encode(target, place):
+        value = target & 0xFFF
+        if value % scale:
+            raise ValueError(target)
+        return (value // scale) << 10
+
+    return encode
+
+
+RELOCATIONS = {
+    "pc32": relocate_pc32,
+    "branch26": relocation(displacement(26, 0)),
+    "branch19": relocation(displacement(19, 5)),
+    "branch14": relocation(displacement(14, 5)),
+    "page21": relocation(page),
+    "lo12": relocation(low(1)),
+    "lo12_64": relocation(low(8)),
+}
+
+
+def is_symbol(text):
+    return bool(text) and re.fullmatch(
+        r"[A-Za-z_.$][\w.$]*", text
+    )
+
+
+def split(operands):
+    # Commas inside parentheses or brackets separate address parts
+    parts = []
+    depth = 0
+    start = 0
+    for i, character in enumerate(operands):
+        if character in "([":
+            depth += 1
+        elif character in ")]":
+            depth -= 1
+        elif character == "," and depth == 0:
+            parts.append(operands[start:i].strip())
+            start = i + 1
+    last = operands[start:].strip()
+    if last:
+        parts.append(last)
+    return parts
+
+
+def parse(operand):
+    if operand.startswith("%"):
+        return Register(REGISTERS[operand[1:]])
+    if operand.startswith("$"):
+        return Immediate(int(operand[1:], 0))
+    match = MEMORY.match(operand)
+    if match is None:
+        raise ValueError(operand)
+    displacement = match["displacement"].strip()
+    symbol = None
+    if is_symbol(displacement):
+        symbol, displacement = displacement, 0
+    else:
+        displacement = int(displacement or "0", 0)
+    base = match["base"]
+    if base == "rip" or (base is None and symbol is not None):
+        base = None
+    elif base is not None:
+        base = REGISTERS[base]
+    elif match["index"] is None:
+        raise ValueError(operand)
+    index = match["index"]
+    if index is not None:
+        index = REGISTERS[index]
+    return Memory(
+        base,
+        index,
+        int(match["scale"] or 1),
+        displacement,
+        symbol,
+    )
+
+
+# Directives
+
+
+def directive_section(assembler, operands):
+    name, _, subsection = operands.partition(" ")
+    assembler.switch(name.strip(". ,"), int(subsection or 0))
+
+
+def directive_text(assembler, operands):
+    assembler.switch("text", int(operands or 0))
+
+
+def directive_data(assembler, operands):
+    assembler.switch("data", int(operands or 0))
+
+
+def directive_global(assembler, operands):
+    assembler.globals.add(operands)
+
+
+def integers(size):
+    def directive(assembler, operands):
+        for value in split(operands):
+            value = int(value, 0) % 2 ** (8 * size)
+            assembler.emit(value.to_bytes(size, "little"))
+
+    return directive
+
+
+def directive_ascii(assembler, operands):
+    text = operands.strip()[1:-1]
+    assembler.emit(
+        text.encode("latin-1")
+        .decode("unicode_escape")
+        .encode("latin-1")
+    )
+
+
+def directive_balign(assembler, operands):
+    alignment = int(operands, 0)
+    assembler.emit(bytes(-len(assembler.chunk.code) % alignment))
+
+
+DIRECTIVES = {
+    ".section": directive_section,
+    ".text": directive_text,
+    ".data": directive_data,
+    ".global": directive_global,
+    ".globl": directive_global,
+    ".byte": integers(1),
+    ".int": integers(4),
+    ".long": integers(4),
+    ".quad": integers(8),
+    ".ascii": directive_ascii,
+    ".balign": directive_balign,
+}
+
+
+# x86_64 encoding. Encoders return the bytes of an instruction and
+# its fixups as (offset, symbol, addend) triples.
+
+
+def fits(value, bits):
+    return -(2 ** (bits - 1)) <= value < 2 ** (bits - 1)
+
+
+def immediate(value, size):
+    if not fits(value, 8 * size):
+        raise ValueError(value)
+    return value.to_bytes(size, "little", signed=True)
+
+
+def modrm(opcode, reg, rm, suffix=b"", wide=True):
+    """Instruction with a ModRM byte, REX prefixed
+
+    opcode is the opcode bytes, reg the register or opcode
+    extension of the reg field, rm a Register or Memory operand
+    and suffix the bytes after the address, an immediate.
+    """
+    rex = 0x40 | wide << 3 | (reg >> 3) << 2
+    fixups = []
+    if type(rm) is Register:
+        rex |= rm.number >> 3
+        address = bytes([0xC0 | (reg & 7) << 3 | rm.number & 7])
+    elif rm.base is None and rm.index is None:
+        # rip relative, the field is relative to the instruction's
+        # end
+        address = bytes([(reg & 7) << 3 | 5]) + bytes(4)
+        fixups.append(
+            (1, rm.symbol, rm.displacement - 4 - len(suffix))
+        )
+    else:
+        if rm.symbol is not None:
+            raise ValueError(rm)
+        base = rm.base
+        displacement = rm.displacement
+        if displacement == 0 and (base is None or base & 7 != 5):
+            mod, tail = 0, b""
+        elif fits(displacement, 8) and base is not None:
+            mod, tail = 1, immediate(displacement, 1)
+        else:
+            mod, tail = 2, immediate(displacement, 4)
+        if rm.index is None and base & 7 != 4:
+            rex |= base >> 3
+            address = bytes(
+                [mod << 6 | (reg & 7) << 3 | base & 7]
+            )
+        else:
+            index = 4 if rm.index is None else rm.index
+            if index == 4 and rm.index is not None:
+                raise ValueError(rm)
+            if base is None:
+                # No base register takes a 32 bit displacement
+                mod, base = 0, 5
+                tail = immediate(displacement, 4)
+            rex |= (index >> 3) << 1 | base >> 3
+            scale = {1: 0, 2: 1, 4: 2, 8: 3}[rm.scale]
+            address = bytes(
+                [
+                    mod << 6 | (reg & 7) << 3 | 4,
+                    scale << 6 | (index & 7) << 3 | base & 7,
+                ]
+            )
+        address += tail
+    prefix = bytes([rex]) if rex != 0x40 else b""
+    code = prefix + opcode
+    fixups = [
+        (len(code) + offset, symbol, addend)
+        for offset, symbol, addend in fixups
+    ]
+    return code + address + suffix, fixups
+
+
+def encode_mov(source, destination):
+    if type(source) is Immediate:
+        if type(destination) is Register and not fits(
+            source.value, 32
+        ):
+            return encode_movabs(source, destination)
+        return modrm(
+            b"\xc7", 0, destination, immediate(source.value, 4)
+        )
+    if type(source) is Register:
+        return modrm(b"\x89", source.number, destination)
+    return modrm(b"\x8b", destination.number, source)
+
+
+def encode_movabs(source, destination):
+    number = destination.number
+    value = source.value % 2**64
+    return (
+        bytes([0x48 | number >> 3, 0xB8 | number & 7])
+        + value.to_bytes(8, "little"),
+        [],
+    )
+
+
+def arithmetic(extension):
+    """Encoder of add, or, and, sub, xor or cmp, the ALU operation
+    with opcode extension extension"""
+
+    def encode(source, destination):
+        if type(source) is Immediate:
+            if fits(source.value, 8):
+                return modrm(
+                    b"\x83",
+                    extension,
+                    destination,
+                    immediate(source.value, 1),
+                )
+            return modrm(
+                b"\x81",
+                extension,
+                destination,
+                immediate(source.value, 4),
+            )
+        if type(source) is Register:
+            return modrm(
+                bytes([extension << 3 | 1]),
+                source.number,
+                destination,
+            )
+        return modrm(
+            bytes([extension << 3 | 3]),
+            destination.number,
+            source,
+        )
+
+    return encode
+
+
+def encode_imul(*operands):
+    if len(operands) == 1:
+        # rdx:rax = rax * operand
+        return modrm(b"\xf7", 5, operands[0])
+    if len(operands) == 2:
+        source, destination = operands
+        if type(source) is not Immediate:
+            return modrm(b"\x0f\xaf", destination.number, source)
+        operands = (source, destination, destination)
+    value, source, destination = operands
+    if fits(value.value, 8):
+        return modrm(
+            b"\x6b",
+            destination.number,
+            source,
+            immediate(value.value, 1),
+        )
+    return modrm(
+        b"\x69",
+        destination.number,
+        source,
+        immediate(value.value, 4),
+    )
+
+
+def unary(extension, opcode=b"\xf7"):
+    def encode(operand):
+        return modrm(opcode, extension, operand)
+
+    return encode
+
+
+def shift(extension):
+    def encode(*operands):
+        if len(operands) == 1:
+            return modrm(b"\xd1", extension, operands[0])
+        count, operand = operands
+        return modrm(
+            b"\xc1",
+            extension,
+            operand,
+            immediate(count.value, 1),
+        )
+
+    return encode
+
+
+def encode_lea(source, destination):
+    return modrm(b"\x8d", destination.number, source)
+
+
+def encode_test(source, destination):
+    if type(source) is Immediate:
+        return modrm(
+            b"\xf7", 0, destination, immediate(source.value, 4)
+        )
+    return modrm(b"\x85", source.number, destination)
+
+
+def encode_push(operand):
+    number = operand.number
+    prefix = b"\x41" if number >> 3 else b""
+    return prefix + bytes([0x50 | number & 7]), []
+
+
+def encode_pop(operand):
+    number = operand.number
+    prefix = b"\x41" if number >> 3 else b""
+    return prefix + bytes([0x58 | number & 7]), []
+
+
+def branch(opcode):
+    """Encoder of a call or jump to a label, always rel32 so sizes
+    are known before labels are"""
+
+    def encode(target):
+        if type(target) is not Memory or target.symbol is None:
+            raise ValueError(target)
+        return opcode + bytes(4), [
+            (len(opcode), target.symbol, -4)
+        ]
+
+    return encode
+
+
+def fixed(code):
+    def encode():
+        return code, []
+
+    return encode
+
+
+CONDITIONS = {
+    "jo": 0x0,
+    "jno": 0x1,
+    "jb": 0x2,
+    "jc": 0x2,
+    "jnae": 0x2,
+    "jae": 0x3,
+    "jnb": 0x3,
+    "jnc": 0x3,
+    "je": 0x4,
+    "jz": 0x4,
+    "jne": 0x5,
+    "jnz": 0x5,
+    "jbe": 0x6,
+    "ja": 0x7,
+    "js": 0x8,
+    "jns": 0x9,
+    "jl": 0xC,
+    "jge": 0xD,
+    "jle": 0xE,
+    "jg": 0xF,
+}
+
+X86_64_ENCODERS = {
+    "mov": encode_mov,
+    "movabs": encode_movabs,
+    "add": arithmetic(0),
+    "or": arithmetic(1),
+    "and": arithmetic(4),
+    "sub": arithmetic(5),
+    "xor": arithmetic(6),
+    "cmp": arithmetic(7),
+    "imul": encode_imul,
+    "idiv": unary(7),
+    "neg": unary(3),
+    "not": unary(2),
+    "inc": unary(0, b"\xff"),
+    "dec": unary(1, b"\xff"),
+    "shl": shift(4),
+    "shr": shift(5),
+    "sar": shift(7),
+    "lea": encode_lea,
+    "test": encode_test,
+    "push": encode_push,
+    "pop": encode_pop,
+    "call": branch(b"\xe8"),
+    "jmp": branch(b"\xe9"),
+    **{
+        mnemonic: branch(bytes([0x0F, 0x80 | condition]))
+        for mnemonic, condition in CONDITIONS.items()
+    },
+    "ret": fixed(b"\xc3"),
+    "leave": fixed(b"\xc9"),
+    "syscall": fixed(b"\x0f\x05"),
+    "cqo": fixed(b"\x48\x99"),
+    "nop": fixed(b"\x90"),
+}
+
+
+def x86_64_encoder(mnemonic):
+    """Encoder of the operand texts of mnemonic, None if unknown"""
+    encode = X86_64_ENCODERS.get(mnemonic)
+    if encode is None and mnemonic[-1:] == "q":
+        # Operands are all 64 bit, the suffix adds nothing
+        encode = X86_64_ENCODERS.get(mnemonic[:-1])
+    if encode is None:
+        return None
+
+    def encode_text(*operands):
+        code, fixups = encode(*map(parse, operands))
+        return code, [
+            (offset, symbol, addend, "pc32")
+            for offset, symbol, addend in fixups
+        ]
+
+    return encode_text
+
+
+# aarch64 encoding. Encoders take the operand texts and return the
+# bytes of one or more instruction words and their fixups as
+# (offset, symbol, addend, kind) tuples. Registers are all 64 bit.
+
+AARCH64_REGISTERS = {
+    **{f"x{i}": i for i in range(31)},
+    "fp": 29,
+    "lr": 30,
+}
+
+SHIFTS = {"lsl": 0, "lsr": 1, "asr": 2}
+
+AARCH64_CONDITIONS = {
+    name: number
+    for number, name in enumerate(
+        (
+            "eq",
+            "ne",
+            "hs",
+            "lo",
+            "mi",
+            "pl",
+            "vs",
+            "vc",
+            "hi",
+            "ls",
+            "ge",
+            "lt",
+            "gt",
+            "le",
+            "al",
+        )
+    )
+}
+
+ADDRESS = re.compile(
+    r"^\[\s*(?P<base>\w+)\s*"
+    r"(?:,\s*(?:#?(?P<offset>[-+]?\w+)|:lo12:(?P<symbol>[\w.$]+)))?"
+    r"\s*\](?P<writeback>!)?$"
+)
+
+
+def words(*values):
+    return b"".join(
+        value.to_bytes(4, "little") for value in values
+    )
+
+
+def register(text, stack=False):
+    """Number of a register, 31 is sp if stack else xzr"""
+    text = text.strip()
+    if text == ("sp" if stack else "xzr"):
+        return 31
+    return AARCH64_REGISTERS[text]
+
+
+def is_stack(text):
+    return text.strip() == "sp"
+
+
+def number(text):
+    # Immediates are written with or without a #
+    return int(text.strip().removeprefix("#"), 0)
+
+
+def address(text):
+    """Base register, offset, symbol and writeback of an address"""
+    match = ADDRESS.match(text.strip())
+    if match is None:
+        raise ValueError(text)
+    offset = match["offset"]
+    return (
+        register(match["base"], stack=True),
+        0 if offset is None else int(offset, 0),
+        match["symbol"],
+        match["writeback"] is not None,
+    )
+
+
+def unsigned(value, bits):
+    if not 0 <= value < 2**bits:
+        raise ValueError(value)
+    return value
+
+
+def signed(value, bits):
+    if not fits(value, bits):
+        raise ValueError(value)
+    return value & (2**bits - 1)
+
+
+def moves(destination, value):
+    """Words moving a constant into a register
+
+    movz, or movn for values with mostly set bits, then movk for
+    each other 16 bit part that differs from the first's fill.
+    """
+    value %= 2**64
+    parts = [value >> (16 * i) & 0xFFFF for i in range(4)]
+    inverted = parts.count(0xFFFF) > parts.count(0)
+    fill = 0xFFFF if inverted else 0
+    code = []
+    for i, part in enumerate(parts):
+        if part == fill:
+            continue
+        if not code:
+            first = part ^ fill
+            code.append(
+                (0x92800000 if inverted else 0xD2800000)
+                | i << 21
+                | first << 5
+                | destination
+            )
+        else:
+            code.append(
+                0xF2800000 | i << 21 | part << 5 | destination
+            )
+    if not code:
+        code.append(
+            (0x92800000 if inverted else 0xD2800000)
+            | destination
+        )
+    return code
+
+
+def aarch64_mov(destination, source):
+    if source.strip().startswith("#"):
+        code = moves(register(destination), number(source))
+        if len(code) > 1:
+            # Not one instruction, as gas would need
+            raise ValueError(source)
+        return words(*code), []
+    if is_stack(destination) or is_stack(source):
+        # add to or from sp
+        return (
+            words(
+                0x91000000
+                | register(source, stack=True) << 5
+                | register(destination, stack=True)
+            ),
+            [],
+        )
+    return (
+        words(
+            0xAA0003E0
+            | register(source) << 16
+            | register(destination)
+        ),
+        [],
+    )
+
+
+def aarch64_add_sub(operation):
+    """Encoder of add or sub, operation 0 or 1"""
+
+    def encode(destination, lhs, rhs, modifier=None):
+        rhs = rhs.strip()
+        if rhs.startswith(":lo12:"):
+            return words(
+                0x91000000
+                | operation << 30
+                | register(lhs, stack=True) << 5
+                | register(destination, stack=True)
+            ), [(0, rhs[len(":lo12:") :], 0, "lo12")]
+        if rhs.startswith("#"):
+            value, shifted = number(rhs), 0
+            if modifier is not None:
+                if modifier.split() != ["lsl", "#12"]:
+                    raise ValueError(modifier)
+                shifted = 1
+            elif value >= 4096 and value % 4096 == 0:
+                value, shifted = value >> 12, 1
+            return (
+                words(
+                    0x91000000
+                    | operation << 30
+                    | shifted << 22
+                    | unsigned(value, 12) << 10
+                    | register(lhs, stack=True) << 5
+                    | register(destination, stack=True)
+                ),
+                [],
+            )
+        if is_stack(destination) or is_stack(lhs):
+            # Extended register, uxtx
+            if modifier is not None:
+                raise ValueError(modifier)
+            return (
+                words(
+                    0x8B206000
+                    | operation << 30
+                    | register(rhs) << 16
+                    | register(lhs, stack=True) << 5
+                    | register(destination, stack=True)
+                ),
+                [],
+            )
+        kind, amount = "lsl", 0
+        if modifier is not None:
+            kind, amount = modifier.split()
+            amount = number(amount)
+        return (
+            words(
+                0x8B000000
+                | operation << 30
+                | SHIFTS[kind] << 22
+                | register(rhs) << 16
+                | unsigned(amount, 6) << 10
+                | register(lhs) << 5
+                | register(destination)
+            ),
+            [],
+        )
+
+    return encode
+
+
+def aarch64_cmp(lhs, rhs):
+    # subs xzr, lhs, rhs
+    if rhs.strip().startswith("#"):
+        return (
+            words(
+                0xF100001F
+                | unsigned(number(rhs), 12) << 10
+                | register(lhs, stack=True) << 5
+            ),
+            [],
+        )
+    return (
+        words(
+            0xEB00001F | register(rhs) << 16 | register(lhs) << 5
+        ),
+        [],
+    )
+
+
+def three(opcode):
+    """Encoder of a data processing instruction of three
+    registers, opcode with the fields clear"""
+
+    def encode(destination, lhs, rhs):
+        return (
+            words(
+                opcode
+                | register(rhs) << 16
+                | register(lhs) << 5
+                | register(destination)
+            ),
+            [],
+        )
+
+    return encode
+
+
+def four(opcode):
+    # madd and msub, the fourth register is the addend
+    def encode(destination, lhs, rhs, addend):
+        return (
+            words(
+                opcode
+                | register(rhs) << 16
+                | register(addend) << 10
+                | register(lhs) << 5
+                | register(destination)
+            ),
+            [],
+        )
+
+    return encode
+
+
+def aarch64_neg(destination, source):
+    return (
+        words(
+            0xCB0003E0
+            | register(source) << 16
+            | register(destination)
+        ),
+        [],
+    )
+
+
+def aarch64_shift(kind):
+    """Encoder of lsl, lsr or asr by an immediate, the bitfield
+    move aliases, or by a register"""
+
+    def encode(destination, source, amount):
+        destination, source = register(destination), register(
+            source
+        )
+        if not amount.strip().startswith("#"):
+            return (
+                words(
+                    0x9AC02000
+                    | register(amount) << 16
+                    | SHIFTS[kind] << 10
+                    | source << 5
+                    | destination
+                ),
+                [],
+            )
+        amount = unsigned(number(amount), 6)
+        if kind == "lsl":
+            opcode, rotate, top = (
+                0xD3400000,
+                -amount % 64,
+                63 - amount,
+            )
+        elif kind == "lsr":
+            opcode, rotate, top = 0xD3400000, amount, 63
+        else:
+            opcode, rotate, top = 0x93400000, amount, 63
+        return (
+            words(
+                opcode
+                | rotate << 16
+                | top << 10
+                | source << 5
+                | destination
+            ),
+            [],
+        )
+
+    return encode
+
+
+def aarch64_load_store(load):
+    """Encoder of ldr or str of a 64 bit register
+
+    Addresses are a base with an offset, scaled, unscaled or with
+    a :lo12: symbol, pre-indexed with ! or post-indexed with a
+    third operand. ldr of an =constant moves it.
+    """
+
+    def encode(target, operand, post=None):
+        if load and operand.strip().startswith("="):
+            return (
+                words(
+                    *moves(register(target), number(operand[1:]))
+                ),
+                [],
+            )
+        target = register(target)
+        base, offset, symbol, writeback = address(operand)
+        if symbol is not None:
+            return words(
+                (0xF9400000 if load else 0xF9000000)
+                | base << 5
+                | target
+            ), [(0, symbol, 0, "lo12_64")]
+        if post is not None or writeback:
+            if post is not None:
+                offset, index = number(post), 0b01
+            else:
+                index = 0b11
+            return (
+                words(
+                    (0xF8400000 if load else 0xF8000000)
+                    | signed(offset, 9) << 12
+                    | index << 10
+                    | base << 5
+                    | target
+                ),
+                [],
+            )
+        if offset % 8 == 0 and 0 <= offset < 8 * 4096:
+            return (
+                words(
+                    (0xF9400000 if load else 0xF9000000)
+                    | (offset // 8) << 10
+                    | base << 5
+                    | target
+                ),
+                [],
+            )
+        # ldur and stur
+        return (
+            words(
+                (0xF8400000 if load else 0xF8000000)
+                | signed(offset, 9) << 12
+                | base << 5
+                | target
+            ),
+            [],
+        )
+
+    return encode
+
+
+def aarch64_pair(load):
+    # ldp or stp of 64 bit registers, pre-indexed, post-indexed or
+    # at an offset
+    def encode(first, second, operand, post=None):
+        base, offset, symbol, writeback = address(operand)
+        if symbol is not None:
+            raise ValueError(operand)
+        if post is not None:
+            offset, mode = number(post), 0b001
+        elif writeback:
+            mode = 0b011
+        else:
+            mode = 0b010
+        if offset % 8:
+            raise ValueError(offset)
+        return (
+            words(
+                0xA8000000
+                | mode << 23
+                | load << 22
+                | signed(offset // 8, 7) << 15
+                | register(second) << 10
+                | base << 5
+                | register(first)
+            ),
+            [],
+        )
+
+    return encode
+
+
+def aarch64_branch(opcode):
+    # b or bl to a label
+    def encode(target):
+        return words(opcode), [
+            (0, symbol(target), 0, "branch26")
+        ]
+
+    return encode
+
+
+def aarch64_compare_branch(opcode):
+    # cbz or cbnz
+    def encode(operand, target):
+        return words(opcode | register(operand)), [
+            (0, symbol(target), 0, "branch19")
+        ]
+
+    return encode
+
+
+def aarch64_test_branch(opcode):
+    # tbz or tbnz on a bit of a register
+    def encode(operand, bit, target):
+        bit = unsigned(number(bit), 6)
+        return words(
+            opcode
+            | (bit >> 5) << 31
+            | (bit & 31) << 19
+            | register(operand)
+        ), [(0, symbol(target), 0, "branch14")]
+
+    return encode
+
+
+def aarch64_condition_branch(condition):
+    def encode(target):
+        return words(0x54000000 | condition), [
+            (0, symbol(target), 0, "branch19")
+        ]
+
+    return encode
+
+
+def aarch64_adrp(destination, target):
+    return words(0x90000000 | register(destination)), [
+        (0, symbol(target), 0, "page21")
+    ]
+
+
+def aarch64_ret(target="x30"):
+    return words(0xD65F0000 | register(target) << 5), []
+
+
+def aarch64_svc(value):
+    return (
+        words(0xD4000001 | unsigned(number(value), 16) << 5),
+        [],
+    )
+
+
+def symbol(text):
+    text = text.strip()
+    if not is_symbol(text):
+        raise ValueError(text)
+    return text
+
+
+AARCH64_ENCODERS = {
+    "mov": aarch64_mov,
+    "add": aarch64_add_sub(0),
+    "sub": aarch64_add_sub(1),
+    "cmp": aarch64_cmp,
+    "mul": four(0x9B000000),
+    "madd": four(0x9B000000),
+    "msub": four(0x9B008000),
+    "smulh": three(0x9B407C00),
+    "sdiv": three(0x9AC00C00),
+    "udiv": three(0x9AC00800),
+    "and": three(0x8A000000),
+    "orr": three(0xAA000000),
+    "eor": three(0xCA000000),
+    "neg": aarch64_neg,
+    "lsl": aarch64_shift("lsl"),
+    "lsr": aarch64_shift("lsr"),
+    "asr": aarch64_shift("asr"),
+    "ldr": aarch64_load_store(True),
+    "str": aarch64_load_store(False),
+    "ldp": aarch64_pair(True),
+    "stp": aarch64_pair(False),
+    "b": aarch64_branch(0x14000000),
+    "bl": aarch64_branch(0x94000000),
+    "cbz": aarch64_compare_branch(0xB4000000),
+    "cbnz": aarch64_compare_branch(0xB5000000),
+    "tbz": aarch64_test_branch(0x36000000),
+    "tbnz": aarch64_test_branch(0x37000000),
+    **{
+        f"b.{name}": aarch64_condition_branch(condition)
+        for name, condition in AARCH64_CONDITIONS.items()
+    },
+    "adrp": aarch64_adrp,
+    "ret": aarch64_ret,
+    "svc": aarch64_svc,
+    "nop": lambda: (words(0xD503201F), []),
+}
+
+
+def aarch64_encoder(mnemonic):
+    encode = AARCH64_ENCODERS.get(mnemonic)
+    if mnemonic == "mul":
+        # madd with xzr as the addend
+        return lambda d, n, m: encode(d, n, m, "xzr")
+    return encode
+
+
+# Comment marker and encoder lookup of each architecture's syntax
+SYNTAX = {
+    Arch.x86_64: ("#", x86_64_encoder),
+    Arch.aarch64: ("//", aarch64_encoder),
+}
@@ -0,0 +1,179 @@
+"""
+Content addressed cache of build outputs
+
+An entry holds the files a build wrote, the assembly, the object
+and the executable, under a key hashing everything the build
+depends on: the source, the compiler's own code and the options. A
+build whose key is cached is a hash and a copy of the entry's files.
+
+Entries are evicted least recently used first once the cache
+outgrows its limit, use is marked by the modification time of the
+entry's directory. Hits, misses and evictions are counted in the
+cache, so they add up over the builds sharing it.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import asdict, dataclass
+
+# Bytes the entries may take before the least recently used go
+LIMIT = 256 * 2**20
+
+# Bytes of a source hashed at a time
+CHUNK = 2**20
+
+
+@dataclass(slots=True)
+class Stats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+@functools.cache
+def version():
+    """Hash of the compiler's sources, any change to the compiler
+    misses entries it built"""
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".py"):
+            with open(
+                os.path.join(directory, name), "rb"
+            ) as stream:
+                update(digest, name.encode())
+                update(digest, stream.read())
+    return digest.hexdigest()
+
+
+def key(source, **options):
+    """Key of a build of source, its bytes or file_digest, with
+    options"""
+    digest = hashlib.sha256()
+    update(digest, version().encode())
+    update(
+        digest,
+        json.dumps(
+            options, sort_keys=True, default=str
+        ).encode(),
+    )
+    update(digest, source)
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """SHA-256 of the file at path, read in chunks so its size does
+    not bound memory, the source part of a key"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        while chunk := stream.read(CHUNK):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def update(digest, data):
+    # Length prefixed, so parts can not run into each other
+    digest.update(len(data).to_bytes(8, "little"))
+    digest.update(data)
+
+
+class Cache:
+    def __init__(self, directory, limit=LIMIT):
+        self.directory = directory
+        self.limit = limit
+        self.entries = os.path.join(directory, "entries")
+        os.makedirs(self.entries, exist_ok=True)
+
+    def restore(self, key, names, target=".", count=True):
+        """Whether the files of key were cached, copied to target,
+        counted unless the caller counts several at once"""
+        entry = os.path.join(self.entries, key)
+        try:
+            for name in names:
+                shutil.copy2(
+                    os.path.join(entry, name),
+                    os.path.join(target, name),
+                )
+            os.utime(entry)
+        except FileNotFoundError:
+            if count:
+                self.count(misses=1)
+            return False
+        if count:
+            self.count(hits=1)
+        return True
+
+    def store(self, key, names, source=".", evict=True):
+        """Cache the files of a build under key, evicting unless
+        the caller will once it has stored several"""
+        # Copied aside and renamed in, so a concurrent build never
+        # restores part of an entry
+        staging = tempfile.mkdtemp(
+            dir=self.directory, prefix="."
+        )
+        for name in names:
+            shutil.copy2(
+                os.path.join(source, name),
+                os.path.join(staging, name),
+            )
+        try:
+            os.rename(staging, os.path.join(self.entries, key))
+        except OSError:
+            # Stored by another build meanwhile
+            shutil.rmtree(staging, ignore_errors=True)
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until under limit"""
+        entries = []
+        for name in os.listdir(self.entries):
+            path = os.path.join(self.entries, name)
+            try:
+                size = sum(
+                    entry.stat().st_size
+                    for entry in os.scandir(path)
+                )
+                entries.append(
+                    (os.stat(path).st_mtime, size, path)
+                )
+            except FileNotFoundError:
+                # Evicted by another build meanwhile
+                continue
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.limit:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            evicted += 1
+        if evicted:
+            self.count(evictions=evicted)
+
+    def stats(self):
+        try:
+            with open(
+                os.path.join(self.directory, "stats.json")
+            ) as stream:
+                return Stats(**json.load(stream))
+        except (FileNotFoundError, ValueError, TypeError):
+            return Stats()
+
+    def count(self, **numbers):
+        """Add numbers of hits, misses or evictions to the stats"""
+        stats = self.stats()
+        for name, number in numbers.items():
+            setattr(stats, name, getattr(stats, name) + number)
+        descriptor, path = tempfile.mkstemp(
+            dir=self.directory, prefix="."
+        )
+        with os.fdopen(descriptor, "w") as stream:
+            json.dump(asdict(stats), stream)
+        os.replace(
+            path, os.path.join(self.directory, "stats.json")
+        )
@@ -6,90 +6,1150 @@ from compiler.parser import (
     NodeInt,
     NodeBlock,
 )
-from compiler import parser, x86_64
+from compiler import (
+    dce,
+    parser,
+    peephole,
+    regalloc,
+    strength,
+    x86_64,
+)
+from compiler.ir import OperandKind, Opcode, operand_kind, wrap
+
+
+class CodeGenError(Exception):
+    """A program a backend can not lower"""
 
 
 def gas(instructions):
-    return render(gas_lines(instructions))
+    return render(
+        peephole.optimise(gas_lines(instructions), Arch.x86_64)
+    )
+
+
+PARAMETER_REGISTERS = {
+    1: "rdi",
+    2: "rsi",
+    3: "rcx",
+    4: "rdx",
+    5: "r8",
+    6: "r9",
+}
+
+# x0 to x7 pass arguments on aarch64
+AARCH64_ARGUMENTS = 8
 
 
 def gas_lines(instructions):
-    registers = {
-        1: "rdi",
-        2: "rsi",
-        3: "rcx",
-        4: "rdx",
-        5: "r8",
-        6: "r9",
-    }
+    # Instructions without an emitter produce no code
+    printed = False
     for op, arg1, arg2, result in instructions:
-        if (op, arg1) == ("global", "start"):
-            yield ".global _start"
-        elif op == "section":
-            yield f"\n.{arg1}"
-        elif op == "label":
-            yield f"{arg1}:"
-        elif op == "int":
-            yield f"{arg1}: .int {hex(arg2)}"
-        elif op == "=":
-            yield f"\tmov\t${arg2}, -0x8(%rbp)"
-        elif op == "exit":
-            if isinstance(arg1, int):
-                addr = f"${arg1}"
-            else:
-                addr = arg1
-            yield f"\tmov\t$60, %rax"
-            yield f"\tmov\t{addr}, %rdi"
-            yield f"\tsyscall"
-        elif op == "return":
-            if isinstance(arg1, int):
-                addr = f"${arg1}"
-            else:
-                _, index, size = arg1
-                addr = f"-{size*index}(%rbp)"
-            yield f"\tmov\t{addr}, %rax"
-        elif op == "call":
-            yield f"\tcall\t{arg1}\n"
-        elif op == "ret":
-            yield f"\tret\n"
-        elif op == "store_parameter":
-            yield f"\tmov\t${arg2}, %{registers[arg1]}"
-        elif op == "prolog":
-            yield f"\tpush\t%rbp"
-            yield f"\tmov\t%rsp, %rbp"
-            yield f"\tsub\t${arg1}, %rsp"
-        elif op == "parameter":
-            yield f"\tmov\t%{registers[arg1]}, -{arg1*arg2}(%rbp)"
-        elif op == "epilog":
-            yield f"\tmov\t%rbp, %rsp"
-            yield f"\tpop\t%rbp"
+        printed = printed or op == Opcode.PRINT
+        emit = GAS_EMITTERS.get(op)
+        if emit is not None:
+            yield from emit(arg1, arg2, result)
+    if printed:
+        yield from GAS_PRINT
+
+
+def gas_global(arg1, arg2, result):
+    if arg1 == "start":
+        return (".global _start",)
+    return (f".global {arg1}",)
+
+
+def gas_section(arg1, arg2, result):
+    if arg2 is None:
+        return (f"\n.{arg1}",)
+    return (f"\n.{arg1} {arg2}",)
+
+
+def gas_label(arg1, arg2, result):
+    return (f"{arg1}:",)
+
+
+def gas_int(arg1, arg2, result):
+    return (f"{arg1}: .quad {hex(arg2)}",)
+
+
+def gas_assign(arg1, arg2, result):
+    return (f"\tmov\t${arg2}, -0x8(%rbp)",)
+
+
+def gas_exit(arg1, arg2, result):
+    if type(arg1) is list:
+        # The call sets %rax, its value is moved out first
+        return (
+            *gas_load(arg1, "rdi"),
+            "\tmov\t$60, %rax",
+            "\tsyscall",
+        )
+    return (
+        "\tmov\t$60, %rax",
+        f"\tmov\t{gas_value(arg1)}, %rdi",
+        "\tsyscall",
+    )
+
+
+def gas_return(arg1, arg2, result):
+    return gas_load(arg1, "rax")
+
+
+def gas_load(value, register):
+    """Lines moving an operand or a call's value into register"""
+    if type(value) is not list:
+        return (f"\tmov\t{gas_value(value)}, %{register}",)
+    lines = []
+    # Arguments are operands, one that is a call would replace the
+    # ones stored before it
+    for op, arg1, arg2, result in value:
+        if op == Opcode.STORE_PARAMETER:
+            lines += gas_store_parameter(arg1, arg2, result)
+        else:
+            lines += gas_call(arg1, arg2, result)
+    if register != "rax":
+        lines.append(f"\tmov\t%rax, %{register}")
+    return lines
+
+
+def gas_value(value):
+    # An immediate, a global or a parameter's stack slot
+    kind = operand_kind(value)
+    if kind == OperandKind.IMMEDIATE:
+        return f"${value}"
+    if kind == OperandKind.SYMBOL:
+        # A global, separately compiled functions read from memory
+        return value
+    if kind == OperandKind.STACK_SLOT:
+        return f"-{value.size*value.index}(%rbp)"
+    raise unsupported(value)
+
+
+def unsupported(value):
+    """The error for an operand the IR backends do not lower,
+    values only known by running code, which the VM does"""
+    if isinstance(value, list):
+        # Calls are lowered where a value is used, see gas_load
+        what = "the value of a call as an argument"
+    elif operand_kind(value) is None:
+        what = f"the operand {value!r}"
+    else:
+        what = f"the {operand_kind(value).value} {value!r}"
+    return CodeGenError(
+        f"can not lower {what}, operands are constants, globals,"
+        " parameters and calls with those as arguments, the SSA"
+        " backends of --ssa lower any expression"
+    )
+
+
+def check_arguments(count, limit):
+    """Raise for a call or function with more arguments than the
+    limit passed in registers, none are passed on the stack"""
+    if count > limit:
+        raise CodeGenError(
+            f"can not pass {count} arguments, at most {limit} are"
+            " passed in registers"
+        )
+
+
+def gas_print(arg1, arg2, result):
+    return (*gas_load(arg1, "rax"), "\tcall\t__print")
+
+
+# Writes %rax in decimal and a newline to stdout. Digits are made
+# least significant first from signed remainders, so the most
+# negative value needs no special case, and each is shifted into
+# %r8 and stored a byte lower than the last, %r8 holding the bytes
+# already written above it. It is placed after the JIT runtime's
+# .text 2, which a program falling off its end runs into.
+GAS_PRINT = (
+    "\n.text 3",
+    "__print:",
+    "\tpush\t%rbp",
+    "\tmov\t%rsp, %rbp",
+    "\tsub\t$48, %rsp",
+    "\tlea\t-16(%rbp), %rsi",
+    "\tmov\t$10, %r8",
+    "\tdec\t%rsi",
+    "\tmov\t%r8, (%rsi)",
+    "\tmov\t%rax, %r9",
+    "\tmov\t$10, %rcx",
+    "__print_digit:",
+    "\tcqo",
+    "\tidiv\t%rcx",
+    "\tmov\t%rdx, %r10",
+    "\tsar\t$63, %r10",
+    "\txor\t%r10, %rdx",
+    "\tsub\t%r10, %rdx",
+    "\tadd\t$48, %rdx",
+    "\tshl\t$8, %r8",
+    "\tor\t%rdx, %r8",
+    "\tdec\t%rsi",
+    "\tmov\t%r8, (%rsi)",
+    "\ttest\t%rax, %rax",
+    "\tjne\t__print_digit",
+    "\ttest\t%r9, %r9",
+    "\tjns\t__print_write",
+    "\tshl\t$8, %r8",
+    "\tor\t$45, %r8",
+    "\tdec\t%rsi",
+    "\tmov\t%r8, (%rsi)",
+    "__print_write:",
+    "\tlea\t-16(%rbp), %rdx",
+    "\tsub\t%rsi, %rdx",
+    "\tmov\t$1, %rdi",
+    "\tmov\t$1, %rax",
+    "\tsyscall",
+    "\tmov\t%rbp, %rsp",
+    "\tpop\t%rbp",
+    "\tret\n",
+)
+
+
+def gas_call(arg1, arg2, result):
+    return (f"\tcall\t{arg1}\n",)
+
+
+def gas_ret(arg1, arg2, result):
+    return ("\tret\n",)
+
+
+def gas_store_parameter(arg1, arg2, result):
+    check_arguments(arg1, len(PARAMETER_REGISTERS))
+    register = PARAMETER_REGISTERS[arg1]
+    return [f"\tmov\t{gas_value(arg2)}, %{register}"]
+
+
+def gas_prolog(arg1, arg2, result):
+    return (
+        "\tpush\t%rbp",
+        "\tmov\t%rsp, %rbp",
+        f"\tsub\t${arg1}, %rsp",
+    )
+
+
+def gas_parameter(arg1, arg2, result):
+    check_arguments(arg1, len(PARAMETER_REGISTERS))
+    register = PARAMETER_REGISTERS[arg1]
+    return (f"\tmov\t%{register}, -{arg1*arg2}(%rbp)",)
+
+
+def gas_epilog(arg1, arg2, result):
+    return (
+        "\tmov\t%rbp, %rsp",
+        "\tpop\t%rbp",
+    )
+
+
+GAS_EMITTERS = {
+    Opcode.GLOBAL: gas_global,
+    Opcode.SECTION: gas_section,
+    Opcode.LABEL: gas_label,
+    Opcode.INT: gas_int,
+    Opcode.ASSIGN: gas_assign,
+    Opcode.EXIT: gas_exit,
+    Opcode.PRINT: gas_print,
+    Opcode.RETURN: gas_return,
+    Opcode.CALL: gas_call,
+    Opcode.RET: gas_ret,
+    Opcode.STORE_PARAMETER: gas_store_parameter,
+    Opcode.PROLOG: gas_prolog,
+    Opcode.PARAMETER: gas_parameter,
+    Opcode.EPILOG: gas_epilog,
+}
 
 
 def aarch64(instructions):
-    return render(aarch64_lines(instructions))
+    return render(
+        peephole.optimise(
+            aarch64_lines(instructions), Arch.aarch64
+        )
+    )
 
 
 def aarch64_lines(instructions):
+    printed = False
     for op, arg1, arg2, result in instructions:
-        if op == "=":
-            yield f"mov [sp, #0x8], #{hex(arg2)}"
-        elif op == "exit":
-            yield f"mov x8, #0x5d"
-            yield f"mov x0, #{hex(arg1)}"
-            yield f"svc 0"
-        elif op == "return":
-            yield f"mov x0, #{hex(arg1)}"
-            yield f"ret"
-        elif (op, arg1) == ("global", "start"):
-            yield ".global _start"
-        elif (op, arg1) == ("section", "text"):
-            yield ".section .text"
-        elif op == "label":
-            yield f"{arg1}:"
-        elif op == "call":
-            yield f"bl {arg1}"
-        elif op == "ret":
-            yield f"ret"
+        printed = printed or op == Opcode.PRINT
+        emit = AARCH64_EMITTERS.get(op)
+        if emit is not None:
+            yield from emit(arg1, arg2, result)
+    if printed:
+        yield from AARCH64_PRINT
+
+
+def aarch64_assign(arg1, arg2, result):
+    return [f"mov [sp, #0x8], #{hex(arg2)}"]
+
+
+def aarch64_exit(arg1, arg2, result):
+    if type(arg1) is list:
+        # The call may use x8, it is set after
+        return (
+            *aarch64_load("x0", arg1),
+            "mov x8, #0x5d",
+            "svc 0",
+        )
+    return (
+        "mov x8, #0x5d",
+        *aarch64_value("x0", arg1),
+        "svc 0",
+    )
+
+
+def aarch64_load(register, value):
+    """Lines moving an operand or a call's value into register, as
+    gas_load"""
+    if type(value) is not list:
+        return aarch64_value(register, value)
+    lines = []
+    for op, arg1, arg2, result in value:
+        if op == Opcode.STORE_PARAMETER:
+            lines += aarch64_store_parameter(arg1, arg2, result)
+        else:
+            # Functions without parameters have no frame to keep
+            # the link register in, as for aarch64_print
+            lines += (
+                "str x30, [sp, #-16]!",
+                *aarch64_call(arg1, arg2, result),
+                "ldr x30, [sp], #16",
+            )
+    if register != "x0":
+        lines.append(f"mov {register}, x0")
+    return lines
+
+
+def aarch64_value(register, value):
+    """Lines moving an immediate, a global or a parameter's stack
+    slot into register, as gas_value"""
+    kind = operand_kind(value)
+    if kind == OperandKind.IMMEDIATE:
+        return (aarch64_constant(register, value),)
+    if kind == OperandKind.SYMBOL:
+        return (
+            f"adrp {register}, {value}",
+            f"ldr {register}, [{register}, :lo12:{value}]",
+        )
+    if kind == OperandKind.STACK_SLOT:
+        offset = value.size * value.index
+        return (f"ldr {register}, [x29, #-{hex(offset)}]",)
+    raise unsupported(value)
+
+
+def aarch64_constant(register, value):
+    # mov takes a 16 bit immediate, ldr = any 64 bit constant
+    if -0x10000 <= value <= 0xFFFF:
+        return f"mov {register}, #{hex(value)}"
+    return f"ldr {register}, ={hex(value)}"
+
+
+def aarch64_print(arg1, arg2, result):
+    # The link register is kept for the caller's ret
+    return (
+        *aarch64_load("x0", arg1),
+        "str x30, [sp, #-16]!",
+        "bl __print",
+        "ldr x30, [sp], #16",
+    )
+
+
+# Writes x0 in decimal and a newline to stdout, as GAS_PRINT does
+AARCH64_PRINT = (
+    ".section .text",
+    "__print:",
+    "sub sp, sp, #0x30",
+    "add x1, sp, #0x20",
+    "mov x3, #0xa",
+    "sub x1, x1, #0x1",
+    "str x3, [x1]",
+    "mov x4, #0xa",
+    "mov x5, x0",
+    "__print_digit:",
+    "sdiv x6, x0, x4",
+    "msub x7, x6, x4, x0",
+    "asr x8, x7, #63",
+    "eor x7, x7, x8",
+    "sub x7, x7, x8",
+    "add x7, x7, #0x30",
+    "lsl x3, x3, #8",
+    "orr x3, x7, x3",
+    "sub x1, x1, #0x1",
+    "str x3, [x1]",
+    "mov x0, x6",
+    "cbnz x0, __print_digit",
+    "tbz x5, #63, __print_write",
+    "lsl x3, x3, #8",
+    "mov x7, #0x2d",
+    "orr x3, x7, x3",
+    "sub x1, x1, #0x1",
+    "str x3, [x1]",
+    "__print_write:",
+    "add x2, sp, #0x20",
+    "sub x2, x2, x1",
+    "mov x0, #0x1",
+    "mov x8, #0x40",
+    "svc 0",
+    "add sp, sp, #0x30",
+    "ret",
+)
+
+
+def aarch64_return(arg1, arg2, result):
+    # Returned by the function's ret, after its epilog
+    return aarch64_load("x0", arg1)
+
+
+def aarch64_global(arg1, arg2, result):
+    if arg1 == "start":
+        return (".global _start",)
+    return (f".global {arg1}",)
+
+
+def aarch64_section(arg1, arg2, result):
+    if arg2 is None:
+        return (f".section .{arg1}",)
+    return (f".{arg1} {arg2}",)
+
+
+def aarch64_int(arg1, arg2, result):
+    return (f"{arg1}: .quad {hex(arg2)}",)
+
+
+def aarch64_label(arg1, arg2, result):
+    return (f"{arg1}:",)
+
+
+def aarch64_call(arg1, arg2, result):
+    return (f"bl {arg1}",)
+
+
+def aarch64_ret(arg1, arg2, result):
+    return ("ret",)
+
+
+def aarch64_store_parameter(arg1, arg2, result):
+    check_arguments(arg1, AARCH64_ARGUMENTS)
+    return aarch64_value(f"x{arg1 - 1}", arg2)
+
+
+def aarch64_prolog(arg1, arg2, result):
+    # The link register is saved with the frame pointer, calls in
+    # the body replace it
+    return (
+        "stp x29, x30, [sp, #-16]!",
+        "mov x29, sp",
+        f"sub sp, sp, #{hex(stack_alignment(arg1))}",
+    )
+
+
+def aarch64_parameter(arg1, arg2, result):
+    check_arguments(arg1, AARCH64_ARGUMENTS)
+    return (f"str x{arg1 - 1}, [x29, #-{hex(arg1 * arg2)}]",)
+
+
+def aarch64_epilog(arg1, arg2, result):
+    return (
+        "mov sp, x29",
+        "ldp x29, x30, [sp], #16",
+    )
+
+
+AARCH64_EMITTERS = {
+    Opcode.ASSIGN: aarch64_assign,
+    Opcode.EXIT: aarch64_exit,
+    Opcode.PRINT: aarch64_print,
+    Opcode.RETURN: aarch64_return,
+    Opcode.GLOBAL: aarch64_global,
+    Opcode.SECTION: aarch64_section,
+    Opcode.LABEL: aarch64_label,
+    Opcode.CALL: aarch64_call,
+    Opcode.RET: aarch64_ret,
+    Opcode.INT: aarch64_int,
+    Opcode.STORE_PARAMETER: aarch64_store_parameter,
+    Opcode.PROLOG: aarch64_prolog,
+    Opcode.PARAMETER: aarch64_parameter,
+    Opcode.EPILOG: aarch64_epilog,
+}
+
+
+# SSA backends, see compiler.ssa. Values live in the registers of
+# a regalloc.Allocation, spilled ones in stack slots below the frame
+# pointer, moved through scratch registers where needed.
+
+SYSV_REGISTERS = ("rdi", "rsi", "rdx", "rcx", "r8", "r9")
+
+
+def gas_ssa_lines(module):
+    registers = regalloc.REGISTER_FILES[Arch.x86_64]
+    yield ".global _start"
+    if module.globals:
+        yield "\n.data"
+        for name in module.globals:
+            yield f"{name}: .quad 0"
+    yield "\n.text"
+    for function in module.functions:
+        allocation = regalloc.allocate(function, registers)
+        yield f"{function.name}:"
+        yield from gas_ssa_prolog(allocation)
+        for instruction in function.instructions():
+            emit = GAS_SSA_EMITTERS[instruction.op]
+            yield from emit(instruction, allocation)
+
+
+def gas_slot(index):
+    return f"-{8 * (index + 1)}(%rbp)"
+
+
+def gas_operand(value, allocation):
+    register = allocation.registers.get(value)
+    if register is None:
+        return gas_slot(allocation.slots[value])
+    return f"%{register}"
+
+
+def gas_saved(allocation):
+    # Callee saved registers with their slots
+    return [
+        (f"%{register}", gas_slot(len(allocation.slots) + i))
+        for i, register in enumerate(allocation.saved)
+    ]
+
+
+def gas_ssa_prolog(allocation):
+    size = frame_size(allocation)
+    if allocation.function.name != "_start":
+        yield "\tpush\t%rbp"
+    yield "\tmov\t%rsp, %rbp"
+    if size:
+        yield f"\tsub\t${size}, %rsp"
+    if allocation.function.name != "_start":
+        for register, slot in gas_saved(allocation):
+            yield f"\tmov\t{register}, {slot}"
+
+
+def gas_ssa_const(instruction, allocation):
+    (value,) = instruction.operands
+    result = instruction.result
+    operand = gas_operand(result, allocation)
+    if -(2**31) <= value < 2**31:
+        return (f"\tmovq\t${value}, {operand}",)
+    if result in allocation.registers:
+        return (f"\tmovabs\t${value}, {operand}",)
+    return (
+        f"\tmovabs\t${value}, %rax",
+        f"\tmov\t%rax, {operand}",
+    )
+
+
+def gas_ssa_parameter(instruction, allocation):
+    (index,) = instruction.operands
+    check_arguments(index + 1, len(SYSV_REGISTERS))
+    register = SYSV_REGISTERS[index]
+    return (
+        f"\tmov\t%{register}, "
+        f"{gas_operand(instruction.result, allocation)}",
+    )
+
+
+def gas_ssa_load(instruction, allocation):
+    (name,) = instruction.operands
+    result = instruction.result
+    operand = gas_operand(result, allocation)
+    if result in allocation.registers:
+        return (f"\tmov\t{name}(%rip), {operand}",)
+    return (
+        f"\tmov\t{name}(%rip), %rax",
+        f"\tmov\t%rax, {operand}",
+    )
+
+
+def gas_ssa_store(instruction, allocation):
+    name, value = instruction.operands
+    operand = gas_operand(value, allocation)
+    if value in allocation.registers:
+        return (f"\tmov\t{operand}, {name}(%rip)",)
+    return (
+        f"\tmov\t{operand}, %rax",
+        f"\tmov\t%rax, {name}(%rip)",
+    )
+
+
+def gas_ssa_arithmetic(instruction, allocation):
+    lhs, rhs = instruction.operands
+    mnemonic = GAS_ARITHMETIC[instruction.op]
+    result = gas_operand(instruction.result, allocation)
+    # The result never shares a register with an operand, both are
+    # live at the instruction
+    target = result
+    if instruction.result not in allocation.registers:
+        target = "%rax"
+    lines = (
+        f"\tmov\t{gas_operand(lhs, allocation)}, {target}",
+        f"\t{mnemonic}\t{gas_operand(rhs, allocation)}, {target}",
+    )
+    if target != result:
+        lines += (f"\tmov\t{target}, {result}",)
+    return lines
+
+
+def gas_ssa_call(instruction, allocation):
+    name, *arguments = instruction.operands
+    return (
+        *gas_arguments(arguments, allocation),
+        f"\tcall\t{name}",
+        f"\tmov\t%rax, "
+        f"{gas_operand(instruction.result, allocation)}",
+    )
+
+
+def gas_ssa_tailcall(instruction, allocation):
+    # The callee reuses the frame and returns to our caller
+    name, *arguments = instruction.operands
+    return (
+        *gas_arguments(arguments, allocation),
+        *gas_ssa_epilog(allocation),
+        f"\tjmp\t{name}",
+    )
+
+
+def gas_arguments(arguments, allocation):
+    # Values are never in argument registers, so moves into them
+    # do not clobber each other
+    check_arguments(len(arguments), len(SYSV_REGISTERS))
+    return (
+        f"\tmov\t{gas_operand(argument, allocation)}, %{register}"
+        for argument, register in zip(arguments, SYSV_REGISTERS)
+    )
+
+
+def gas_ssa_epilog(allocation):
+    return (
+        *(
+            f"\tmov\t{slot}, {register}"
+            for register, slot in gas_saved(allocation)
+        ),
+        "\tleave",
+    )
+
+
+def gas_ssa_ret(instruction, allocation):
+    (value,) = instruction.operands
+    operand = gas_operand(value, allocation)
+    if allocation.function.name == "_start":
+        return (
+            f"\tmov\t{operand}, %rdi",
+            "\tmov\t$60, %rax",
+            "\tsyscall",
+        )
+    return (
+        f"\tmov\t{operand}, %rax",
+        *gas_ssa_epilog(allocation),
+        "\tret",
+    )
+
+
+def gas_target(instruction, allocation):
+    """Operand holding the result and the register computing it,
+    rax if the result is spilled"""
+    result = gas_operand(instruction.result, allocation)
+    if instruction.result in allocation.registers:
+        return result, result
+    return result, "%rax"
+
+
+def gas_ssa_div(instruction, allocation):
+    lhs, rhs = instruction.operands
+    return (
+        f"\tmov\t{gas_operand(lhs, allocation)}, %rax",
+        "\tcqo",
+        f"\tidivq\t{gas_operand(rhs, allocation)}",
+        f"\tmov\t%rax, "
+        f"{gas_operand(instruction.result, allocation)}",
+    )
+
+
+def gas_ssa_pow(instruction, allocation):
+    # Square and multiply over the bits of the exponent
+    base, exponent = instruction.operands
+    loop, skip = power_labels(instruction, allocation)
+    return (
+        "\tmovq\t$1, %rax",
+        f"\tmov\t{gas_operand(base, allocation)}, %rcx",
+        f"\tmov\t{gas_operand(exponent, allocation)}, %rdx",
+        f"{loop}:",
+        "\tshr\t%rdx",
+        f"\tjnc\t{skip}",
+        "\timul\t%rcx, %rax",
+        f"{skip}:",
+        "\timul\t%rcx, %rcx",
+        "\ttest\t%rdx, %rdx",
+        f"\tjnz\t{loop}",
+        f"\tmov\t%rax, "
+        f"{gas_operand(instruction.result, allocation)}",
+    )
+
+
+def gas_ssa_muli(instruction, allocation):
+    value, factor = instruction.operands
+    source = gas_operand(value, allocation)
+    result, target = gas_target(instruction, allocation)
+    odd, shift = split_factor(abs(factor))
+    if odd in (3, 5, 9):
+        lines = []
+        if value not in allocation.registers:
+            lines.append(f"\tmov\t{source}, {target}")
+            source = target
+        lines.append(
+            f"\tlea\t({source},{source},{odd - 1}), {target}"
+        )
+    elif odd == 1:
+        lines = [f"\tmov\t{source}, {target}"]
+    else:
+        odd, shift = abs(factor), 0
+        if odd < 2**31:
+            lines = [f"\timul\t${odd}, {source}, {target}"]
+        else:
+            lines = [
+                f"\tmovabs\t${wrap(odd)}, {target}",
+                f"\timul\t{source}, {target}",
+            ]
+    if shift:
+        lines.append(f"\tshl\t${shift}, {target}")
+    if factor < 0:
+        lines.append(f"\tneg\t{target}")
+    if target != result:
+        lines.append(f"\tmov\t{target}, {result}")
+    return lines
+
+
+def gas_ssa_divi(instruction, allocation):
+    value, divisor = instruction.operands
+    source = gas_operand(value, allocation)
+    shift = power_of_two(abs(divisor))
+    if shift == 0:
+        lines = [f"\tmov\t{source}, %rax"]
+    elif shift is not None:
+        # Negative dividends are biased by divisor - 1, so the
+        # shift truncates towards zero
+        lines = [
+            f"\tmov\t{source}, %rax",
+            "\tmov\t%rax, %rdx",
+            "\tsar\t$63, %rdx",
+            f"\tshr\t${64 - shift}, %rdx",
+            "\tadd\t%rdx, %rax",
+            f"\tsar\t${shift}, %rax",
+        ]
+    else:
+        number, shift = strength.magic(abs(divisor))
+        lines = [
+            f"\tmovabs\t${number}, %rax",
+            f"\timulq\t{source}",
+        ]
+        if number < 0:
+            lines.append(f"\tadd\t{source}, %rdx")
+        if shift:
+            lines.append(f"\tsar\t${shift}, %rdx")
+        lines += [
+            "\tmov\t%rdx, %rax",
+            "\tshr\t$63, %rax",
+            "\tadd\t%rdx, %rax",
+        ]
+    if divisor < 0:
+        lines.append("\tneg\t%rax")
+    lines.append(
+        f"\tmov\t%rax, "
+        f"{gas_operand(instruction.result, allocation)}"
+    )
+    return lines
+
+
+def gas_ssa_madd(instruction, allocation):
+    lhs, rhs, addend = instruction.operands
+    result, target = gas_target(instruction, allocation)
+    lines = (
+        f"\tmov\t{gas_operand(lhs, allocation)}, {target}",
+        f"\timul\t{gas_operand(rhs, allocation)}, {target}",
+        f"\tadd\t{gas_operand(addend, allocation)}, {target}",
+    )
+    if target != result:
+        lines += (f"\tmov\t{target}, {result}",)
+    return lines
+
+
+GAS_ARITHMETIC = {"add": "add", "sub": "sub", "mul": "imul"}
+
+GAS_SSA_EMITTERS = {
+    "const": gas_ssa_const,
+    "parameter": gas_ssa_parameter,
+    "load": gas_ssa_load,
+    "store": gas_ssa_store,
+    "add": gas_ssa_arithmetic,
+    "sub": gas_ssa_arithmetic,
+    "mul": gas_ssa_arithmetic,
+    "div": gas_ssa_div,
+    "pow": gas_ssa_pow,
+    "muli": gas_ssa_muli,
+    "divi": gas_ssa_divi,
+    "madd": gas_ssa_madd,
+    "call": gas_ssa_call,
+    "tailcall": gas_ssa_tailcall,
+    "ret": gas_ssa_ret,
+}
+
+
+def aarch64_ssa_lines(module):
+    registers = regalloc.REGISTER_FILES[Arch.aarch64]
+    yield ".global _start"
+    if module.globals:
+        yield ".section .data"
+        yield ".balign 8"
+        for name in module.globals:
+            yield f"{name}: .quad 0"
+    yield ".section .text"
+    for function in module.functions:
+        allocation = regalloc.allocate(function, registers)
+        yield f"{function.name}:"
+        yield from aarch64_ssa_prolog(allocation)
+        for instruction in function.instructions():
+            emit = AARCH64_SSA_EMITTERS[instruction.op]
+            yield from emit(instruction, allocation)
+
+
+def aarch64_slot(index):
+    """Lines computing the address of a stack slot, and the slot"""
+    offset = 8 * index
+    if offset <= 32760:
+        return (), f"[sp, #{offset}]"
+    return (f"ldr x16, ={offset}", "add x16, sp, x16"), "[x16]"
+
+
+def aarch64_source(value, allocation, scratch):
+    """Lines moving a value into a register, and the register
+
+    Values in registers are used where they are, spilled ones are
+    loaded into the scratch register.
+    """
+    register = allocation.registers.get(value)
+    if register is not None:
+        return (), register
+    setup, slot = aarch64_slot(allocation.slots[value])
+    return (*setup, f"ldr {scratch}, {slot}"), scratch
+
+
+def aarch64_target(value, allocation, scratch):
+    # Register to compute a value in, the scratch one if spilled
+    return allocation.registers.get(value, scratch)
+
+
+def aarch64_spill(value, allocation, register):
+    # Lines storing a value computed in a register, if spilled
+    if value in allocation.registers:
+        return ()
+    setup, slot = aarch64_slot(allocation.slots[value])
+    return (*setup, f"str {register}, {slot}")
+
+
+def aarch64_saved(allocation):
+    return [
+        (register, aarch64_slot(len(allocation.slots) + i))
+        for i, register in enumerate(allocation.saved)
+    ]
+
+
+def aarch64_ssa_prolog(allocation):
+    size = frame_size(allocation)
+    if allocation.function.name != "_start":
+        yield "stp x29, x30, [sp, #-16]!"
+    yield "mov x29, sp"
+    if 0 < size < 4096:
+        yield f"sub sp, sp, #{size}"
+    elif size:
+        yield f"ldr x16, ={size}"
+        yield "sub sp, sp, x16"
+    if allocation.function.name != "_start":
+        for register, (setup, slot) in aarch64_saved(allocation):
+            yield from setup
+            yield f"str {register}, {slot}"
+
+
+def aarch64_ssa_const(instruction, allocation):
+    (value,) = instruction.operands
+    result = instruction.result
+    register = aarch64_target(result, allocation, "x9")
+    return (
+        *aarch64_move(register, value),
+        *aarch64_spill(result, allocation, register),
+    )
+
+
+def aarch64_ssa_parameter(instruction, allocation):
+    (index,) = instruction.operands
+    check_arguments(index + 1, AARCH64_ARGUMENTS)
+    result = instruction.result
+    register = aarch64_target(result, allocation, f"x{index}")
+    lines = aarch64_spill(result, allocation, register)
+    if register != f"x{index}":
+        lines = (f"mov {register}, x{index}",)
+    return lines
+
+
+def aarch64_ssa_load(instruction, allocation):
+    (name,) = instruction.operands
+    result = instruction.result
+    register = aarch64_target(result, allocation, "x9")
+    return (
+        f"adrp {register}, {name}",
+        f"ldr {register}, [{register}, :lo12:{name}]",
+        *aarch64_spill(result, allocation, register),
+    )
+
+
+def aarch64_ssa_store(instruction, allocation):
+    name, value = instruction.operands
+    lines, register = aarch64_source(value, allocation, "x9")
+    return (
+        *lines,
+        f"adrp x10, {name}",
+        f"str {register}, [x10, :lo12:{name}]",
+    )
+
+
+def aarch64_ssa_arithmetic(instruction, allocation):
+    lhs, rhs = instruction.operands
+    result = instruction.result
+    lhs_lines, lhs = aarch64_source(lhs, allocation, "x9")
+    rhs_lines, rhs = aarch64_source(rhs, allocation, "x10")
+    register = aarch64_target(result, allocation, "x9")
+    return (
+        *lhs_lines,
+        *rhs_lines,
+        f"{AARCH64_ARITHMETIC[instruction.op]} {register}, "
+        f"{lhs}, {rhs}",
+        *aarch64_spill(result, allocation, register),
+    )
+
+
+def aarch64_ssa_call(instruction, allocation):
+    name, *arguments = instruction.operands
+    result = instruction.result
+    lines = aarch64_arguments(arguments, allocation)
+    register = aarch64_target(result, allocation, "x0")
+    lines.append(f"bl {name}")
+    if register != "x0":
+        lines.append(f"mov {register}, x0")
+    return (*lines, *aarch64_spill(result, allocation, "x0"))
+
+
+def aarch64_ssa_ret(instruction, allocation):
+    (value,) = instruction.operands
+    lines, register = aarch64_source(value, allocation, "x0")
+    if register != "x0":
+        lines += (f"mov x0, {register}",)
+    if allocation.function.name == "_start":
+        return (*lines, "mov x8, #93", "svc #0")
+    return (*lines, *aarch64_ssa_epilog(allocation), "ret")
+
+
+def aarch64_ssa_tailcall(instruction, allocation):
+    # The callee reuses the frame and returns to our caller
+    name, *arguments = instruction.operands
+    return (
+        *aarch64_arguments(arguments, allocation),
+        *aarch64_ssa_epilog(allocation),
+        f"b {name}",
+    )
+
+
+def aarch64_arguments(arguments, allocation):
+    check_arguments(len(arguments), AARCH64_ARGUMENTS)
+    lines = []
+    for i, argument in enumerate(arguments):
+        setup, register = aarch64_source(
+            argument, allocation, f"x{i}"
+        )
+        lines += setup
+        if register != f"x{i}":
+            lines.append(f"mov x{i}, {register}")
+    return lines
+
+
+def aarch64_ssa_epilog(allocation):
+    lines = []
+    for register, (setup, slot) in aarch64_saved(allocation):
+        lines += (*setup, f"ldr {register}, {slot}")
+    return (*lines, "mov sp, x29", "ldp x29, x30, [sp], #16")
+
+
+def aarch64_ssa_pow(instruction, allocation):
+    # Square and multiply over the bits of the exponent, in copies
+    # of the operands
+    base, exponent = instruction.operands
+    result = instruction.result
+    base_lines, base = aarch64_source(base, allocation, "x9")
+    exponent_lines, exponent = aarch64_source(
+        exponent, allocation, "x10"
+    )
+    loop, skip = power_labels(instruction, allocation)
+    register = aarch64_target(result, allocation, "x9")
+    return (
+        *base_lines,
+        *exponent_lines,
+        f"mov x9, {base}",
+        f"mov x10, {exponent}",
+        "mov x16, #1",
+        f"{loop}:",
+        f"tbz x10, #0, {skip}",
+        "mul x16, x16, x9",
+        f"{skip}:",
+        "mul x9, x9, x9",
+        "lsr x10, x10, #1",
+        f"cbnz x10, {loop}",
+        f"mov {register}, x16",
+        *aarch64_spill(result, allocation, register),
+    )
+
+
+def aarch64_ssa_muli(instruction, allocation):
+    value, factor = instruction.operands
+    result = instruction.result
+    lines, source = aarch64_source(value, allocation, "x9")
+    # Apart from the operand when it is spilled
+    register = aarch64_target(result, allocation, "x10")
+    odd, shift = split_factor(abs(factor))
+    if odd == 1 and shift:
+        lines += (f"lsl {register}, {source}, #{shift}",)
+        shift = 0
+    elif odd == 1:
+        lines += (f"mov {register}, {source}",)
+    elif power_of_two(odd - 1) is not None:
+        lines += (
+            f"add {register}, {source}, {source}, "
+            f"lsl #{power_of_two(odd - 1)}",
+        )
+    elif power_of_two(odd + 1) is not None:
+        lines += (
+            f"lsl {register}, {source}, #{power_of_two(odd + 1)}",
+            f"sub {register}, {register}, {source}",
+        )
+    else:
+        shift = 0
+        lines += (
+            *aarch64_move("x16", abs(factor)),
+            f"mul {register}, {source}, x16",
+        )
+    if shift:
+        lines += (f"lsl {register}, {register}, #{shift}",)
+    if factor < 0:
+        lines += (f"neg {register}, {register}",)
+    return (*lines, *aarch64_spill(result, allocation, register))
+
+
+def aarch64_ssa_divi(instruction, allocation):
+    value, divisor = instruction.operands
+    result = instruction.result
+    lines, source = aarch64_source(value, allocation, "x9")
+    register = aarch64_target(result, allocation, "x9")
+    shift = power_of_two(abs(divisor))
+    if shift == 0:
+        lines += (f"mov {register}, {source}",)
+    elif shift is not None:
+        # Negative dividends are biased by divisor - 1, so the
+        # shift truncates towards zero
+        lines += (
+            f"asr x16, {source}, #63",
+            f"add x16, {source}, x16, lsr #{64 - shift}",
+            f"asr {register}, x16, #{shift}",
+        )
+    else:
+        number, shift = strength.magic(abs(divisor))
+        lines += (
+            *aarch64_move("x16", number),
+            f"smulh x16, {source}, x16",
+        )
+        if number < 0:
+            lines += (f"add x16, x16, {source}",)
+        if shift:
+            lines += (f"asr x16, x16, #{shift}",)
+        lines += (f"add {register}, x16, x16, lsr #63",)
+    if divisor < 0:
+        lines += (f"neg {register}, {register}",)
+    return (*lines, *aarch64_spill(result, allocation, register))
+
+
+def aarch64_ssa_madd(instruction, allocation):
+    lhs, rhs, addend = instruction.operands
+    result = instruction.result
+    lhs_lines, lhs = aarch64_source(lhs, allocation, "x9")
+    rhs_lines, rhs = aarch64_source(rhs, allocation, "x10")
+    # Loaded last, spilled slots far from sp are addressed in x16
+    addend_lines, addend = aarch64_source(
+        addend, allocation, "x16"
+    )
+    register = aarch64_target(result, allocation, "x9")
+    return (
+        *lhs_lines,
+        *rhs_lines,
+        *addend_lines,
+        f"madd {register}, {lhs}, {rhs}, {addend}",
+        *aarch64_spill(result, allocation, register),
+    )
+
+
+def aarch64_move(register, value):
+    if 0 <= value < 2**16:
+        return (f"mov {register}, #{value}",)
+    return (f"ldr {register}, ={value}",)
+
+
+AARCH64_ARITHMETIC = {
+    "add": "add",
+    "sub": "sub",
+    "mul": "mul",
+    "div": "sdiv",
+}
+
+AARCH64_SSA_EMITTERS = {
+    "const": aarch64_ssa_const,
+    "parameter": aarch64_ssa_parameter,
+    "load": aarch64_ssa_load,
+    "store": aarch64_ssa_store,
+    "add": aarch64_ssa_arithmetic,
+    "sub": aarch64_ssa_arithmetic,
+    "mul": aarch64_ssa_arithmetic,
+    "div": aarch64_ssa_arithmetic,
+    "pow": aarch64_ssa_pow,
+    "muli": aarch64_ssa_muli,
+    "divi": aarch64_ssa_divi,
+    "madd": aarch64_ssa_madd,
+    "call": aarch64_ssa_call,
+    "tailcall": aarch64_ssa_tailcall,
+    "ret": aarch64_ssa_ret,
+}
+
+
+def split_factor(factor):
+    # Odd part of a positive factor and the power of two left
+    shift = (factor & -factor).bit_length() - 1
+    return factor >> shift, shift
+
+
+def power_of_two(value):
+    # Exponent of a power of two, None for other values
+    if value > 0 and value & (value - 1) == 0:
+        return value.bit_length() - 1
+    return None
+
+
+def power_labels(instruction, allocation):
+    # Local labels of the loop computing a power
+    prefix = f".L{allocation.function.name}.{instruction.result.index}"
+    return f"{prefix}.loop", f"{prefix}.skip"
+
+
+def frame_size(allocation):
+    # One slot per spill and saved register, keeping sp 16 byte
+    # aligned
+    return -(-8 * allocation.frame() // 16) * 16
 
 
 def render(lines):
@@ -120,7 +1180,7 @@ def code_gen_aaarch64(ast):
     lines += code_gen_functions(ast)
     lines += ["_start:"]
     lines += code_gen_statements(ast.statements)
-    return "\n".join(lines) + "\n"
+    return render(peephole.optimise(lines, Arch.aarch64))
 
 
 def data_section(ast, count=0):
@@ -168,6 +1228,7 @@ def code_gen_functions(ast):
 
 def code_gen_statements(statements):
     lines = []
+    statements = dce.live_statements(statements)
     # Stack allocate space for variables
     declarations = []
     for statement in statements:
@@ -240,8 +1301,9 @@ def code_gen_statements(statements):
         elif isinstance(statement, NodeBlock):
             lines += code_gen_block(statement)
 
-    # Restore stack pointer
-    if size_in_bytes > 0:
+    # Restore stack pointer, unless the block exits
+    exits = statements and isinstance(statements[-1], NodeExit)
+    if size_in_bytes > 0 and not exits:
         lines += [
             line(
                 "add",
@@ -0,0 +1,174 @@
+"""
+Dead code elimination
+
+Code is straight-line, so liveness is a single backward scan: a let
+is live when a later statement reads its name before it is bound
+again, and everything after an exit or a return is unreachable.
+"""
+
+from compiler import parser
+from compiler.fold import VALUES, symbols
+from compiler.ir import Expression, Opcode
+
+# Instructions kept in unreachable code, they close functions and
+# lay out sections rather than run
+STRUCTURE = {
+    Opcode.GLOBAL,
+    Opcode.SECTION,
+    Opcode.LABEL,
+    Opcode.INT,
+    Opcode.EPILOG,
+    Opcode.RET,
+}
+
+
+def eliminate(instructions):
+    """IR without unreachable code and unused lets"""
+    return live(reachable(instructions))
+
+
+def reachable(instructions):
+    """Instructions that can run, and those structuring the program
+
+    Code after an exit or a return is unreachable until the next
+    label. Sections are tracked apart, as visit_stream interleaves
+    the text of functions with that of _start.
+    """
+    dead = {}
+    section = None
+    for instruction in instructions:
+        op = instruction[0]
+        if op == Opcode.SECTION:
+            section = (instruction[1], instruction[2])
+        elif op == Opcode.LABEL:
+            dead[section] = False
+        elif dead.get(section) and op not in STRUCTURE:
+            continue
+        if op == Opcode.EXIT or op == Opcode.RETURN:
+            dead[section] = True
+        yield instruction
+
+
+def live(instructions):
+    """Instructions without the lets that are never read
+
+    Lets assigned with = are scanned backwards between labels, a
+    name read in a region before any let binds it there reads the
+    global. Data section ints are kept when any code reads them.
+    Lets calling a function are kept for the call.
+    """
+    instructions = list(instructions)
+    keep = [True] * len(instructions)
+    used = set()
+    reading = set()
+    for index in range(len(instructions) - 1, -1, -1):
+        op, arg1, arg2, _ = instructions[index]
+        if op == Opcode.LABEL:
+            used |= reading
+            reading = set()
+        elif op == Opcode.ASSIGN:
+            if arg1 in reading or calls(arg2):
+                reading.discard(arg1)
+                reading.update(symbols(arg2))
+            else:
+                keep[index] = False
+        elif op in VALUES and op != Opcode.INT:
+            reading.update(
+                symbols(instructions[index][VALUES[op]])
+            )
+    used |= reading
+    # Ints may be read by ints defined after them
+    for index in range(len(instructions) - 1, -1, -1):
+        op, arg1, arg2, _ = instructions[index]
+        if op == Opcode.INT:
+            if arg1 in used:
+                used.update(symbols(arg2))
+            else:
+                keep[index] = False
+    return [
+        instruction
+        for instruction, kept in zip(instructions, keep)
+        if kept
+    ]
+
+
+def calls(value):
+    pending = [value]
+    while pending:
+        value = pending.pop()
+        kind = type(value)
+        if kind is list:
+            return True
+        elif kind is Expression:
+            pending += (value.lhs, value.rhs)
+    return False
+
+
+def live_statements(statements):
+    """Statements of a block that run and whose lets are read
+
+    Statements after an exit or a return are dropped, then lets
+    are dropped scanning backwards as in live. Function names and
+    let identifiers are definitions rather than reads.
+    """
+    statements = list(statements)
+    for index, statement in enumerate(statements):
+        if isinstance(
+            statement, (parser.NodeExit, parser.NodeReturn)
+        ):
+            del statements[index + 1 :]
+            break
+    reading = set()
+    kept = []
+    for statement in reversed(statements):
+        if isinstance(statement, parser.NodeLet):
+            name = statement.identifier.token.text
+            if name not in reading and not has_call(
+                statement.value
+            ):
+                continue
+            reading.discard(name)
+        reading.update(reads(statement))
+        kept.append(statement)
+    kept.reverse()
+    return kept
+
+
+def reads(node):
+    """Names of the identifiers a statement reads"""
+    names = set()
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            pending += node
+        elif isinstance(node, parser.NodeIdentifier):
+            names.add(node.token.text)
+        elif isinstance(node, parser.NodeLet):
+            pending.append(node.value)
+        elif isinstance(node, parser.NodeCall):
+            pending.append(node.values)
+        elif isinstance(node, parser.NodeFunction):
+            pending += node.body.statements
+        elif isinstance(node, parser.NodeBlock):
+            pending += node.statements
+        elif isinstance(node, parser.NodeBinOp):
+            pending += (node.lhs, node.rhs)
+        elif isinstance(node, parser.NodeExit):
+            pending.append(node.status)
+        elif isinstance(node, parser.NodeReturn):
+            pending.append(node.expression)
+        elif isinstance(node, parser.NodePrint):
+            pending.append(node.message)
+    return names
+
+
+def has_call(node):
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, parser.NodeCall):
+            return True
+        elif isinstance(node, parser.NodeBinOp):
+            pending += (node.lhs, node.rhs)
+    return False
@@ -0,0 +1,242 @@
+"""
+Static ELF executables
+
+An assembler.Object is linked and written as a static executable,
+as as and gcc -nostdlib -static would make of the same assembly.
+Text, with the headers before it, is loaded read and execute and
+data read and write, each in a segment of its own. Symbols go in a
+symbol table, so the executable disassembles with its labels.
+"""
+
+import os
+import struct
+from compiler import assembler
+from compiler.arch import Arch
+
+# Where the text segment is loaded, as ld places it
+BASE = 0x400000
+
+MACHINES = {Arch.x86_64: 62, Arch.aarch64: 183}
+
+# Largest page size of the architecture, segments are aligned to it
+PAGES = {Arch.x86_64: 0x1000, Arch.aarch64: 0x10000}
+
+HEADER = struct.Struct("<16sHHIQQQIHHHHHH")
+SEGMENT = struct.Struct("<IIQQQQQQ")
+SECTION = struct.Struct("<IIQQQQIIQQ")
+SYMBOL = struct.Struct("<IBBHQQ")
+
+PT_LOAD = 1
+PF_X, PF_W, PF_R = 1, 2, 4
+SHT_PROGBITS, SHT_SYMTAB, SHT_STRTAB = 1, 2, 3
+SHF_WRITE, SHF_ALLOC, SHF_EXECINSTR = 1, 2, 4
+STB_LOCAL, STB_GLOBAL = 0, 1
+
+
+def write(program, arch: Arch, path):
+    """Write program as an executable at path"""
+    with open(path, "wb") as stream:
+        stream.write(executable(program, arch))
+    os.chmod(path, 0o755)
+
+
+def executable(program, arch: Arch):
+    """Bytes of a static executable of program, entered at _start"""
+    if "_start" not in program.symbols:
+        raise assembler.AssemblerError("No _start symbol")
+    align = PAGES[arch]
+    text = program.sections.get("text", b"")
+    data = program.sections.get("data", b"")
+    segments = 2 if data else 1
+    # Text follows the headers in the first segment
+    text_offset = HEADER.size + segments * SEGMENT.size
+    data_offset = -(-(text_offset + len(text)) // 16) * 16
+    # Data starts a page on, at the same offset in its page as in
+    # the file
+    data_address = (
+        -(-(BASE + data_offset) // align) * align
+        + data_offset % align
+    )
+    addresses = {
+        "text": BASE + text_offset,
+        "data": data_address,
+    }
+    sections = assembler.link(program, addresses)
+    headers = [
+        SEGMENT.pack(
+            PT_LOAD,
+            PF_R | PF_X,
+            0,
+            BASE,
+            BASE,
+            text_offset + len(text),
+            text_offset + len(text),
+            align,
+        )
+    ]
+    if data:
+        headers.append(
+            SEGMENT.pack(
+                PT_LOAD,
+                PF_R | PF_W,
+                data_offset,
+                data_address,
+                data_address,
+                len(data),
+                len(data),
+                align,
+            )
+        )
+    body = bytearray(b"".join(headers))
+    body += sections.get("text", b"")
+    body += bytes(data_offset - len(body) - HEADER.size)
+    body += sections.get("data", b"")
+    tables, table_offset, count = section_headers(
+        program,
+        addresses,
+        {"text": text_offset, "data": data_offset},
+        HEADER.size + len(body),
+    )
+    section, offset = program.symbols["_start"]
+    header = HEADER.pack(
+        b"\x7fELF\x02\x01\x01" + bytes(9),
+        2,  # ET_EXEC
+        MACHINES[arch],
+        1,
+        addresses[section] + offset,
+        HEADER.size,
+        table_offset,
+        0,
+        HEADER.size,
+        SEGMENT.size,
+        segments,
+        SECTION.size,
+        count,
+        count - 1,  # .shstrtab is last
+    )
+    return bytes(header + body + tables)
+
+
+def section_headers(program, addresses, offsets, start):
+    """Symbol and string tables and the section header table
+    following them, the header table's offset and its entries"""
+    names = Strings()
+    headers = [bytes(SECTION.size)]
+    indices = {}
+    for name, flags in (
+        ("text", SHF_ALLOC | SHF_EXECINSTR),
+        ("data", SHF_ALLOC | SHF_WRITE),
+    ):
+        code = program.sections.get(name, b"")
+        if not code:
+            continue
+        indices[name] = len(headers)
+        headers.append(
+            SECTION.pack(
+                names.add(f".{name}"),
+                SHT_PROGBITS,
+                flags,
+                addresses[name],
+                offsets[name],
+                len(code),
+                0,
+                0,
+                16 if name == "text" else 8,
+                0,
+            )
+        )
+    # Locals come before globals in a symbol table
+    strings = Strings()
+    symbols = [bytes(SYMBOL.size)]
+    ordered = sorted(
+        program.symbols.items(),
+        key=lambda item: item[0] in program.globals,
+    )
+    first_global = len(symbols) + sum(
+        name not in program.globals for name, _ in ordered
+    )
+    for name, (section, offset) in ordered:
+        binding = (
+            STB_GLOBAL if name in program.globals else STB_LOCAL
+        )
+        symbols.append(
+            SYMBOL.pack(
+                strings.add(name),
+                binding << 4,
+                0,
+                indices.get(section, 0xFFF1),
+                addresses[section] + offset,
+                0,
+            )
+        )
+    symbol_table = b"".join(symbols)
+    symbol_strings = strings.bytes()
+    table = len(headers)
+    headers.append(
+        SECTION.pack(
+            names.add(".symtab"),
+            SHT_SYMTAB,
+            0,
+            0,
+            start,
+            len(symbol_table),
+            table + 1,
+            first_global,
+            8,
+            SYMBOL.size,
+        )
+    )
+    headers.append(
+        SECTION.pack(
+            names.add(".strtab"),
+            SHT_STRTAB,
+            0,
+            0,
+            start + len(symbol_table),
+            len(symbol_strings),
+            0,
+            0,
+            1,
+            0,
+        )
+    )
+    name = names.add(".shstrtab")
+    section_names = names.bytes()
+    offset = start + len(symbol_table) + len(symbol_strings)
+    headers.append(
+        SECTION.pack(
+            name,
+            SHT_STRTAB,
+            0,
+            0,
+            offset,
+            len(section_names),
+            0,
+            0,
+            1,
+            0,
+        )
+    )
+    tables = symbol_table + symbol_strings + section_names
+    padding = bytes(-(start + len(tables)) % 8)
+    tables += padding
+    return (
+        tables + b"".join(headers),
+        start + len(tables),
+        len(headers),
+    )
+
+
+class Strings:
+    """A string table, offsets of names added to it"""
+
+    def __init__(self):
+        self.data = bytearray(1)
+
+    def add(self, name):
+        offset = len(self.data)
+        self.data += name.encode() + b"\0"
+        return offset
+
+    def bytes(self):
+        return bytes(self.data)
@@ -0,0 +1,196 @@
+"""
+Constant folding and propagation over the IR
+"""
+
+from collections import namedtuple
+from compiler.ir import Expression, Instruction, Opcode, evaluate
+
+# Position of the value operand of instructions that have one
+VALUES = {
+    Opcode.INT: 2,
+    Opcode.ASSIGN: 2,
+    Opcode.EXIT: 1,
+    Opcode.PRINT: 1,
+    Opcode.RETURN: 1,
+    Opcode.STORE_PARAMETER: 2,
+}
+
+# Marks where an operator is applied while folding an expression
+Apply = namedtuple("Apply", "operator")
+
+
+def fold(instructions):
+    """Propagate constants and drop the lets they came from
+
+    A let whose value is known and whose name is no longer used
+    after propagation is removed, as is a section left empty by
+    that.
+    """
+    instructions = list(propagate(instructions))
+    used = references(instructions)
+    region = 0
+    kept = []
+    for instruction in instructions:
+        op = instruction[0]
+        if op == Opcode.LABEL:
+            region += 1
+        elif type(instruction[2]) is int and (
+            op == Opcode.INT
+            and instruction[1] not in used
+            or op == Opcode.ASSIGN
+            and (region, instruction[1]) not in used
+        ):
+            continue
+        kept.append(instruction)
+    return prune_sections(kept)
+
+
+def propagate(instructions):
+    """Substitute known let values into later uses and fold them
+
+    Globals, the data section ints, are known from their definition
+    on. Lets assigned with = are known until the next label and
+    shadow globals of the same name, as do parameters.
+    """
+    known = {}
+    local = {}
+    for instruction in instructions:
+        op = instruction[0]
+        if op == Opcode.LABEL:
+            local = {}
+        elif op == Opcode.PARAMETER:
+            # Parameters shadow globals with unknown values
+            local[instruction[3]] = None
+        position = VALUES.get(op)
+        if position is None:
+            yield instruction
+            continue
+        value = instruction[position]
+        folded = fold_value(value, known, local)
+        if folded is not value:
+            operands = list(instruction)
+            operands[position] = folded
+            instruction = Instruction(*operands)
+        if op == Opcode.INT:
+            if type(folded) is int:
+                known[instruction[1]] = folded
+        elif op == Opcode.ASSIGN:
+            # None shadows a global with an unknown value
+            local[instruction[1]] = (
+                folded if type(folded) is int else None
+            )
+        yield instruction
+
+
+def fold_value(value, known, local):
+    """Value with known symbols substituted and operations folded
+
+    Expressions are folded with an explicit stack, as in
+    ir.visit_expression, so deep trees do not recurse.
+    """
+    kind = type(value)
+    if kind is str:
+        return lookup(value, known, local)
+    elif kind is list:
+        # The instructions of a call used as a value
+        return list(propagate_call(value, known, local))
+    elif kind is not Expression:
+        return value
+    values = []
+    pending = [value]
+    while pending:
+        item = pending.pop()
+        kind = type(item)
+        if kind is Expression:
+            pending += (Apply(item.operator), item.rhs, item.lhs)
+        elif kind is Apply:
+            rhs = values.pop()
+            lhs = values[-1]
+            folded = None
+            if type(lhs) is int and type(rhs) is int:
+                folded = evaluate(item.operator, lhs, rhs)
+            if folded is None:
+                folded = Expression(item.operator, lhs, rhs)
+            values[-1] = folded
+        else:
+            values.append(fold_value(item, known, local))
+    return values.pop()
+
+
+def propagate_call(instructions, known, local):
+    for instruction in instructions:
+        position = VALUES.get(instruction[0])
+        if position is not None:
+            operands = list(instruction)
+            operands[position] = fold_value(
+                operands[position], known, local
+            )
+            instruction = Instruction(*operands)
+        yield instruction
+
+
+def lookup(symbol, known, local):
+    if symbol in local:
+        value = local[symbol]
+        return symbol if value is None else value
+    return known.get(symbol, symbol)
+
+
+def references(instructions):
+    """Names used as values by instructions
+
+    A use of a let assigned earlier in the same region, the code
+    between two labels, is a (region, name) pair, other uses are
+    of the global name.
+    """
+    used = set()
+    region = 0
+    assigned = set()
+    for instruction in instructions:
+        op = instruction[0]
+        if op == Opcode.LABEL:
+            region += 1
+            assigned = set()
+        if op not in VALUES:
+            continue
+        for name in symbols(instruction[VALUES[op]]):
+            used.add(
+                (region, name) if name in assigned else name
+            )
+        if op == Opcode.ASSIGN:
+            assigned.add(instruction[1])
+    return used
+
+
+def symbols(value):
+    pending = [value]
+    while pending:
+        value = pending.pop()
+        kind = type(value)
+        if kind is str:
+            yield value
+        elif kind is Expression:
+            pending += (value.lhs, value.rhs)
+        elif kind is list:
+            pending += (
+                instruction[VALUES[instruction[0]]]
+                for instruction in value
+                if instruction[0] in VALUES
+            )
+
+
+def prune_sections(instructions):
+    # A section directive directly followed by another is empty
+    return [
+        instruction
+        for instruction, following in zip(
+            instructions, [*instructions[1:], None]
+        )
+        if not (
+            instruction[0] == Opcode.SECTION
+            and (
+                following is None
+                or following[0] == Opcode.SECTION
+            )
+        )
+    ]
@@ -0,0 +1,340 @@
+"""
+Inlining of small functions at their call sites
+
+A function inlines when its live body is lets then a return, and
+its return value, with the lets and the calls it makes substituted,
+has no calls left. A recursive function keeps the call to itself
+and so never inlines. Constant folding then collapses the values
+inlined with constant arguments. Functions left without callers
+by inlining are dropped.
+"""
+
+from collections import namedtuple
+from dataclasses import replace
+from compiler import dce
+from compiler.parser import (
+    NodeBinOp,
+    NodeBlock,
+    NodeCall,
+    NodeExit,
+    NodeFunction,
+    NodeIdentifier,
+    NodeLet,
+    NodePrint,
+    NodeReturn,
+)
+
+# Nodes an inlined value may add to a call site over the call. A
+# call costs about as many instructions in parameter moves, the
+# prolog, the epilog and the return.
+BUDGET = 16
+
+# Return value of a function in terms of its parameters, with the
+# global names it reads
+Template = namedtuple("Template", "parameters expression free")
+
+# Marks where a binary operation is rebuilt from its operands
+Rebuild = namedtuple("Rebuild", "node")
+
+
+def inline(program):
+    """Program with small functions inlined at their call sites"""
+    functions = {
+        statement.identifier.token.text: statement
+        for statement in program.statements
+        if isinstance(statement, NodeFunction)
+    }
+    inliner = Inliner(functions)
+    statements = inliner.statements(program.statements, None)
+    # Inlined functions no call is left to are dropped
+    inlined = {
+        name
+        for name, template in inliner.templates.items()
+        if template is not None
+    }
+    while True:
+        unused = inlined - callees(statements)
+        kept = [
+            statement
+            for statement in statements
+            if not (
+                isinstance(statement, NodeFunction)
+                and statement.identifier.token.text in unused
+            )
+        ]
+        if len(kept) == len(statements):
+            break
+        statements = kept
+    return replace(program, statements=statements)
+
+
+def inline_stream(statements):
+    """Top-level statements with calls inlined as each arrives
+
+    As inline, but only a function defined before a call can inline
+    there. A function that may inline is held back until a call to
+    it is left, or dropped if none is, as inline drops it. One
+    called before its definition is emitted when defined.
+    """
+    inliner = Inliner({})
+    # Functions held back, and the names called so far
+    held = {}
+    called = set()
+    for statement in statements:
+        if isinstance(statement, NodeFunction):
+            name = statement.identifier.token.text
+            inliner.functions[name] = statement
+            (statement,) = inliner.statements([statement], None)
+            if (
+                name not in called
+                and inliner.template(name) is not None
+            ):
+                held[name] = statement
+                continue
+            result = [statement]
+        else:
+            result = inliner.statements([statement], None)
+        # Held functions still called, and the ones they call
+        needed = []
+        pending = callees(result)
+        while pending:
+            name = pending.pop()
+            if name in called:
+                continue
+            called.add(name)
+            if name in held:
+                needed.append(held.pop(name))
+                pending |= callees(needed[-1:])
+        yield from needed
+        yield from result
+
+
+class Inliner:
+    def __init__(self, functions):
+        self.functions = functions
+        self.templates = {}
+        # Functions whose templates are being built, a call to one
+        # of them is recursive
+        self.building = set()
+        # Call sites inlined
+        self.inlined = 0
+
+    def statements(self, statements, local):
+        """Statements with calls inlined
+
+        local holds the names bound in the enclosing function or
+        block, None at the top level where lets are global.
+        """
+        result = []
+        for statement in statements:
+            if isinstance(statement, NodeFunction):
+                parameters = {
+                    p.token.text for p in statement.parameters
+                }
+                body = self.statements(
+                    statement.body.statements, parameters
+                )
+                statement = replace(
+                    statement, body=NodeBlock(body)
+                )
+            elif isinstance(statement, NodeBlock):
+                statement = NodeBlock(
+                    self.statements(
+                        statement.statements, set(local or ())
+                    )
+                )
+            elif isinstance(statement, NodeLet):
+                statement = replace(
+                    statement,
+                    value=self.expression(
+                        statement.value, local
+                    ),
+                )
+                if local is not None:
+                    local.add(statement.identifier.token.text)
+            elif isinstance(statement, NodeExit):
+                statement = NodeExit(
+                    self.expression(statement.status, local)
+                )
+            elif isinstance(statement, NodeReturn):
+                statement = NodeReturn(
+                    self.expression(statement.expression, local)
+                )
+            elif isinstance(statement, NodePrint):
+                statement = NodePrint(
+                    self.expression(statement.message, local)
+                )
+            elif isinstance(statement, NodeCall):
+                statement = self.expression(statement, local)
+                if not isinstance(statement, NodeCall):
+                    # The value of a call without effects is unused
+                    continue
+            result.append(statement)
+        return result
+
+    def expression(self, node, local):
+        return transform(
+            node, lambda leaf: self.call(leaf, local)
+        )
+
+    def call(self, node, local):
+        """Inlined value of a call, or the call"""
+        if not isinstance(node, NodeCall):
+            return node
+        values = [self.expression(v, local) for v in node.values]
+        template = self.template(node.identifier.token.text)
+        if (
+            template is not None
+            and len(values) == len(template.parameters)
+            and not any(map(dce.has_call, values))
+            and not (local and template.free & local)
+        ):
+            inlined = substitute(
+                template.expression,
+                dict(zip(template.parameters, values)),
+            )
+            if (
+                size(inlined)
+                <= 1 + sum(map(size, values)) + BUDGET
+            ):
+                self.inlined += 1
+                return inlined
+        return NodeCall(node.identifier, values)
+
+    def template(self, name):
+        if name not in self.templates:
+            if (
+                name in self.building
+                or name not in self.functions
+            ):
+                return None
+            self.building.add(name)
+            self.templates[name] = self.build(
+                self.functions[name]
+            )
+            self.building.remove(name)
+        return self.templates[name]
+
+    def build(self, function):
+        """Template of a function, None if it can not inline"""
+        parameters = [p.token.text for p in function.parameters]
+        statements = dce.live_statements(
+            function.body.statements
+        )
+        if not statements or not isinstance(
+            statements[-1], NodeReturn
+        ):
+            return None
+        *lets, ret = statements
+        local = set(parameters)
+        values = {}
+        for let in lets:
+            if not isinstance(let, NodeLet):
+                return None
+            name = let.identifier.token.text
+            value = self.expression(let.value, local)
+            if dce.has_call(value):
+                # Dropping the let would drop the call
+                return None
+            values[name] = substitute(value, values)
+            local.add(name)
+        expression = substitute(
+            self.expression(ret.expression, local), values
+        )
+        if dce.has_call(expression):
+            return None
+        free = names(expression) - set(parameters)
+        return Template(parameters, expression, free)
+
+
+def transform(node, leaf):
+    """Expression rebuilt with leaf applied to its leaves
+
+    Operations are rebuilt only when an operand changes. The tree
+    is walked with an explicit stack, as in ir.visit_expression.
+    """
+    values = []
+    pending = [node]
+    while pending:
+        item = pending.pop()
+        if isinstance(item, NodeBinOp):
+            pending += (Rebuild(item), item.rhs, item.lhs)
+        elif isinstance(item, Rebuild):
+            rhs = values.pop()
+            lhs = values.pop()
+            item = item.node
+            if lhs is not item.lhs or rhs is not item.rhs:
+                item = NodeBinOp(item.operator, lhs, rhs)
+            values.append(item)
+        else:
+            values.append(leaf(item))
+    return values.pop()
+
+
+def substitute(node, values):
+    """Expression with identifiers replaced by their values"""
+
+    def leaf(item):
+        if isinstance(item, NodeIdentifier):
+            return values.get(item.token.text, item)
+        return item
+
+    return transform(node, leaf)
+
+
+def leaves(node):
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, NodeBinOp):
+            pending += (node.lhs, node.rhs)
+        else:
+            yield node
+
+
+def size(node):
+    """Nodes of an expression, counting those of call arguments"""
+    total = 0
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        total += 1
+        if isinstance(node, NodeBinOp):
+            pending += (node.lhs, node.rhs)
+        elif isinstance(node, NodeCall):
+            pending += node.values
+    return total
+
+
+def callees(statements):
+    """Names of the functions statements call"""
+    names = set()
+    pending = list(statements)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, NodeCall):
+            names.add(node.identifier.token.text)
+            pending += node.values
+        elif isinstance(node, NodeBinOp):
+            pending += (node.lhs, node.rhs)
+        elif isinstance(node, NodeFunction):
+            pending += node.body.statements
+        elif isinstance(node, NodeBlock):
+            pending += node.statements
+        elif isinstance(node, NodeLet):
+            pending.append(node.value)
+        elif isinstance(node, NodeExit):
+            pending.append(node.status)
+        elif isinstance(node, NodeReturn):
+            pending.append(node.expression)
+        elif isinstance(node, NodePrint):
+            pending.append(node.message)
+    return names
+
+
+def names(node):
+    return {
+        leaf.token.text
+        for leaf in leaves(node)
+        if isinstance(leaf, NodeIdentifier)
+    }
@@ -2,134 +2,322 @@
 Intermediate representation
 """
 
+from collections import namedtuple
+from enum import Enum
+from functools import lru_cache
+from operator import add, mul, sub
 from compiler import parser
 
 
+class Opcode(str, Enum):
+    GLOBAL = "global"
+    SECTION = "section"
+    LABEL = "label"
+    INT = "int"
+    ASSIGN = "="
+    EXIT = "exit"
+    PRINT = "print"
+    RETURN = "return"
+    CALL = "call"
+    RET = "ret"
+    STORE_PARAMETER = "store_parameter"
+    PROLOG = "prolog"
+    PARAMETER = "parameter"
+    EPILOG = "epilog"
+
+    # Hash as the plain string so that emitter tables keyed by
+    # opcode also find instructions spelled as strings
+    __hash__ = str.__hash__
+
+
+# Instructions compare equal to the plain 4-tuples they replace, and
+# passes rewrite them with _replace
+Instruction = namedtuple("Instruction", "op arg1 arg2 result")
+
+
+# Operands are ints for immediates and strs for symbols, see
+# operand_kind, so the common kinds cost nothing over plain values
+Register = namedtuple("Register", "index")
+StackSlot = namedtuple("StackSlot", "area index size")
+# An operation on operands not known while lowering, see ARITHMETIC
+Expression = namedtuple("Expression", "operator lhs rhs")
+
+
+class OperandKind(Enum):
+    IMMEDIATE = "immediate"
+    REGISTER = "register"
+    STACK_SLOT = "stack slot"
+    SYMBOL = "symbol"
+    EXPRESSION = "expression"
+
+
+OPERAND_KINDS = {
+    int: OperandKind.IMMEDIATE,
+    Register: OperandKind.REGISTER,
+    StackSlot: OperandKind.STACK_SLOT,
+    str: OperandKind.SYMBOL,
+    Expression: OperandKind.EXPRESSION,
+}
+
+
+def operand_kind(operand):
+    return OPERAND_KINDS.get(type(operand))
+
+
+# Instructions are immutable, so equal ones built close together
+# share one object
+shared = lru_cache(maxsize=1024)(Instruction)
+FLAT = {int, str, type(None), Register, StackSlot}
+
+
+def instruction(op, arg1, arg2, result):
+    # Expressions are not shared, hashing deep ones would recurse,
+    # nor are the unhashable instructions of a call
+    if type(arg1) in FLAT and type(arg2) in FLAT:
+        return shared(op, arg1, arg2, result)
+    return Instruction(op, arg1, arg2, result)
+
+
 def visit_int(node):
     return int(node.token.text)
 
 
 def visit_expression(node):
-    if is_int(node):
-        return visit_int(node)
-    elif is_binop(node):
-        return visit_binop(node)
-    elif is_identifier(node):
-        return visit_identifier(node)
-    elif is_call(node):
-        return list(visit_call(node))
-    else:
-        raise Exception(node)
+    """Value of an expression tree
+
+    Evaluated with an explicit stack so that deeply nested trees do
+    not recurse. A binary operation pushes its operator beneath its
+    operands, once both operand values are on the values stack the
+    operator is applied to them.
+    """
+    leaf = EXPRESSIONS.get(type(node))
+    if leaf is not None:
+        return leaf(node)
+    leaves = EXPRESSIONS
+    binop, op = parser.NodeBinOp, parser.Op
+    values = []
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        kind = type(node)
+        if kind is binop:
+            pending += (node.operator, node.rhs, node.lhs)
+        elif kind is op:
+            rhs = values.pop()
+            values[-1] = visit_operator(node, values[-1], rhs)
+        elif kind in leaves:
+            values.append(leaves[kind](node))
+        else:
+            raise Exception(node)
+    return values.pop()
 
 
 def visit_binop(binop):
-    lhs = visit_expression(binop.lhs)
-    rhs = visit_expression(binop.rhs)
-    if binop.operator.operator == "+":
-        try:
-            return lhs + rhs
-        except TypeError:
-            return ("ADD", lhs, rhs)
-    elif binop.operator.operator == "*":
-        return lhs * rhs
+    return visit_expression(binop)
+
+
+def visit_operator(operator, lhs, rhs):
+    name = BINOPS[operator.operator]
+    if type(lhs) is int and type(rhs) is int:
+        value = evaluate(name, lhs, rhs)
+        if value is not None:
+            return value
+    return Expression(name, lhs, rhs)
+
+
+def evaluate(operator, lhs, rhs):
+    """Value of a binary operation on 64-bit integers
+
+    Results wrap around to signed 64 bits. None when the result is
+    undefined, for a division by zero or a negative exponent.
+    """
+    value = ARITHMETIC[operator](lhs, rhs)
+    if value is not None:
+        return wrap(value)
+
+
+def wrap(value):
+    return (value + 2**63) % 2**64 - 2**63
+
+
+def divide(lhs, rhs):
+    # Truncates towards zero like idiv and sdiv
+    if rhs == 0:
+        return None
+    quotient = abs(lhs) // abs(rhs)
+    return -quotient if (lhs < 0) != (rhs < 0) else quotient
+
+
+def power(lhs, rhs):
+    if rhs < 0:
+        return None
+    return pow(lhs, rhs, 2**64)
 
 
 def visit_statement(node, symbol_table=None):
-    if is_exit(node):
-        yield from visit_exit(node)
-    elif is_let(node):
-        yield from visit_let(node)
-    elif is_print(node):
-        yield from visit_print(node)
-    elif is_function(node):
-        yield from visit_function(node)
-    elif is_block(node):
-        yield from visit_block(node)
-    elif is_return(node):
-        yield from visit_return(node, symbol_table)
-    elif is_call(node):
-        yield from visit_call(node)
-    else:
-        raise Exception(node)
-
-
-def visit_exit(node):
-    status = visit_expression(node.status)
-    return [("exit", status, None, None)]
-
-
-def visit_print(node):
-    return visit_expression(node.message)
-
-
-def visit_let(node):
+    yield from visit_statements((node,), symbol_table)
+
+
+def visit_exit(node, symbol_table=None):
+    status = resolve(visit_expression(node.status), symbol_table)
+    return [instruction(Opcode.EXIT, status, None, None)]
+
+
+def visit_print(node, symbol_table=None):
+    message = resolve(
+        visit_expression(node.message), symbol_table
+    )
+    return [instruction(Opcode.PRINT, message, None, None)]
+
+
+def resolve(value, symbol_table):
+    """Value with a parameter's name, also as a call's argument,
+    replaced by its stack slot"""
+    if not symbol_table:
+        return value
+    if type(value) is str:
+        return symbol_table.get(value, value)
+    if type(value) is list:
+        return [
+            (
+                instruction(
+                    item.op,
+                    item.arg1,
+                    resolve(item.arg2, symbol_table),
+                    item.result,
+                )
+                if item.op == Opcode.STORE_PARAMETER
+                else item
+            )
+            for item in value
+        ]
+    return value
+
+
+def visit_let(node, symbol_table=None):
     expr = visit_expression(node.value)
-    yield (
-        "=",
+    yield instruction(
+        Opcode.ASSIGN,
         visit_identifier(node.identifier),
         expr,
         None,
     )
 
 
-def visit_function(node):
-    symbol_table = {}
+def visit_function(node, symbol_table=None):
+    """Scope of a function: its instructions and symbol table
 
-    yield ("label", node.identifier.token.text, None, None)
+    The body statements are returned among the instructions and
+    lowered by visit_statements.
+    """
+    symbol_table = {}
+    items = [
+        Instruction(
+            Opcode.LABEL,
+            visit_identifier(node.identifier),
+            None,
+            None,
+        )
+    ]
     if len(node.parameters) > 0:
-        yield ("prolog", 8 * len(node.parameters), None, None)
+        items.append(
+            shared(
+                Opcode.PROLOG,
+                8 * len(node.parameters),
+                None,
+                None,
+            )
+        )
     # Stack assign parameters
     for i, parameter in enumerate(node.parameters, 1):
-        symbol_table[parameter.token.text] = ("parameter", i, 8)
-        yield ("parameter", i, 8, None)
+        symbol_table[parameter.token.text] = StackSlot(
+            "parameter", i, 8
+        )
+        # The name lets passes over the IR tell parameters apart
+        # from globals of the same name
+        items.append(
+            shared(Opcode.PARAMETER, i, 8, parameter.token.text)
+        )
     # TODO: stack allocate local variables
-    for statement in node.body.statements:
-        yield from visit_statement(statement, symbol_table)
+    items += node.body.statements
     if len(node.parameters) > 0:
-        yield ("epilog", 8 * len(node.parameters), None, None)
-    yield ("ret", None, None, None)
+        items.append(
+            shared(
+                Opcode.EPILOG,
+                8 * len(node.parameters),
+                None,
+                None,
+            )
+        )
+    items.append(shared(Opcode.RET, None, None, None))
+    return items, symbol_table
 
 
-def visit_block(node):
-    yield from visit_statements(node.statements)
+def visit_block(node, symbol_table=None):
+    return node.statements, symbol_table
 
 
 def visit_identifier(node):
     return node.token.text
 
 
-def visit_statements(statements):
-    for statement in statements:
-        yield from visit_statement(statement)
+def visit_statements(statements, symbol_table=None):
+    """Instructions for a sequence of statements
+
+    Blocks and function bodies are scopes, see SCOPES, whose items
+    are pushed onto a work stack instead of being visited
+    recursively. Items are statements or instructions, which are
+    yielded as they are.
+    """
+    work = [(iter(statements), symbol_table)]
+    while work:
+        items, symbol_table = work[-1]
+        for item in items:
+            kind = type(item)
+            if kind is Instruction:
+                yield item
+            elif kind in SCOPES:
+                scope = SCOPES[kind](item, symbol_table)
+                work.append((iter(scope[0]), scope[1]))
+                break
+            elif kind in STATEMENTS:
+                yield from STATEMENTS[kind](item, symbol_table)
+            else:
+                raise Exception(item)
+        else:
+            work.pop()
 
 
 def visit_return(node, symbol_table=None):
-    symbol = visit_expression(node.expression)
-    if symbol in symbol_table:
-        status = symbol_table[symbol]
-    else:
-        status = symbol
-    yield (
-        "return",
+    status = resolve(
+        visit_expression(node.expression), symbol_table
+    )
+    yield instruction(
+        Opcode.RETURN,
         status,
         None,
         None,
     )
 
 
-def visit_call(node):
+def visit_call(node, symbol_table=None):
     for i, value in enumerate(node.values, 1):
-        yield (
-            "store_parameter",
-            i,
-            visit_expression(value),
-            None,
-        )
-    yield ("call", node.identifier.token.text, None, None)
+        value = resolve(visit_expression(value), symbol_table)
+        yield instruction(Opcode.STORE_PARAMETER, i, value, None)
+    yield shared(
+        Opcode.CALL,
+        visit_identifier(node.identifier),
+        None,
+        None,
+    )
+
+
+def visit_call_value(node):
+    return list(visit_call(node))
 
 
 def visit(ast):
-    yield ("global", "start", None, None)
+    yield Instruction(Opcode.GLOBAL, "start", None, None)
     if is_program(ast):
         # Global data
         lets = [
@@ -138,11 +326,11 @@ def visit(ast):
             if is_let(statement)
         ]
         if len(lets) > 0:
-            yield ("section", "data", None, None)
+            yield Instruction(Opcode.SECTION, "data", None, None)
             for let in lets:
-                yield (
-                    "int",
-                    let.identifier.token.text,
+                yield Instruction(
+                    Opcode.INT,
+                    visit_identifier(let.identifier),
                     visit_expression(let.value),
                     None,
                 )
@@ -153,13 +341,13 @@ def visit(ast):
             if not is_let(statement)
         ]
 
-        yield ("section", "text", None, None)
+        yield Instruction(Opcode.SECTION, "text", None, None)
         yield from visit_statements(
             statement
             for statement in statements
             if is_function(statement)
         )
-        yield ("label", "_start", None, None)
+        yield Instruction(Opcode.LABEL, "_start", None, None)
         yield from visit_statements(
             statement
             for statement in statements
@@ -167,6 +355,40 @@ def visit(ast):
         )
 
 
+def visit_stream(statements):
+    """Lower top-level statements one at a time as they arrive
+
+    Functions are emitted to the text section and all other code to
+    text subsection 1, which the assembler places after it, so _start
+    only runs top-level code however the two are interleaved.
+    """
+    yield Instruction(Opcode.GLOBAL, "start", None, None)
+    section = ("text", 1)
+    yield Instruction(Opcode.SECTION, *section, None)
+    yield Instruction(Opcode.LABEL, "_start", None, None)
+    for statement in statements:
+        if is_let(statement):
+            target = ("data", None)
+            instructions = [
+                Instruction(
+                    Opcode.INT,
+                    visit_identifier(statement.identifier),
+                    visit_expression(statement.value),
+                    None,
+                )
+            ]
+        elif is_function(statement):
+            target = ("text", None)
+            instructions = visit_statement(statement)
+        else:
+            target = ("text", 1)
+            instructions = visit_statement(statement)
+        if target != section:
+            section = target
+            yield Instruction(Opcode.SECTION, *section, None)
+        yield from instructions
+
+
 def is_program(node):
     return isinstance(node, parser.NodeProgram)
 
@@ -209,3 +431,41 @@ def is_return(node):
 
 def is_call(node):
     return isinstance(node, parser.NodeCall)
+
+
+BINOPS = {
+    "+": "ADD",
+    "-": "SUB",
+    "*": "MUL",
+    "/": "DIV",
+    "^": "POW",
+}
+
+ARITHMETIC = {
+    "ADD": add,
+    "SUB": sub,
+    "MUL": mul,
+    "DIV": divide,
+    "POW": power,
+}
+
+# Leaf expressions, binary operations are handled by visit_expression
+EXPRESSIONS = {
+    parser.NodeInt: visit_int,
+    parser.NodeIdentifier: visit_identifier,
+    parser.NodeCall: visit_call_value,
+}
+
+STATEMENTS = {
+    parser.NodeExit: visit_exit,
+    parser.NodeLet: visit_let,
+    parser.NodePrint: visit_print,
+    parser.NodeReturn: visit_return,
+    parser.NodeCall: visit_call,
+}
+
+# Statements containing statements, see visit_statements
+SCOPES = {
+    parser.NodeFunction: visit_function,
+    parser.NodeBlock: visit_block,
+}
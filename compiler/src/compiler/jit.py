@@ -0,0 +1,132 @@
+"""
+In-process x86_64 JIT
+
+The lines of code_gen.gas_lines are assembled by
+assembler.assemble, placed in memory mapped pages and called
+through ctypes. Text pages are made executable and data pages are
+left writable. A small runtime, itself assembled with the program,
+saves the host's stack on entry and lowers the exit system call to
+a return of the status, so the host process carries on.
+"""
+
+import ctypes
+import mmap
+import platform
+from compiler import assembler
+
+# Entered from ctypes, saves the registers the host expects kept
+# and the stack pointer, then runs _start. Falling off the end of
+# the program exits with 0. A system call other than exit goes to
+# the kernel.
+RUNTIME = """
+.text 2
+\tmov\t$0, %rdi
+\tmov\t$60, %rax
+\tcall\t__jit_syscall
+__jit_syscall:
+\tcmp\t$60, %rax
+\tjne\t__jit_kernel
+\tmov\t%rdi, %rax
+\tmov\t__jit_stack(%rip), %rsp
+\tpop\t%r15
+\tpop\t%r14
+\tpop\t%r13
+\tpop\t%r12
+\tpop\t%rbx
+\tpop\t%rbp
+\tret
+__jit_kernel:
+\tsyscall
+\tret
+__jit_entry:
+\tpush\t%rbp
+\tpush\t%rbx
+\tpush\t%r12
+\tpush\t%r13
+\tpush\t%r14
+\tpush\t%r15
+\tmov\t%rsp, __jit_stack(%rip)
+\tcall\t_start
+.data
+\t.balign 8
+__jit_stack: .quad 0
+"""
+
+PROT_READ, PROT_WRITE, PROT_EXEC = 1, 2, 4
+
+
+def available():
+    """Whether generated code can run on this host"""
+    return platform.machine() in ("x86_64", "AMD64")
+
+
+def lower_exit(lines):
+    """Lines with system calls sent through the runtime"""
+    for line in lines:
+        if line.strip() == "syscall":
+            yield "\tcall\t__jit_syscall"
+        else:
+            yield line
+
+
+class Program:
+    """A program compiled into executable memory
+
+    Calling it runs the program and returns its exit status, the
+    low byte as for a process. Data is reset before each run, so
+    runs are independent.
+    """
+
+    def __init__(self, lines):
+        if not available():
+            raise OSError(
+                f"JIT needs an x86_64 host, not {platform.machine()}"
+            )
+        program = assembler.assemble(
+            [*lower_exit(lines), *RUNTIME.splitlines()]
+        )
+        text = program.sections.get("text", b"")
+        data = program.sections.get("data", b"")
+        size = page(len(text)) + page(len(data))
+        self.memory = mmap.mmap(
+            -1, size, prot=PROT_READ | PROT_WRITE
+        )
+        buffer = ctypes.c_char.from_buffer(self.memory)
+        self.address = ctypes.addressof(buffer)
+        addresses = {
+            "text": self.address,
+            "data": self.address + page(len(text)),
+        }
+        sections = assembler.link(program, addresses)
+        self.memory[: len(text)] = sections["text"]
+        self.data = bytes(sections["data"])
+        self.data_address = addresses["data"]
+        ctypes.memmove(
+            self.data_address, self.data, len(self.data)
+        )
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.mprotect.argtypes = (
+            ctypes.c_void_p,
+            ctypes.c_size_t,
+            ctypes.c_int,
+        )
+        if libc.mprotect(
+            self.address, page(len(text)), PROT_READ | PROT_EXEC
+        ):
+            raise OSError(ctypes.get_errno(), "mprotect failed")
+        section, offset = program.symbols["__jit_entry"]
+        self.entry = ctypes.CFUNCTYPE(ctypes.c_int64)(
+            addresses[section] + offset
+        )
+        # Keeps the memory exported while the entry point lives
+        self.buffer = buffer
+
+    def __call__(self):
+        ctypes.memmove(
+            self.data_address, self.data, len(self.data)
+        )
+        return self.entry() & 0xFF
+
+
+def page(size):
+    return -(-max(size, 1) // mmap.PAGESIZE) * mmap.PAGESIZE
@@ -1,8 +1,16 @@
-from dataclasses import dataclass
-from enum import Enum
+from __future__ import annotations
+import re
+from array import array
+from sys import intern
+from bisect import bisect_left
+from collections import namedtuple
+from dataclasses import dataclass, field
+from enum import IntEnum
 
+Position = namedtuple("Position", "line column")
 
-class TokenKind(Enum):
+
+class TokenKind(IntEnum):
     COMMENT = 1
     LEFT_PAREN = 2
     RIGHT_PAREN = 3
@@ -25,14 +33,15 @@ class TokenKind(Enum):
     COMMA = 20
 
 
-@dataclass
+@dataclass(slots=True)
 class Token:
     kind: TokenKind
     text: str
+    offset: int = field(default=0, compare=False)
 
     @classmethod
     def identifier(cls, text: str):
-        return cls(kind=TokenKind.IDENTIFIER, text=text)
+        return cls(kind=TokenKind.IDENTIFIER, text=intern(text))
 
     @classmethod
     def int(cls, text: str):
@@ -43,111 +52,285 @@ class Token:
         return cls(kind=TokenKind.PLUS, text="+")
 
 
-def lex_comment(cursor, content):
-    begin = cursor
-    while cursor < len(content):
-        if content[cursor] == "\n":
-            break
-        cursor += 1
-    token = Token(
-        kind=TokenKind.COMMENT, text=content[begin : cursor + 1]
-    )
-    return cursor + 1, token
-
-
-def lex_int(cursor, content):
-    begin = cursor
-    while cursor < len(content):
-        if content[cursor].isdigit():
-            cursor += 1
-        else:
-            break
-    token = Token.int(content[begin:cursor])
-    return cursor, token
-
-
-def lex_identifier(cursor, content):
-    begin = cursor
-
-    # First char [a-zA-Z]
-    if not content[begin].isalpha():
-        return cursor, None
-
-    # All other chars [a-zA-Z0-9]
-    while cursor < len(content):
-        if content[cursor].isalnum():
-            cursor += 1
-        else:
-            break
-
-    token = Token.identifier(content[begin:cursor])
-    return cursor, token
-
-
-def lex_keyword(key, cursor, content):
-    kinds = {
-        "let": TokenKind.LET,
-        "exit": TokenKind.EXIT,
-        "fn": TokenKind.FUNCTION,
-        "print": TokenKind.PRINT,
-        "return": TokenKind.RETURN,
-    }
-    length = len(key)
-    token = Token(
-        kind=kinds[key],
-        text=content[cursor : cursor + length],
-    )
-    return cursor + length, token
+KEYWORDS = {
+    "let": TokenKind.LET,
+    "exit": TokenKind.EXIT,
+    "fn": TokenKind.FUNCTION,
+    "print": TokenKind.PRINT,
+    "return": TokenKind.RETURN,
+}
+
+
+SYMBOLS = {
+    ";": TokenKind.SEMICOLON,
+    "=": TokenKind.EQUAL,
+    "(": TokenKind.LEFT_PAREN,
+    ")": TokenKind.RIGHT_PAREN,
+    "{": TokenKind.OPEN_BRACE,
+    "}": TokenKind.CLOSE_BRACE,
+    "+": TokenKind.PLUS,
+    "-": TokenKind.MINUS,
+    "*": TokenKind.STAR,
+    "/": TokenKind.FORWARD_SLASH,
+    "^": TokenKind.CARET,
+    ",": TokenKind.COMMA,
+}
+
+
+# Token kinds for exact spellings, checked after a word or symbol has
+# been scanned in full so "letter" stays a single identifier
+SPELLINGS = {**KEYWORDS, **SYMBOLS}
+
+
+# One group per token class, tried in a single left-to-right scan.
+# Characters that match no group are skipped
+PATTERN = re.compile(
+    r"(#[^\n]*\n?)"
+    r"|([0-9]+)"
+    r"|([A-Za-z][A-Za-z0-9]*)"
+    r"|([;=(){}+\-*/^,])"
+)
+
+
+# Fallback kind for each PATTERN group when the spelling is not
+# a keyword or symbol
+GROUPS = (
+    None,
+    TokenKind.COMMENT,
+    TokenKind.INT,
+    TokenKind.IDENTIFIER,
+    None,
+)
+COMMENT_GROUP = 1
+
+
+# Byte-string equivalents for lexing bytes-like sources such as mmap
+BYTES_PATTERN = re.compile(PATTERN.pattern.encode())
+BYTES_SPELLINGS = {
+    spelling.encode(): kind
+    for spelling, kind in SPELLINGS.items()
+}
 
 
 def lex(content):
-    cursor = 0
-    chars = {
-        ";": TokenKind.SEMICOLON,
-        "=": TokenKind.EQUAL,
-        "(": TokenKind.LEFT_PAREN,
-        ")": TokenKind.RIGHT_PAREN,
-        "{": TokenKind.OPEN_BRACE,
-        "}": TokenKind.CLOSE_BRACE,
-        "+": TokenKind.PLUS,
-        "-": TokenKind.MINUS,
-        "*": TokenKind.STAR,
-        "/": TokenKind.FORWARD_SLASH,
-        "^": TokenKind.CARET,
-        ",": TokenKind.COMMA,
-    }
-    while cursor < len(content):
-        if content[cursor] == "#":
-            cursor, token = lex_comment(cursor, content)
-            yield token
-        elif content[cursor].isdigit():
-            cursor, token = lex_int(cursor, content)
-            yield token
-        elif content[cursor:].startswith("exit"):
-            cursor, token = lex_keyword("exit", cursor, content)
-            yield token
-        elif content[cursor:].startswith("let"):
-            cursor, token = lex_keyword("let", cursor, content)
-            yield token
-        elif content[cursor:].startswith("fn"):
-            cursor, token = lex_keyword("fn", cursor, content)
-            yield token
-        elif content[cursor:].startswith("print"):
-            cursor, token = lex_keyword("print", cursor, content)
-            yield token
-        elif content[cursor:].startswith("return"):
-            cursor, token = lex_keyword(
-                "return", cursor, content
-            )
-            yield token
-        elif content[cursor].isalpha():
-            cursor, token = lex_identifier(cursor, content)
-            yield token
-        elif content[cursor] in chars:
-            token = Token(
-                kind=chars[content[cursor]], text=content[cursor]
+    for match in PATTERN.finditer(content):
+        text = match.group()
+        kind = SPELLINGS.get(text) or GROUPS[match.lastindex]
+        if kind == TokenKind.IDENTIFIER:
+            text = intern(text)
+        yield Token(kind, text, match.start())
+
+
+class LineIndex:
+    """Line and column lookup for offsets into a source string
+
+    Newline offsets are found on the first lookup, after which each
+    lookup is a binary search.
+    """
+
+    def __init__(self, content: str | bytes):
+        self.content = content
+        self._newlines = None
+
+    @property
+    def newlines(self) -> list[int]:
+        if self._newlines is None:
+            newline = (
+                "\n" if isinstance(self.content, str) else b"\n"
             )
-            yield token
-            cursor += 1
-        else:
-            cursor += 1
+            self._newlines = [
+                match.start()
+                for match in re.finditer(newline, self.content)
+            ]
+        return self._newlines
+
+    def position(self, offset: int) -> Position:
+        """1-based line and column of offset"""
+        newlines = self.newlines
+        line = bisect_left(newlines, offset)
+        if line == 0:
+            return Position(1, offset + 1)
+        return Position(line + 1, offset - newlines[line - 1])
+
+
+# TokenKind by code, cheaper than calling TokenKind(code)
+KINDS = (None, *TokenKind)
+
+
+class Tokens:
+    """Compact token stream over a source string
+
+    Token kinds are stored as codes in one array and token extents as
+    start/end offsets in two more, so text is only sliced out of the
+    source when a consumer asks for it.
+    """
+
+    def __init__(self, content: str):
+        self.content = content
+        self.lines = LineIndex(content)
+        self.kinds = array("B")
+        self.starts = array("q")
+        self.ends = array("q")
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index) -> Token:
+        return self.token(index)
+
+    def append(self, kind: TokenKind, start: int, end: int):
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def kind(self, index) -> TokenKind:
+        return KINDS[self.kinds[index]]
+
+    def text(self, index) -> str:
+        return self.content[
+            self.starts[index] : self.ends[index]
+        ]
+
+    def token(self, index) -> Token:
+        start = self.starts[index]
+        kind = KINDS[self.kinds[index]]
+        text = self.content[start : self.ends[index]]
+        if kind == TokenKind.IDENTIFIER:
+            text = intern(text)
+        return Token(kind, text, start)
+
+    def position(self, index) -> Position:
+        return self.lines.position(self.starts[index])
+
+    def has(self, index) -> bool:
+        return index < len(self.kinds)
+
+    def release(self, index):
+        # The whole source is already in memory
+        pass
+
+
+def tokenize(content: str) -> Tokens:
+    """Lex content into a Tokens buffer, dropping comments"""
+    tokens = Tokens(content)
+    kinds = tokens.kinds.append
+    starts = tokens.starts.append
+    ends = tokens.ends.append
+    spelling = SPELLINGS.get
+    for match in PATTERN.finditer(content):
+        group = match.lastindex
+        if group == COMMENT_GROUP:
+            continue
+        start, end = match.span()
+        kinds(spelling(content[start:end]) or GROUPS[group])
+        starts(start)
+        ends(end)
+    return tokens
+
+
+def spans(content, start: int = 0):
+    """Kind, start and end of each token in content from start
+
+    Content may be a str or any bytes-like object, including an mmap,
+    in which case offsets are byte offsets. Comments are skipped.
+    """
+    if isinstance(content, str):
+        pattern, spelling = PATTERN, SPELLINGS.get
+    else:
+        pattern, spelling = BYTES_PATTERN, BYTES_SPELLINGS.get
+    for match in pattern.finditer(content, start):
+        group = match.lastindex
+        if group == COMMENT_GROUP:
+            continue
+        start, end = match.span()
+        yield spelling(content[start:end]) or GROUPS[
+            group
+        ], start, end
+
+
+class Window:
+    """One column of a TokenStream indexed by absolute token index"""
+
+    def __init__(self, stream: TokenStream, values: list):
+        self.stream = stream
+        self.values = values
+
+    def __getitem__(self, index):
+        stream = self.stream
+        if not stream.has(index):
+            raise IndexError(index)
+        if index < stream.base:
+            raise IndexError(f"token {index} has been released")
+        return self.values[index - stream.base]
+
+
+class TokenStream:
+    """Tokens lexed on demand from a source, holding only a window
+
+    Offers the same interface as Tokens, but tokens are pulled from
+    the source as the parser looks ahead and dropped once the parser
+    calls release(), so memory is bounded by the largest statement
+    rather than by the size of the source.
+    """
+
+    def __init__(self, content, start: int = 0):
+        self.content = content
+        self.lines = LineIndex(content)
+        self.spans = spans(content, start)
+        self.base = 0
+        self.end = 0
+        self._kinds = []
+        self._starts = []
+        self._ends = []
+        self.kinds = Window(self, self._kinds)
+        self.starts = Window(self, self._starts)
+        self.ends = Window(self, self._ends)
+
+    def has(self, index) -> bool:
+        while index >= self.end:
+            try:
+                kind, start, end = next(self.spans)
+            except StopIteration:
+                return False
+            self._kinds.append(kind)
+            self._starts.append(start)
+            self._ends.append(end)
+            self.end += 1
+        return True
+
+    def close(self):
+        """Stop lexing, the source's buffer is no longer held"""
+        self.spans.close()
+
+    def release(self, index):
+        """Forget tokens before index"""
+        count = min(index, self.end) - self.base
+        if count > 0:
+            del self._kinds[:count]
+            del self._starts[:count]
+            del self._ends[:count]
+            self.base += count
+
+    def kind(self, index) -> TokenKind:
+        return KINDS[self.kinds[index]]
+
+    def text(self, index) -> str:
+        return decode(
+            self.content[self.starts[index] : self.ends[index]]
+        )
+
+    def token(self, index) -> Token:
+        kind = self.kind(index)
+        text = self.text(index)
+        if kind == TokenKind.IDENTIFIER:
+            text = intern(text)
+        return Token(kind, text, self.starts[index])
+
+    def position(self, index) -> Position:
+        return self.lines.position(self.starts[index])
+
+
+def decode(text) -> str:
+    if isinstance(text, str):
+        return text
+    return text.decode("ascii")
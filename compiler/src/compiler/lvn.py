@@ -0,0 +1,88 @@
+"""
+Local value numbering over SSA form
+
+An instruction is keyed by its op and its operands, once operands
+removed before it are replaced by the values that stand for them.
+An instruction whose key was seen earlier in the block computes the
+same value, so its uses take that value and it is removed. Keys are
+hashed, so each check is a dict lookup and the pass is linear in
+the number of instructions.
+"""
+
+from compiler.ssa import Value
+
+# Instructions whose value depends on their operands alone,
+# including those of strength.reduce
+PURE = {
+    "const",
+    "parameter",
+    "add",
+    "sub",
+    "mul",
+    "div",
+    "pow",
+    "muli",
+    "divi",
+    "madd",
+}
+
+COMMUTATIVE = {"add", "mul"}
+
+# Instructions that may store to globals, after which loads read
+# new values
+CALLS = {"call", "tailcall"}
+
+
+def number(module):
+    """Module with common subexpressions removed"""
+    for function in module.functions:
+        number_function(function)
+    return module
+
+
+def number_function(function):
+    """Remove recomputed values from a function's blocks
+
+    A load after a store of the same global takes the stored value.
+    The def-use chains are rebuilt from the instructions left.
+    """
+    replaced = {}
+    for block in function.blocks:
+        known = {}
+        # Loads are keyed by the number of calls before them
+        calls = 0
+        kept = []
+        for instruction in block.instructions:
+            operands = tuple(
+                (
+                    replaced.get(operand, operand)
+                    if type(operand) is Value
+                    else operand
+                )
+                for operand in instruction.operands
+            )
+            instruction.operands = operands
+            op = instruction.op
+            if op in PURE:
+                if op in COMMUTATIVE:
+                    operands = tuple(sorted(operands))
+                key = (op, *operands)
+            elif op == "load":
+                key = (op, *operands, calls)
+            else:
+                key = None
+            if key is not None:
+                value = known.get(key)
+                if value is not None:
+                    replaced[instruction.result] = value
+                    continue
+                known[key] = instruction.result
+            elif op == "store":
+                name, value = operands
+                known[("load", name, calls)] = value
+            elif op in CALLS:
+                calls += 1
+            kept.append(instruction)
+        block.instructions = kept
+    function.link()
+    return function
@@ -1,7 +1,33 @@
+import mmap
+import os
 import subprocess
+import sys
+from collections import Counter
+from contextlib import nullcontext
+from typing import Annotated
+import typer
 from compiler.arch import Arch
-from compiler.parser import parse
-from compiler import analyser, ir, code_gen
+from compiler.lexer import TokenStream
+from compiler.parser import parse, parse_statements
+from compiler import (
+    analyser,
+    assembler,
+    cache,
+    ir,
+    code_gen,
+    dce,
+    elf,
+    fold,
+    inline,
+    jit,
+    lvn,
+    peephole,
+    pseudo,
+    separate,
+    ssa,
+    strength,
+    vm,
+)
 
 
 def main(
@@ -9,47 +35,247 @@ def main(
     arch: Arch = Arch.aarch64,
     gcc_version: int = 11,
     dry_run: bool = False,
+    streaming: bool = False,
+    peephole_stats: bool = False,
+    run: bool = False,
+    # Named apart from the modules, the flags keep their names
+    use_jit: Annotated[
+        bool, typer.Option("--jit/--no-jit")
+    ] = False,
+    cache_dir: str = "",
+    cache_limit: int = cache.LIMIT,
+    cache_stats: bool = False,
+    separate_units: Annotated[
+        bool, typer.Option("--separate/--no-separate")
+    ] = False,
+    builtin: bool = False,
+    use_ssa: Annotated[
+        bool, typer.Option("--ssa/--no-ssa")
+    ] = False,
 ):
+    if use_ssa and (run or streaming or separate_units):
+        raise typer.BadParameter(
+            "--ssa builds the whole program natively, not with"
+            " --run, --streaming or --separate"
+        )
+    if run:
+        # Only the program's own output is printed
+        raise SystemExit(execute(instructions(src, streaming)))
+    if use_jit:
+        if use_ssa:
+            lines = ssa_lines(src, Arch.x86_64)
+        else:
+            lines = code_gen.gas_lines(
+                instructions(src, streaming)
+            )
+        raise SystemExit(execute_jit(lines))
     print(f"compiling: {src}")
-    with open(src, "r") as stream:
-        content = stream.read()
-
-    # Convert vinyl to assembly
-    ast = parse(content)
-
-    ast = analyser.analyse(ast)
-
-    instructions = ir.visit(ast)
-    if arch == Arch.aarch64:
-        code = code_gen.aarch64(instructions)
+    if separate_units and not dry_run:
+        store = cache.Cache(cache_dir or OBJECTS, cache_limit)
+        build_separate(src, arch, gcc_version, store)
+        report_cache(store, cache_stats)
+        return
+    store = key = None
+    outputs = BUILTIN_OUTPUTS if builtin else OUTPUTS
+    if cache_dir and not dry_run:
+        store = cache.Cache(cache_dir, cache_limit)
+        key = cache.key(
+            cache.file_digest(src),
+            arch=arch.value,
+            gcc_version=gcc_version,
+            streaming=streaming,
+            builtin=builtin,
+            ssa=use_ssa,
+        )
+        if store.restore(key, outputs):
+            report_cache(store, cache_stats)
+            return
+    if use_ssa:
+        lines = ssa_lines(src, arch)
     else:
-        code = code_gen.gas(instructions)
+        lines = backend(arch)(instructions(src, streaming))
+    hits = Counter()
+    lines = peephole.optimise(lines, arch, hits)
 
     if dry_run:
-        print(code)
+        for line in lines:
+            print(line)
+        report(hits, peephole_stats)
         return
 
     # content = code_gen(ast, arch)
+    if builtin:
+        # Read again by the assembler, others stream to the file
+        lines = list(lines)
     with open("vinyl.asm", "w") as stream:
-        stream.write(code)
+        for line in lines:
+            stream.write(line + "\n")
+    report(hits, peephole_stats)
+
+    if builtin:
+        # Encoded and linked in process, without as or gcc
+        program = assembler.assemble(lines, arch)
+        elf.write(program, arch, "vinyl.exe")
+    else:
+        assemble(arch, "vinyl.asm", "vinyl.o")
+        link(arch, gcc_version, ["vinyl.o"], "vinyl.exe")
+
+    if store is not None:
+        store.store(key, outputs)
+        report_cache(store, cache_stats)
+
 
-    # Compile
+# Files a build writes, the ones cached
+OUTPUTS = ("vinyl.asm", "vinyl.o", "vinyl.exe")
+BUILTIN_OUTPUTS = ("vinyl.asm", "vinyl.exe")
+
+# Cache of unit objects when none is given
+OBJECTS = "vinyl.objects"
+
+
+def assemble(arch: Arch, source: str, output: str):
     command = [
         f"{arch.value}-linux-gnu-as",
-        "vinyl.asm",
+        source,
         "-o",
-        "vinyl.o",
+        output,
         "-g",
     ]
     subprocess.check_call(command)
 
-    # Link
+
+def link(arch: Arch, gcc_version: int, objects, output: str):
     command = [
         f"{arch.value}-linux-gnu-gcc-{gcc_version}",
-        "vinyl.o",
+        *objects,
         "-o",
-        "vinyl.exe",
+        output,
         "-nostdlib",
         "-static",
     ]
     subprocess.check_call(command)
+
+
+def build_separate(
+    src: str, arch: Arch, gcc_version: int, store
+):
+    """Build vinyl.exe from an object per function, see
+    compiler.separate, assembling only those not in store"""
+    with open(src, "r") as stream:
+        ast = analyser.analyse(parse(stream.read()))
+    objects, rebuilt = separate.build(
+        ast,
+        arch,
+        store,
+        "vinyl.units",
+        lambda source, output: assemble(arch, source, output),
+    )
+    print(f"separate: {rebuilt} of {len(objects)} units rebuilt")
+    link(arch, gcc_version, objects, "vinyl.exe")
+
+
+def report(hits, enabled):
+    # Peephole rewrites per rule
+    if enabled:
+        for rule, count in sorted(hits.items()):
+            print(f"peephole: {rule} {count}")
+
+
+def report_cache(store, enabled):
+    if enabled:
+        stats = store.stats()
+        print(
+            f"cache: {stats.hits} hits {stats.misses} misses"
+            f" {stats.evictions} evictions"
+        )
+
+
+def instructions(src: str, streaming: bool = False):
+    """IR of the program in src, optimised"""
+    if streaming:
+        return stream_instructions(src)
+    with open(src, "r") as stream:
+        content = stream.read()
+    ast = parse(content)
+    ast = analyser.analyse(ast)
+    ast = inline.inline(ast)
+    return dce.eliminate(fold.fold(ir.visit(ast)))
+
+
+def execute(instructions):
+    """Exit status of a program run on the bytecode VM"""
+    try:
+        return vm.run(vm.translate(instructions))
+    except vm.Fault as error:
+        print(f"vinyl: {error}", file=sys.stderr)
+        return error.status
+
+
+def execute_jit(lines):
+    """Exit status of a program's x86_64 lines run on the host"""
+    return jit.Program(peephole.optimise(lines, Arch.x86_64))()
+
+
+def ssa_lines(src: str, arch: Arch):
+    """Assembly lines for src built through SSA form
+
+    The program is inlined as for instructions, then taken to
+    pseudo code, see pseudo.from_program, whose SSA form is value
+    numbered, strength reduced and register allocated. Calls
+    returned are tail calls.
+    """
+    with open(src, "r") as stream:
+        ast = parse(stream.read())
+    ast = inline.inline(analyser.analyse(ast))
+    module = ssa.build(pseudo.from_program(ast))
+    module = strength.reduce(lvn.number(module))
+    if arch == Arch.aarch64:
+        return code_gen.aarch64_ssa_lines(module)
+    return code_gen.gas_ssa_lines(module)
+
+
+def backend(arch: Arch):
+    if arch == Arch.aarch64:
+        return code_gen.aarch64_lines
+    else:
+        return code_gen.gas_lines
+
+
+def stream_instructions(src: str):
+    """IR of src, lowered one statement at a time
+
+    The source is memory mapped and each top-level statement is
+    lowered as soon as it is parsed, so memory use is bounded by
+    statement size rather than file size. Calls inline as in
+    instructions, into the statements after a function, see
+    inline.inline_stream, which holds the functions defined.
+    """
+    with open(src, "rb") as stream:
+        if os.fstat(stream.fileno()).st_size == 0:
+            # Empty files can not be mapped
+            source = nullcontext(b"")
+        else:
+            source = mmap.mmap(
+                stream.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        with source as content:
+            tokens = TokenStream(content)
+            statements = inline.inline_stream(
+                parse_statements(tokens)
+            )
+            # Lets are not removed, that needs the whole program,
+            # unreachable code is
+            lowered = dce.reachable(
+                fold.propagate(ir.visit_stream(statements))
+            )
+            try:
+                yield from lowered
+            finally:
+                # The lexer holds the map's buffer until closed, also
+                # when the caller stops early
+                tokens.close()
+
+
+def stream_lines(src: str, arch: Arch):
+    """Assembly lines for src, compiled one statement at a time"""
+    yield from backend(arch)(stream_instructions(src))
@@ -1,11 +1,19 @@
 from __future__ import annotations
+from array import array
+from bisect import bisect_left
 from enum import Enum
 from collections import namedtuple
-from dataclasses import dataclass
-from compiler.lexer import lex, Token, TokenKind
-
+from dataclasses import dataclass, field
+from compiler.lexer import (
+    tokenize,
+    LineIndex,
+    Token,
+    TokenKind,
+    TokenStream,
+)
 
 Op = namedtuple("Op", "operator precedence associative")
+Edit = namedtuple("Edit", "offset deleted inserted")
 
 
 class Associative(Enum):
@@ -22,12 +30,21 @@ OPERATORS = {
 }
 
 
-@dataclass
+OPERATOR_KINDS = {
+    TokenKind.PLUS: OPERATORS["+"],
+    TokenKind.MINUS: OPERATORS["-"],
+    TokenKind.STAR: OPERATORS["*"],
+    TokenKind.FORWARD_SLASH: OPERATORS["/"],
+    TokenKind.CARET: OPERATORS["^"],
+}
+
+
+@dataclass(slots=True)
 class NodeLiteral:
     value: Token
 
 
-@dataclass
+@dataclass(slots=True)
 class NodeBinOp:
     operator: str
     lhs: NodeBinOp | NodeLiteral = None
@@ -38,27 +55,27 @@ def literal(value):
     return NodeInt(Token.int(value))
 
 
-@dataclass
+@dataclass(slots=True)
 class NodeInt:
     token: Token
 
 
-@dataclass
+@dataclass(slots=True)
 class NodeIdentifier:
     token: Token
 
 
-@dataclass
+@dataclass(slots=True)
 class NodeExit:
     status: NodeInt | NodeIdentifier
 
 
-@dataclass
+@dataclass(slots=True)
 class NodePrint:
     message: NodeInt
 
 
-@dataclass
+@dataclass(slots=True)
 class NodeLet:
     identifier: NodeIdentifier
     value: Token
@@ -68,94 +85,348 @@ NodeStatement = NodeLet | NodeExit
 NodeExpression = NodeInt | NodeIdentifier | NodeBinOp
 
 
-@dataclass
+@dataclass(slots=True)
 class NodeProgram:
     statements: list[NodeStatement]
+    lines: LineIndex = field(
+        default=None, compare=False, repr=False
+    )
+    spans: Spans = field(default=None, compare=False, repr=False)
+
+
+class Spans:
+    """Source start and end offsets of top-level statements
+
+    Spans are kept in segments of at most SEGMENT statements, each
+    with offsets relative to its own base. Shifting all the spans
+    after an edit then only moves segment bases, and segments are
+    shared by the programs before and after an edit, so reparse does
+    not pay for every statement it reuses.
+    """
 
+    SEGMENT = 1024
 
-@dataclass
+    def __init__(self):
+        # (base, starts, ends) with starts and ends relative to base
+        self.segments = []
+
+    def __len__(self):
+        return sum(len(starts) for _, starts, _ in self.segments)
+
+    def __iter__(self):
+        for base, starts, ends in self.segments:
+            for start, end in zip(starts, ends):
+                yield base + start, base + end
+
+    def __getitem__(self, index):
+        for base, starts, ends in self.segments:
+            if index < len(starts):
+                return base + starts[index], base + ends[index]
+            index -= len(starts)
+        raise IndexError(index)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def append(self, span):
+        start, end = span
+        if (
+            not self.segments
+            or len(self.segments[-1][1]) >= self.SEGMENT
+        ):
+            self.segments.append((start, array("q"), array("q")))
+        base, starts, ends = self.segments[-1]
+        starts.append(start - base)
+        ends.append(end - base)
+
+    def first_ending(self, offset):
+        """Index of the first span ending at or after offset"""
+        index = 0
+        for base, _, ends in self.segments:
+            if base + ends[-1] >= offset:
+                return index + bisect_left(ends, offset - base)
+            index += len(ends)
+        return index
+
+    def find(self, start):
+        """Index of the span starting at start, if any"""
+        index = 0
+        for base, starts, _ in self.segments:
+            if base + starts[-1] >= start:
+                position = bisect_left(starts, start - base)
+                if starts[position] == start - base:
+                    return index + position
+                return None
+            index += len(starts)
+        return None
+
+    def head(self, count):
+        """The first count spans
+
+        The last segment is copied, so the result can be appended to
+        without changing segments it shares with self.
+        """
+        spans = Spans()
+        for base, starts, ends in self.segments:
+            if count <= 0:
+                break
+            if count < len(starts):
+                starts, ends = starts[:count], ends[:count]
+            spans.segments.append((base, starts, ends))
+            count -= len(starts)
+        if spans.segments:
+            base, starts, ends = spans.segments[-1]
+            spans.segments[-1] = (base, starts[:], ends[:])
+        return spans
+
+    def extend(self, other, index, delta):
+        """Append the spans of other from index on, shifted by delta
+
+        Segments of other are shared, except that a partial first one
+        is merged into the last segment of self when they fit in one.
+        """
+        merge = True
+        for base, starts, ends in other.segments:
+            if index >= len(starts):
+                index -= len(starts)
+                continue
+            if index > 0:
+                starts, ends = starts[index:], ends[index:]
+                index = 0
+            base += delta
+            if merge and self.segments:
+                last, last_starts, last_ends = self.segments[-1]
+                if (
+                    len(last_starts) + len(starts)
+                    <= self.SEGMENT
+                ):
+                    shift = base - last
+                    last_starts.extend(s + shift for s in starts)
+                    last_ends.extend(e + shift for e in ends)
+                    merge = False
+                    continue
+            merge = False
+            self.segments.append((base, starts, ends))
+
+
+@dataclass(slots=True)
 class NodeBlock:
     statements: list[NodeStatement]
 
 
-@dataclass
+@dataclass(slots=True)
 class NodeFunction:
     identifier: NodeIdentifier
     parameters: list[NodeIdentifier]
     body: NodeBlock
 
 
-@dataclass
+@dataclass(slots=True)
 class NodeCall:
     identifier: NodeIdentifier
     values: list[NodeExpression]
 
 
-@dataclass
+@dataclass(slots=True)
 class NodeReturn:
     expression: str
 
 
+class ParseError(Exception):
+    """Syntax errors, one message per statement that failed"""
+
+    def __init__(self, messages: list[str]):
+        super().__init__("\n".join(messages))
+        self.messages = messages
+
+
 def parse(content: str):
-    tokens = list(lex(content))
-    cursor = 0
+    tokens = tokenize(content)
     statements = []
-    while cursor < len(tokens):
-        statement, cursor = parse_statement(tokens, cursor)
+    spans = Spans()
+    messages = []
+    for statement, span in parse_spans(tokens, messages):
+        statements.append(statement)
+        spans.append(span)
+    if messages:
+        raise ParseError(messages)
+    return NodeProgram(statements, tokens.lines, spans)
+
+
+def parse_statements(tokens):
+    """Yield top-level statements as soon as each is parsed
+
+    Tokens behind each statement are released, so a TokenStream only
+    holds the statement currently being parsed. A statement that
+    fails to parse is reported and skipped up to the next statement
+    boundary, and all such errors are raised together at the end.
+    """
+    messages = []
+    for statement, _ in parse_spans(tokens, messages):
+        yield statement
+    if messages:
+        raise ParseError(messages)
+
+
+def parse_spans(tokens, messages):
+    """Yield top-level statements with their source spans
+
+    Error messages are appended to messages rather than raised.
+    """
+    cursor = 0
+    while tokens.has(cursor):
+        begin = cursor
+        try:
+            statement, cursor = parse_statement(tokens, cursor)
+        except ParseError as failure:
+            messages += failure.messages
+            cursor = synchronise(tokens, cursor)
+            statement = None
+        if statement and not tokens.has(cursor - 1):
+            # Parsed past the last token, the statement is cut off
+            messages += error(
+                tokens, begin, "unexpected end of input in"
+            ).messages
+            statement = None
         if statement:
-            statements.append(statement)
-            continue
-        else:
-            cursor += 1
-    return NodeProgram(statements)
+            span = (
+                tokens.starts[begin],
+                tokens.ends[cursor - 1],
+            )
+        tokens.release(cursor)
+        if statement:
+            yield statement, span
+
+
+def reparse(program: NodeProgram, edit: Edit):
+    """Parse the source of program after edit
+
+    Statements that end before the edit are reused as they are and
+    lexing restarts at the end of the last of them. Parsing stops at
+    the first statement boundary after the edit that lines up with
+    the start of an old statement, see resume_index, and the old
+    statements from there on are reused by identity with their spans
+    shifted. Tokens inside reused statements keep the offsets they
+    were given when first parsed.
+    """
+    offset, deleted, inserted = edit
+    source = program.lines.content
+    content = (
+        source[:offset] + inserted + source[offset + deleted :]
+    )
+    spans = program.spans
+
+    # Lexing restarts after the last statement ending before the edit
+    first = spans.first_ending(offset)
+    start = spans[first - 1][1] if first > 0 else 0
+
+    statements = program.statements[:first]
+    new_spans = spans.head(first)
+    messages = []
+    tokens = TokenStream(content, start)
+    parsed = parse_spans(tokens, messages)
+    while True:
+        index = resume_index(tokens, spans, edit)
+        if index is not None:
+            statements += program.statements[index:]
+            delta = len(inserted) - deleted
+            new_spans.extend(spans, index, delta)
+            break
+        try:
+            statement, span = next(parsed)
+        except StopIteration:
+            break
+        statements.append(statement)
+        new_spans.append(span)
+    if messages:
+        raise ParseError(messages)
+    return NodeProgram(statements, LineIndex(content), new_spans)
+
+
+def resume_index(tokens, spans, edit):
+    """Index of the old statement the next statement lines up with
+
+    None unless the next token is past the edit and starts an old
+    statement. parse_spans releases tokens up to the next statement,
+    so the next token is the first one not released.
+    """
+    offset, deleted, inserted = edit
+    cursor = tokens.base
+    if not tokens.has(cursor):
+        return None
+    begin = tokens.starts[cursor]
+    if begin < offset + len(inserted):
+        return None
+    return spans.find(begin - len(inserted) + deleted)
+
+
+def synchronise(tokens, cursor):
+    """Cursor after the next ; or } outside any nested braces"""
+    depth = 0
+    while tokens.has(cursor):
+        kind = tokens.kinds[cursor]
+        cursor += 1
+        if kind == TokenKind.OPEN_BRACE:
+            depth += 1
+        elif kind == TokenKind.CLOSE_BRACE:
+            depth -= 1
+            if depth <= 0:
+                break
+        elif kind == TokenKind.SEMICOLON and depth == 0:
+            break
+    return cursor
 
 
 def parse_block(tokens, cursor):
     original_cursor = cursor
-    if tokens[cursor].kind == TokenKind.OPEN_BRACE:
+    if tokens.kinds[cursor] == TokenKind.OPEN_BRACE:
         cursor += 1
         statements = []
-        while (cursor < len(tokens)) and (
-            tokens[cursor].kind != TokenKind.CLOSE_BRACE
+        while tokens.has(cursor) and (
+            tokens.kinds[cursor] != TokenKind.CLOSE_BRACE
         ):
             statement, cursor = parse_statement(tokens, cursor)
             if statement:
                 statements.append(statement)
-            else:
-                cursor += 1
+        if not tokens.has(cursor):
+            # No } before the end of input
+            raise error(
+                tokens,
+                original_cursor,
+                "unexpected end of input in",
+            )
         return NodeBlock(statements), cursor + 1
     else:
         return None, original_cursor
 
 
 def parse_statement(tokens, cursor):
-    statement, cursor = parse_function(tokens, cursor)
-    if statement:
-        return statement, cursor
-    statement, cursor = parse_exit(tokens, cursor)
-    if statement:
-        return statement, cursor
-    statement, cursor = parse_print(tokens, cursor)
-    if statement:
-        return statement, cursor
-    statement, cursor = parse_return(tokens, cursor)
-    if statement:
-        return statement, cursor
-    statement, cursor = parse_call(tokens, cursor)
-    if statement:
-        return statement, cursor
-    statement, cursor = parse_let(tokens, cursor)
-    if statement:
-        return statement, cursor
-    statement, cursor = parse_block(tokens, cursor)
-    if statement:
-        return statement, cursor
-    return None, cursor
+    # Each statement kind starts with a distinct token, see
+    # STATEMENTS, so exactly one parser is tried
+    kind = tokens.kinds[cursor]
+    if kind == TokenKind.SEMICOLON:
+        return None, cursor + 1
+    parser = STATEMENTS.get(kind)
+    if parser is None:
+        raise error(tokens, cursor, "unexpected")
+    try:
+        statement, next_cursor = parser(tokens, cursor)
+    except IndexError:
+        raise error(tokens, cursor, "unexpected end of input in")
+    if not statement:
+        raise error(tokens, cursor, "invalid statement at")
+    return statement, next_cursor
+
+
+def error(tokens, cursor, message):
+    line, column = tokens.position(cursor)
+    text = tokens.text(cursor)
+    return ParseError([f"{line}:{column}: {message} {text!r}"])
 
 
 def parse_function(tokens, cursor):
     original_cursor = cursor
-    if peek(tokens, cursor).kind == TokenKind.FUNCTION:
+    if peek(tokens, cursor) == TokenKind.FUNCTION:
 
         # Fn keyword
         _, cursor = consume(tokens, cursor)
@@ -164,16 +435,16 @@ def parse_function(tokens, cursor):
         identifier, cursor = parse_identifier(tokens, cursor)
 
         # Left parenthesis
-        token, cursor = consume(tokens, cursor)
-        if token.kind != TokenKind.LEFT_PAREN:
+        kind, cursor = consume(tokens, cursor)
+        if kind != TokenKind.LEFT_PAREN:
             return False, original_cursor
 
         # Parameters
         parameters, cursor = parse_parameters(tokens, cursor)
 
         # Right parenthesis
-        token, cursor = consume(tokens, cursor)
-        if token.kind != TokenKind.RIGHT_PAREN:
+        kind, cursor = consume(tokens, cursor)
+        if kind != TokenKind.RIGHT_PAREN:
             return False, original_cursor
 
         # Code block
@@ -188,7 +459,7 @@ def parse_function(tokens, cursor):
 
 def parse_parameters(tokens, cursor):
     params = []
-    while cursor < len(tokens):
+    while tokens.has(cursor):
         # Identifier list
         identifier, cursor = parse_identifier(tokens, cursor)
         if identifier:
@@ -197,7 +468,7 @@ def parse_parameters(tokens, cursor):
             break
 
         # Comma separator
-        if peek(tokens, cursor).kind == TokenKind.COMMA:
+        if peek(tokens, cursor) == TokenKind.COMMA:
             _, cursor = consume(tokens, cursor)
         else:
             break
@@ -206,19 +477,18 @@ def parse_parameters(tokens, cursor):
 
 
 def parse_identifier(tokens, cursor):
-    if peek(tokens, cursor).kind == TokenKind.IDENTIFIER:
-        token, cursor = consume(tokens, cursor)
-        return NodeIdentifier(token), cursor
+    if peek(tokens, cursor) == TokenKind.IDENTIFIER:
+        return NodeIdentifier(tokens.token(cursor)), cursor + 1
     else:
         return False, cursor
 
 
 def peek(tokens, cursor):
-    return tokens[cursor]
+    return tokens.kinds[cursor]
 
 
 def consume(tokens, cursor):
-    return tokens[cursor], cursor + 1
+    return tokens.kinds[cursor], cursor + 1
 
 
 def exit(status: str):
@@ -226,43 +496,38 @@ def exit(status: str):
 
 
 def parse_exit(tokens, cursor):
-    if (tokens[cursor + 0].kind == TokenKind.EXIT) and (
-        tokens[cursor + 1].kind == TokenKind.LEFT_PAREN
+    kinds = tokens.kinds
+    if (kinds[cursor + 0] == TokenKind.EXIT) and (
+        kinds[cursor + 1] == TokenKind.LEFT_PAREN
     ):
         status, next_cursor = parse_expression(
             tokens, cursor + 2
         )
         if (
             status
-            and (
-                tokens[next_cursor + 0].kind
-                == TokenKind.RIGHT_PAREN
-            )
-            and (
-                tokens[next_cursor + 1].kind
-                == TokenKind.SEMICOLON
-            )
+            and (kinds[next_cursor + 0] == TokenKind.RIGHT_PAREN)
+            and (kinds[next_cursor + 1] == TokenKind.SEMICOLON)
         ):
             return NodeExit(status=status), next_cursor + 2
     return None, cursor
 
 
 def parse_print(tokens, cursor):
-    if peek(tokens, cursor).kind == TokenKind.PRINT:
+    if peek(tokens, cursor) == TokenKind.PRINT:
         _, cursor = consume(tokens, cursor)
 
-        token, cursor = consume(tokens, cursor)
-        if token.kind != TokenKind.LEFT_PAREN:
+        kind, cursor = consume(tokens, cursor)
+        if kind != TokenKind.LEFT_PAREN:
             return False, cursor
 
         message, cursor = parse_expression(tokens, cursor)
 
-        token, cursor = consume(tokens, cursor)
-        if token.kind != TokenKind.RIGHT_PAREN:
+        kind, cursor = consume(tokens, cursor)
+        if kind != TokenKind.RIGHT_PAREN:
             return False, cursor
 
-        token, cursor = consume(tokens, cursor)
-        if token.kind != TokenKind.SEMICOLON:
+        kind, cursor = consume(tokens, cursor)
+        if kind != TokenKind.SEMICOLON:
             return False, cursor
 
         return NodePrint(message), cursor
@@ -271,34 +536,31 @@ def parse_print(tokens, cursor):
 
 
 def parse_call(tokens, cursor):
-    if peek(tokens, cursor).kind == TokenKind.IDENTIFIER:
+    if peek(tokens, cursor) == TokenKind.IDENTIFIER:
         # Function name
-        identifier, cursor = consume(tokens, cursor)
+        identifier, cursor = parse_identifier(tokens, cursor)
 
         # Left parenthesis
-        token, cursor = consume(tokens, cursor)
-        if token.kind != TokenKind.LEFT_PAREN:
+        kind, cursor = consume(tokens, cursor)
+        if kind != TokenKind.LEFT_PAREN:
             return False, cursor
 
         # Call values
         values, cursor = parse_call_values(tokens, cursor)
 
         # Right parenthesis
-        token, cursor = consume(tokens, cursor)
-        if token.kind != TokenKind.RIGHT_PAREN:
+        kind, cursor = consume(tokens, cursor)
+        if kind != TokenKind.RIGHT_PAREN:
             return False, cursor
 
-        return (
-            NodeCall(NodeIdentifier(identifier), values),
-            cursor,
-        )
+        return NodeCall(identifier, values), cursor
     else:
         return False, cursor
 
 
 def parse_call_values(tokens, cursor):
     values = []
-    while cursor < len(tokens):
+    while tokens.has(cursor):
         # Expression list
         expression, cursor = parse_expression(tokens, cursor)
         if expression:
@@ -307,7 +569,7 @@ def parse_call_values(tokens, cursor):
             break
 
         # Comma separator
-        if peek(tokens, cursor).kind == TokenKind.COMMA:
+        if peek(tokens, cursor) == TokenKind.COMMA:
             _, cursor = consume(tokens, cursor)
         else:
             break
@@ -316,7 +578,7 @@ def parse_call_values(tokens, cursor):
 
 
 def parse_return(tokens, cursor):
-    if peek(tokens, cursor).kind == TokenKind.RETURN:
+    if peek(tokens, cursor) == TokenKind.RETURN:
         _, cursor = consume(tokens, cursor)
         expression, cursor = parse_expression(tokens, cursor)
         return NodeReturn(expression), cursor
@@ -333,17 +595,18 @@ def let(identifier: str, value: str):
 
 def parse_let(tokens, cursor):
     # let identifier = expression;
+    kinds = tokens.kinds
     if (
-        (tokens[cursor].kind == TokenKind.LET)
-        and (tokens[cursor + 1].kind == TokenKind.IDENTIFIER)
-        and (tokens[cursor + 2].kind == TokenKind.EQUAL)
+        (kinds[cursor] == TokenKind.LET)
+        and (kinds[cursor + 1] == TokenKind.IDENTIFIER)
+        and (kinds[cursor + 2] == TokenKind.EQUAL)
     ):
-        identifier = NodeIdentifier(tokens[cursor + 1])
+        identifier = NodeIdentifier(tokens.token(cursor + 1))
         expression, next_cursor = parse_expression(
             tokens, cursor + 3
         )
         if expression and (
-            tokens[next_cursor].kind == TokenKind.SEMICOLON
+            kinds[next_cursor] == TokenKind.SEMICOLON
         ):
             return (
                 NodeLet(identifier, expression),
@@ -356,63 +619,120 @@ def parse_let(tokens, cursor):
 
 
 def parse_arithmetic(tokens, cursor):
-    if tokens[cursor].kind == TokenKind.INT:
-        return tokens[cursor], cursor + 1
+    if tokens.kinds[cursor] == TokenKind.INT:
+        return tokens.token(cursor), cursor + 1
     else:
         return None, cursor
 
 
 def parse_expression(tokens, cursor):
-    if tokens[cursor].kind == TokenKind.INT:
-        node, next_cursor = parse_binary(tokens, cursor)
-        if node:
-            return node, next_cursor
-        else:
-            return NodeInt(tokens[cursor]), cursor + 1
-    elif is_call(tokens, cursor):
-        return parse_call(tokens, cursor)
-    elif tokens[cursor].kind == TokenKind.IDENTIFIER:
-        node, next_cursor = parse_binary(tokens, cursor)
-        if node:
-            return node, next_cursor
-        else:
-            return NodeIdentifier(tokens[cursor]), cursor + 1
-    else:
-        return None, cursor
+    return parse_binary(tokens, cursor)
 
 
 def is_call(tokens, cursor):
-    return (tokens[cursor].kind == TokenKind.IDENTIFIER) and (
-        tokens[cursor + 1].kind == TokenKind.LEFT_PAREN
+    return (tokens.kinds[cursor] == TokenKind.IDENTIFIER) and (
+        tokens.has(cursor + 1)
+        and tokens.kinds[cursor + 1] == TokenKind.LEFT_PAREN
     )
 
 
 def parse_binary(tokens, cursor):
-    # (((((a) + b) + c) + d) + e)
-    lhs, cursor = parse_term(tokens, cursor)
-    op, cursor = parse_op(tokens, cursor)
-    while (cursor < len(tokens)) and op:
-        rhs, cursor = parse_term(tokens, cursor)
-        lhs = NodeBinOp(op, lhs, rhs)
-        op, cursor = parse_op(tokens, cursor)
-    return lhs, cursor
+    # Precedence climbing with explicit operand and operator stacks,
+    # so neither long nor deeply parenthesised expressions recurse.
+    # A None on the operator stack marks an open parenthesis
+    original_cursor = cursor
+    operands = []
+    operators = []
+    depth = 0
+    while True:
+        # Operand, after any opening parentheses
+        while (
+            tokens.has(cursor)
+            and tokens.kinds[cursor] == TokenKind.LEFT_PAREN
+        ):
+            operators.append(None)
+            depth += 1
+            cursor += 1
+        term, cursor = parse_term(tokens, cursor)
+        if not term:
+            return None, original_cursor
+        operands.append(term)
+
+        # Closing parentheses, leaving any that belong to the
+        # enclosing statement or call
+        while (
+            depth > 0
+            and tokens.has(cursor)
+            and tokens.kinds[cursor] == TokenKind.RIGHT_PAREN
+        ):
+            while operators[-1] is not None:
+                reduce(operands, operators)
+            operators.pop()
+            depth -= 1
+            cursor += 1
+
+        # Operator, binding any tighter operators on the stack first
+        op, next_cursor = parse_op(tokens, cursor)
+        if not op:
+            break
+        while operators and binds(operators[-1], op):
+            reduce(operands, operators)
+        operators.append(op)
+        cursor = next_cursor
+
+    if depth > 0:
+        return None, original_cursor
+    while operators:
+        reduce(operands, operators)
+    return operands[0], cursor
+
+
+def binds(left, right):
+    """Whether the operator left of an operand takes it before right"""
+    if left is None:
+        return False
+    if left.precedence == right.precedence:
+        return right.associative == Associative.LEFT
+    return left.precedence > right.precedence
+
+
+def reduce(operands, operators):
+    op = operators.pop()
+    rhs = operands.pop()
+    operands[-1] = NodeBinOp(op, operands[-1], rhs)
 
 
 def parse_term(tokens, cursor):
-    if cursor >= len(tokens):
+    if not tokens.has(cursor):
         return None, cursor
-    if tokens[cursor].kind == TokenKind.INT:
-        return NodeInt(tokens[cursor]), cursor + 1
-    elif tokens[cursor].kind == TokenKind.IDENTIFIER:
-        return NodeIdentifier(tokens[cursor]), cursor + 1
+    kind = tokens.kinds[cursor]
+    if kind == TokenKind.INT:
+        return NodeInt(tokens.token(cursor)), cursor + 1
+    elif is_call(tokens, cursor):
+        return parse_call(tokens, cursor)
+    elif kind == TokenKind.IDENTIFIER:
+        return NodeIdentifier(tokens.token(cursor)), cursor + 1
     else:
         return None, cursor
 
 
 def parse_op(tokens, cursor):
-    if cursor >= len(tokens):
+    if not tokens.has(cursor):
         return None, cursor
-    if tokens[cursor].text in OPERATORS:
-        return OPERATORS[tokens[cursor].text], cursor + 1
+    op = OPERATOR_KINDS.get(tokens.kinds[cursor])
+    if op:
+        return op, cursor + 1
     else:
         return None, cursor
+
+
+# Statement parser for each leading token kind
+STATEMENTS = {
+    TokenKind.FUNCTION: parse_function,
+    TokenKind.EXIT: parse_exit,
+    TokenKind.PRINT: parse_print,
+    TokenKind.RETURN: parse_return,
+    TokenKind.IDENTIFIER: parse_call,
+    TokenKind.LET: parse_let,
+    TokenKind.OPEN_BRACE: parse_block,
+}
@@ -0,0 +1,538 @@
+"""
+Peephole optimisation of assembly lines
+
+Lines are parsed into Asm instructions and a window slides over
+each block, the instructions between two labels or directives.
+Rules are tried at each position of the window, with the
+instructions after it to look ahead at, and a rewrite steps back
+so rules can apply to its result. Blocks are optimised as they
+end, so lines can be streamed.
+"""
+
+import re
+from collections import Counter, deque, namedtuple
+from compiler.arch import Arch
+
+# form is (indent, separator, end), the whitespace of the line it
+# was parsed from, so unchanged lines render as they were
+Asm = namedtuple("Asm", "mnemonic operands form")
+
+# A rule applies to a window of size instructions, the last one
+# with a mnemonic among last
+Rule = namedtuple("Rule", "name size last apply")
+
+# Stands for every register, read by calls, branches and unknown
+# instructions
+ANY = None
+
+
+def optimise(lines, arch, hits=None):
+    """Lines with redundant instructions rewritten or removed
+
+    hits, a Counter, counts the rewrites of each rule.
+    """
+    if hits is None:
+        hits = Counter()
+    rules = INDEX[arch]
+    block = []
+    for text in lines:
+        asm = parse(text)
+        if asm is None:
+            yield from map(render, rewrite(block, rules, hits))
+            block = []
+            yield text
+        else:
+            block.append(asm)
+    yield from map(render, rewrite(block, rules, hits))
+
+
+def rewrite(block, rules, hits):
+    """Instructions of a block after applying rules
+
+    The window is the end of the instructions done so far. A
+    rewrite goes back to the pending instructions, with the window
+    before it, so rules see it with the instructions around it.
+    """
+    size = max(
+        rule.size for group in rules.values() for rule in group
+    )
+    pending = deque(block)
+    done = []
+    while pending:
+        asm = pending.popleft()
+        done.append(asm)
+        for rule in rules.get(asm.mnemonic, ()):
+            if len(done) < rule.size:
+                continue
+            replacement = rule.apply(done[-rule.size :], pending)
+            if replacement is not None:
+                del done[-rule.size :]
+                hits[rule.name] += 1
+                back = done[len(done) - size + 1 :]
+                del done[len(done) - len(back) :]
+                pending.extendleft(reversed(replacement))
+                pending.extendleft(reversed(back))
+                break
+    return done
+
+
+def parse(text):
+    """Asm of an instruction line, None for other lines"""
+    stripped = text.strip()
+    if not stripped or stripped[0] == "." or "\n" in stripped:
+        return None
+    mnemonic, *operands = stripped.split(None, 1)
+    if mnemonic.endswith(":"):
+        return None
+    indent = text[: len(text) - len(text.lstrip())]
+    end = text[len(text.rstrip()) :]
+    if not operands:
+        return Asm(mnemonic, (), (indent, "", end))
+    rest = stripped[len(mnemonic) :]
+    separator = rest[: len(rest) - len(rest.lstrip())]
+    return Asm(
+        mnemonic,
+        tuple(split(operands[0])),
+        (indent, separator, end),
+    )
+
+
+def split(operands):
+    # Commas inside brackets or parentheses separate address parts
+    if "[" not in operands and "(" not in operands:
+        return [
+            operand.strip() for operand in operands.split(",")
+        ]
+    parts = []
+    depth = 0
+    start = 0
+    for i, character in enumerate(operands):
+        if character in "[(":
+            depth += 1
+        elif character in "])":
+            depth -= 1
+        elif character == "," and depth == 0:
+            parts.append(operands[start:i].strip())
+            start = i + 1
+    parts.append(operands[start:].strip())
+    return parts
+
+
+def render(asm):
+    indent, separator, end = asm.form
+    if not asm.operands:
+        return f"{indent}{asm.mnemonic}{end}"
+    operands = ", ".join(asm.operands)
+    return f"{indent}{asm.mnemonic}{separator}{operands}{end}"
+
+
+def replace(asm, mnemonic, *operands):
+    return Asm(mnemonic, operands, asm.form)
+
+
+def immediate(operand, prefix):
+    """Value of an immediate operand, None for other operands"""
+    if not operand.startswith(prefix):
+        return None
+    try:
+        return int(operand[len(prefix) :], 0)
+    except ValueError:
+        return None
+
+
+def dead(register, following, effects):
+    """Whether a register is written before it is read
+
+    Registers live out of the block are taken to be read.
+    """
+    for asm in following:
+        reads, writes = effects(asm)
+        if reads is ANY or register in reads:
+            return False
+        if register in writes:
+            return True
+    return False
+
+
+# aarch64
+
+AARCH64_REGISTER = re.compile(r"\b(?:[xw](\d+)|(sp))\b")
+
+# Instructions writing their first operand and reading the rest
+AARCH64_DEFINES = {
+    "mov",
+    "add",
+    "sub",
+    "mul",
+    "sdiv",
+    "udiv",
+    "neg",
+    "lsl",
+    "lsr",
+    "asr",
+    "and",
+    "orr",
+    "eor",
+    "ldr",
+    "adrp",
+}
+
+# Instructions reading all their operands
+AARCH64_READS = {"str", "cmp"}
+
+
+def aarch64_registers(operands):
+    # w registers are the low halves of x registers
+    return {
+        f"x{number}" if number else stack
+        for operand in operands
+        for number, stack in AARCH64_REGISTER.findall(operand)
+    }
+
+
+def aarch64_effects(asm):
+    """Registers an instruction reads and those it writes"""
+    if asm.mnemonic in ("ldr", "str") and (
+        len(asm.operands) != 2 or asm.operands[1].endswith("!")
+    ):
+        # Addressing with writeback also writes the base register
+        return ANY, set()
+    if asm.mnemonic in AARCH64_DEFINES:
+        return (
+            aarch64_registers(asm.operands[1:]),
+            aarch64_registers(asm.operands[:1]),
+        )
+    if asm.mnemonic in AARCH64_READS:
+        return aarch64_registers(asm.operands), set()
+    return ANY, set()
+
+
+def aarch64_self_move(window, following):
+    (asm,) = window
+    if (
+        asm.mnemonic == "mov"
+        and asm.operands[0] == asm.operands[1]
+        # Moving a w register clears the upper half
+        and asm.operands[0][0] == "x"
+    ):
+        return []
+
+
+def aarch64_store_load(window, following):
+    store, load = window
+    if (
+        store.mnemonic == "str"
+        and load.mnemonic == "ldr"
+        and len(store.operands) == len(load.operands) == 2
+        and store.operands[1] == load.operands[1]
+        and not store.operands[1].endswith("!")
+        and store.operands[0][0] == load.operands[0][0] == "x"
+    ):
+        return [
+            store,
+            replace(
+                load, "mov", load.operands[0], store.operands[0]
+            ),
+        ]
+
+
+def aarch64_immediate(window, following):
+    move, operation = window
+    if move.mnemonic != "mov" or operation.mnemonic not in (
+        "add",
+        "sub",
+    ):
+        return None
+    register, source = move.operands
+    value = immediate(source, "#")
+    if (
+        value is not None
+        and 0 <= value < 4096
+        and len(operation.operands) == 3
+        and operation.operands[2] == register
+        and operation.operands[1] != register
+        and (
+            operation.operands[0] == register
+            or dead(register, following, aarch64_effects)
+        )
+    ):
+        destination, lhs, _ = operation.operands
+        return [
+            replace(
+                operation,
+                operation.mnemonic,
+                destination,
+                lhs,
+                f"#{hex(value)}",
+            )
+        ]
+
+
+def aarch64_empty_frame(window, following):
+    sub, add = window
+    if (
+        sub.mnemonic == "sub"
+        and add.mnemonic == "add"
+        and sub.operands[:2] == add.operands[:2] == ("sp", "sp")
+        and sub.operands[2:] == add.operands[2:]
+    ):
+        return []
+
+
+def aarch64_zero_adjust(window, following):
+    (asm,) = window
+    if (
+        asm.mnemonic in ("add", "sub")
+        and asm.operands[:2] == ("sp", "sp")
+        and immediate(asm.operands[2], "#") == 0
+    ):
+        return []
+
+
+def aarch64_dead_move(window, following):
+    first, second = window
+    if (
+        first.mnemonic not in ("mov", "ldr")
+        or len(first.operands) != 2
+    ):
+        return None
+    reads, writes = aarch64_effects(second)
+    if (
+        reads is not ANY
+        and first.operands[0] in writes
+        and first.operands[0] not in reads
+        and first.operands[0][0] == "x"
+    ):
+        return [second]
+
+
+def shape(instructions):
+    return [(asm.mnemonic, asm.operands) for asm in instructions]
+
+
+# The link register saved around a call, and the frame's epilog,
+# see code_gen.aarch64_call and code_gen.aarch64_epilog
+AARCH64_SAVE_LINK = [("str", ("x30", "[sp, #-16]!"))]
+AARCH64_RESTORE_LINK = [("ldr", ("x30", "[sp]", "#16"))]
+AARCH64_EPILOG = [
+    ("mov", ("sp", "x29")),
+    ("ldp", ("x29", "x30", "[sp]", "#16")),
+]
+
+
+def aarch64_tail_call(window, following):
+    *body, ret = window
+    if ret.mnemonic != "ret" or ret.operands:
+        return None
+    if (
+        shape(body[:1]) == AARCH64_SAVE_LINK
+        and shape(body[2:3]) == AARCH64_RESTORE_LINK
+    ):
+        call, epilog = body[1], body[3:]
+    else:
+        call, epilog = body[0], body[1:]
+    # The callee returns to the caller's caller, in constant stack
+    if call.mnemonic == "bl" and shape(epilog) in (
+        [],
+        AARCH64_EPILOG,
+    ):
+        return [*epilog, replace(call, "b", *call.operands)]
+
+
+# x86_64, AT&T syntax with the destination last
+
+GAS_REGISTER = re.compile(r"%(\w+)")
+
+# Instructions writing their last operand only
+GAS_MOVES = {"mov", "movq", "movabs", "lea"}
+
+# Instructions reading both operands and writing the last
+GAS_OPERATIONS = {"add", "sub", "imul", "and", "or", "xor"}
+
+
+def gas_registers(operands):
+    return {
+        register
+        for operand in operands
+        for register in GAS_REGISTER.findall(operand)
+    }
+
+
+def gas_effects(asm):
+    if asm.mnemonic in GAS_MOVES | GAS_OPERATIONS:
+        *sources, destination = asm.operands
+        reads = gas_registers(sources)
+        writes = set()
+        if destination.startswith("%"):
+            writes.add(destination[1:])
+            if asm.mnemonic in GAS_OPERATIONS:
+                reads.add(destination[1:])
+        else:
+            # Registers of a memory address are read
+            reads |= gas_registers([destination])
+        return reads, writes
+    if asm.mnemonic == "push":
+        return gas_registers(asm.operands) | {"rsp"}, {"rsp"}
+    if asm.mnemonic == "pop":
+        return {"rsp"}, gas_registers(asm.operands) | {"rsp"}
+    return ANY, set()
+
+
+def gas_self_move(window, following):
+    (asm,) = window
+    if (
+        asm.mnemonic in ("mov", "movq")
+        and asm.operands[0] == asm.operands[1]
+        # Moving a 32 bit register clears the upper half
+        and asm.operands[0].startswith("%r")
+    ):
+        return []
+
+
+def gas_store_load(window, following):
+    store, load = window
+    if (
+        store.mnemonic in ("mov", "movq")
+        and load.mnemonic in ("mov", "movq")
+        and "(" in store.operands[1]
+        and store.operands[1] == load.operands[0]
+        and load.operands[1].startswith("%r")
+        and (
+            store.operands[0].startswith("%r")
+            or immediate(store.operands[0], "$") is not None
+        )
+    ):
+        return [
+            store,
+            replace(
+                load, "mov", store.operands[0], load.operands[1]
+            ),
+        ]
+
+
+def gas_immediate(window, following):
+    move, operation = window
+    if (
+        move.mnemonic not in ("mov", "movq")
+        or operation.mnemonic not in ("add", "sub", "imul")
+        or len(operation.operands) != 2
+    ):
+        return None
+    value, register = move.operands
+    value = immediate(value, "$")
+    if (
+        value is not None
+        and -(2**31) <= value < 2**31
+        and register.startswith("%r")
+        and operation.operands[0] == register
+        and operation.operands[1] != register
+        and dead(register[1:], following, gas_effects)
+    ):
+        return [
+            replace(
+                operation,
+                operation.mnemonic,
+                f"${value}",
+                operation.operands[1],
+            )
+        ]
+
+
+def gas_empty_frame(window, following):
+    sub, add = window
+    if (
+        sub.mnemonic == "sub"
+        and add.mnemonic == "add"
+        and sub.operands[1] == add.operands[1] == "%rsp"
+        and sub.operands[0] == add.operands[0]
+    ):
+        return []
+
+
+def gas_zero_adjust(window, following):
+    (asm,) = window
+    if (
+        asm.mnemonic in ("add", "sub")
+        and asm.operands[1:] == ("%rsp",)
+        and immediate(asm.operands[0], "$") == 0
+    ):
+        return []
+
+
+def gas_dead_move(window, following):
+    first, second = window
+    if first.mnemonic not in GAS_MOVES or not first.operands[
+        -1
+    ].startswith("%r"):
+        return None
+    register = first.operands[-1][1:]
+    reads, writes = gas_effects(second)
+    if (
+        reads is not ANY
+        and register in writes
+        and register not in reads
+    ):
+        return [second]
+
+
+# The frame's epilog, see code_gen.gas_epilog
+GAS_EPILOG = [("mov", ("%rbp", "%rsp")), ("pop", ("%rbp",))]
+
+
+def gas_tail_call(window, following):
+    call, *epilog, ret = window
+    if (
+        call.mnemonic == "call"
+        and ret.mnemonic == "ret"
+        and shape(epilog) in ([], GAS_EPILOG)
+    ):
+        return [*epilog, replace(call, "jmp", *call.operands)]
+
+
+RULES = {
+    Arch.aarch64: (
+        Rule("self_move", 1, {"mov"}, aarch64_self_move),
+        Rule(
+            "zero_adjust", 1, {"add", "sub"}, aarch64_zero_adjust
+        ),
+        Rule("store_load", 2, {"ldr"}, aarch64_store_load),
+        Rule("immediate", 2, {"add", "sub"}, aarch64_immediate),
+        Rule("empty_frame", 2, {"add"}, aarch64_empty_frame),
+        Rule("dead_move", 2, AARCH64_DEFINES, aarch64_dead_move),
+        *(
+            Rule("tail_call", size, {"ret"}, aarch64_tail_call)
+            for size in (2, 4, 6)
+        ),
+    ),
+    Arch.x86_64: (
+        Rule("self_move", 1, {"mov", "movq"}, gas_self_move),
+        Rule("zero_adjust", 1, {"add", "sub"}, gas_zero_adjust),
+        Rule("store_load", 2, {"mov", "movq"}, gas_store_load),
+        Rule(
+            "immediate", 2, {"add", "sub", "imul"}, gas_immediate
+        ),
+        Rule("empty_frame", 2, {"add"}, gas_empty_frame),
+        Rule(
+            "dead_move",
+            2,
+            GAS_MOVES | GAS_OPERATIONS,
+            gas_dead_move,
+        ),
+        *(
+            Rule("tail_call", size, {"ret"}, gas_tail_call)
+            for size in (2, 4)
+        ),
+    ),
+}
+
+
+def index(rules):
+    # Rules by the mnemonics they apply to, in table order
+    table = {}
+    for rule in rules:
+        for mnemonic in rule.last:
+            table.setdefault(mnemonic, []).append(rule)
+    return table
+
+
+INDEX = {arch: index(rules) for arch, rules in RULES.items()}
@@ -1,5 +1,7 @@
 from collections import namedtuple
 from dataclasses import dataclass
+from compiler import parser
+from compiler.ir import wrap
 
 memory = namedtuple("memory", "scope dtype")
 register = namedtuple("register", "i")
@@ -28,11 +30,26 @@ class Add(BinOp):
     op: str = "add"
 
 
+@dataclass
+class Sub(BinOp):
+    op: str = "sub"
+
+
 @dataclass
 class Mul(BinOp):
     op: str = "mul"
 
 
+@dataclass
+class Div(BinOp):
+    op: str = "div"
+
+
+@dataclass
+class Pow(BinOp):
+    op: str = "pow"
+
+
 @dataclass
 class Let:
     identifier: Id
@@ -65,6 +82,91 @@ class AST:
     statements: list[Statement]
 
 
+class Unsupported(Exception):
+    """A statement pseudo code has no form for"""
+
+    def __init__(self, statement):
+        super().__init__(f"{statement} has no pseudo code")
+
+
+# Binary operations by their parser operator
+OPERATIONS = {"+": Add, "-": Sub, "*": Mul, "/": Div, "^": Pow}
+
+
+def from_program(program):
+    """Pseudo AST of a parsed program
+
+    An exit at the top level is a return there, which ssa.build
+    makes the exit status. Prints, exits in functions and blocks
+    with lets have no pseudo form and raise Unsupported, other
+    blocks are flattened.
+    """
+    return AST(statements(program.statements, top_level=True))
+
+
+def statements(nodes, top_level=False):
+    result = []
+    pending = list(reversed(nodes))
+    while pending:
+        node = pending.pop()
+        if isinstance(node, parser.NodeLet):
+            result.append(
+                Let(
+                    identifier(node.identifier),
+                    value(node.value),
+                )
+            )
+        elif isinstance(node, parser.NodeFunction) and top_level:
+            result.append(
+                Fn(
+                    identifier(node.identifier),
+                    [identifier(p) for p in node.parameters],
+                    statements(node.body.statements),
+                )
+            )
+        elif isinstance(node, parser.NodeCall):
+            result.append(value(node))
+        elif isinstance(node, parser.NodeReturn):
+            result.append(Return(value(node.expression)))
+        elif isinstance(node, parser.NodeExit) and top_level:
+            result.append(Return(value(node.status)))
+        elif isinstance(node, parser.NodeBlock):
+            if any(
+                isinstance(item, parser.NodeLet)
+                for item in node.statements
+            ):
+                # They would be bound in the enclosing scope
+                raise Unsupported("a block with lets")
+            pending += reversed(node.statements)
+        elif isinstance(node, parser.NodePrint):
+            raise Unsupported("print")
+        elif isinstance(node, parser.NodeExit):
+            raise Unsupported("exit in a function")
+        elif isinstance(node, parser.NodeFunction):
+            raise Unsupported("a function in a function")
+        else:
+            raise Exception(f"Unknown statement: {node}")
+    return result
+
+
+def value(node):
+    if isinstance(node, parser.NodeInt):
+        return Int(wrap(int(node.token.text)))
+    if isinstance(node, parser.NodeIdentifier):
+        return identifier(node)
+    if isinstance(node, parser.NodeCall):
+        return Call(
+            identifier(node.identifier),
+            [value(v) for v in node.values],
+        )
+    operation = OPERATIONS[node.operator.operator]
+    return operation(value(node.lhs), value(node.rhs))
+
+
+def identifier(node):
+    return Id(node.token.text)
+
+
 class Visitor:
     def __init__(self):
         self.symbols = {}
@@ -91,20 +193,32 @@ class Visitor:
             raise Exception(f"Unknown statement: {statement}")
 
     def visit_fn(self, fn):
-        return [
-            ("label", fn.id.data)
-            # TODO: Function scoped variables
-            #       Parameter registers
-            #       Stack allocation
-            #       Prolog
-            #       Epilog
-        ]
-
-    def visit_call(self, call):
+        # TODO: Stack allocation
+        #       Prolog
+        #       Epilog
+        scope, self.scope = self.scope, fn.id.data
+        instructions = [("label", fn.id.data)]
+        for i, arg in enumerate(fn.args):
+            self.symbols[arg.data] = memory(
+                self.scope, dtype="int"
+            )
+            instructions.append(("mov", arg.data, parameter(i)))
+        for statement in fn.body:
+            instructions += self.visit_statement(statement)
+        self.scope = scope
+        return instructions
+
+    def visit_call(self, call, index=0, labels=None):
+        # Arguments are all evaluated before any is moved to its
+        # parameter, so calls among them do not clobber parameters
         instructions = []
-        for i, arg in enumerate(call.args):
-            instrs, addr = self.visit_value(arg, 0)
+        addrs = []
+        for arg in call.args:
+            instrs, addr = self.visit_value(arg, index, labels)
             instructions += instrs
+            addrs.append(addr)
+            index = addr.i + 1
+        for i, addr in enumerate(addrs):
             instructions.append(("mov", parameter(i), addr))
         return instructions + [("call", call.id.data)]
 
@@ -118,33 +232,75 @@ class Visitor:
         insts, addr = self.visit_value(node.value, 0)
         return insts + [("mov", "rax", addr)]
 
-    def visit_value(self, node, index):
+    def visit_value(self, node, index, labels=None):
+        """Instructions computing a value into register(index)
+
+        Registers above index are temporaries. Of the operands of a
+        binary operation, the one needing more registers is
+        evaluated first, after Sethi and Ullman, unless either
+        calls a function, as calls must run in source order.
+        """
+        if labels is None:
+            labels = {}
+            self.label(node, labels)
+        addr = register(index)
         if self.is_int(node):
-            addr = register(index)
             return [("mov", addr, node.data)], addr
         if self.is_identifier(node):
-            addr = register(index)
             return [("mov", addr, node.data)], addr
+        elif self.is_call(node):
+            instructions = self.visit_call(node, index, labels)
+            return instructions + [("mov", addr, "rax")], addr
         elif self.is_binop(node):
-            lhs_instructions, addr = self.visit_value(
-                node.lhs, index
+            lhs_need, lhs_pure = labels[id(node.lhs)]
+            rhs_need, rhs_pure = labels[id(node.rhs)]
+            first, second = node.lhs, node.rhs
+            swap = rhs_need > lhs_need and lhs_pure and rhs_pure
+            if swap:
+                first, second = second, first
+            instructions, first_addr = self.visit_value(
+                first, index, labels
             )
-            lhs_index = addr.i
-            rhs_instructions, addr = self.visit_value(
-                node.rhs, lhs_index + 1
+            second_instructions, second_addr = self.visit_value(
+                second, index + 1, labels
+            )
+            lhs, rhs = first_addr, second_addr
+            if swap:
+                lhs, rhs = rhs, lhs
+            return (
+                instructions
+                + second_instructions
+                + [
+                    (node.op, lhs, rhs, addr),
+                ],
+                addr,
             )
-            rhs_index = addr.i
-            return lhs_instructions + rhs_instructions + [
-                (
-                    node.op,
-                    register(lhs_index),
-                    register(rhs_index),
-                    register(rhs_index + 1),
-                ),
-            ], register(rhs_index + 1)
         else:
             raise Exception(f"Unknown value: {node}")
 
+    def label(self, node, labels):
+        """Label each subtree of a value with the registers it needs
+
+        Labels are (need, pure) pairs keyed by node id, pure when
+        the subtree has no calls.
+        """
+        if self.is_call(node):
+            need = 1
+            for i, arg in enumerate(node.args):
+                need = max(need, i + self.label(arg, labels)[0])
+            labels[id(node)] = (need, False)
+        elif self.is_binop(node):
+            lhs_need, lhs_pure = self.label(node.lhs, labels)
+            rhs_need, rhs_pure = self.label(node.rhs, labels)
+            if lhs_need == rhs_need:
+                need = lhs_need + 1
+            else:
+                need = max(lhs_need, rhs_need)
+            labels[id(node)] = (need, lhs_pure and rhs_pure)
+        else:
+            labels[id(node)] = (1, True)
+        return labels[id(node)]
+
     @staticmethod
     def is_let(node):
         return isinstance(node, Let)
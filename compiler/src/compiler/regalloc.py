@@ -0,0 +1,140 @@
+"""
+Linear scan register allocation
+
+Values of an ssa.Function are given physical registers in the order
+of their definitions, after Poletto and Sarkar. Code is straight
+line, so the live interval of a value runs from its definition to
+its last use. When registers run out the interval ending last is
+spilled to a stack slot.
+"""
+
+from bisect import bisect_right, insort
+from collections import namedtuple
+from dataclasses import dataclass, field
+from operator import attrgetter
+from compiler import ssa
+from compiler.arch import Arch
+
+RegisterFile = namedtuple(
+    "RegisterFile", "caller_saved callee_saved"
+)
+
+# Registers given to values. Argument, return and scratch registers
+# of the backends are left out, so moves into them never clobber a
+# value.
+REGISTER_FILES = {
+    Arch.x86_64: RegisterFile(
+        ("r10", "r11"),
+        ("rbx", "r12", "r13", "r14", "r15"),
+    ),
+    Arch.aarch64: RegisterFile(
+        ("x11", "x12", "x13", "x14", "x15"),
+        tuple(f"x{i}" for i in range(19, 29)),
+    ),
+}
+
+
+@dataclass(slots=True)
+class Interval:
+    value: ssa.Value
+    start: int
+    end: int
+    # Live across a call, so caller saved registers are clobbered
+    across_call: bool = False
+
+
+@dataclass(slots=True)
+class Allocation:
+    """Where the values of a function live
+
+    Spilled values have stack slots numbered from 0. Callee saved
+    registers the function uses are saved in the slots after them.
+    """
+
+    function: ssa.Function
+    registers: dict[ssa.Value, str] = field(default_factory=dict)
+    slots: dict[ssa.Value, int] = field(default_factory=dict)
+    saved: list[str] = field(default_factory=list)
+
+    def frame(self):
+        # Stack slots, spills then saved registers
+        return len(self.slots) + len(self.saved)
+
+
+def live_intervals(function):
+    """Interval of each value, in order of definition"""
+    intervals = {}
+    calls = []
+    for position, instruction in enumerate(
+        function.instructions()
+    ):
+        for operand in instruction.operands:
+            if type(operand) is ssa.Value:
+                intervals[operand].end = position
+        if instruction.op == "call":
+            calls.append(position)
+        if instruction.result is not None:
+            intervals[instruction.result] = Interval(
+                instruction.result, position, position
+            )
+    for interval in intervals.values():
+        after = bisect_right(calls, interval.start)
+        interval.across_call = (
+            after < len(calls) and calls[after] < interval.end
+        )
+    return list(intervals.values())
+
+
+def allocate(function, registers):
+    """Allocation of a function's values to a RegisterFile"""
+    allocation = Allocation(function)
+    free = set(registers.caller_saved + registers.callee_saved)
+    # Sorted by end, the first interval expires first
+    active = []
+    end = attrgetter("end")
+    for interval in live_intervals(function):
+        while active and active[0].end < interval.start:
+            expired = active.pop(0)
+            free.add(allocation.registers[expired.value])
+        usable = registers.callee_saved
+        if not interval.across_call:
+            usable = registers.caller_saved + usable
+        register = next((r for r in usable if r in free), None)
+        if register is not None:
+            free.remove(register)
+        else:
+            register = spill(
+                interval, active, usable, allocation
+            )
+            if register is None:
+                continue
+        allocation.registers[interval.value] = register
+        insort(active, interval, key=end)
+    allocation.saved = [
+        register
+        for register in registers.callee_saved
+        if register in allocation.registers.values()
+    ]
+    return allocation
+
+
+def spill(interval, active, usable, allocation):
+    """Spill the interval ending last, returning a freed register
+
+    The register of an active interval ending after this one is
+    taken from it, otherwise this interval is spilled.
+    """
+    candidates = [
+        other
+        for other in active
+        if allocation.registers[other.value] in usable
+    ]
+    if candidates:
+        last = max(candidates, key=attrgetter("end"))
+        if last.end > interval.end:
+            active.remove(last)
+            register = allocation.registers.pop(last.value)
+            allocation.slots[last.value] = len(allocation.slots)
+            return register
+    allocation.slots[interval.value] = len(allocation.slots)
+    return None
@@ -0,0 +1,186 @@
+"""
+Separate compilation of top-level functions
+
+Each top-level function is a unit, lowered and assembled into an
+object of its own, and the other top-level statements, the globals
+and the code of _start, are one more. A unit's object is cached
+under a key hashing its AST, without source positions, and the
+signatures of the functions it calls, so an edit rebuilds the
+objects of the units it touched and the link stitches the rest
+from the cache.
+
+Units are lowered without the whole program passes: nothing is
+inlined across units and functions read globals from memory rather
+than having their values folded in. The lets of _start are kept, a
+function in another unit may read them. Function names and globals
+are made global symbols, so objects link against each other.
+"""
+
+import os
+from collections import namedtuple
+from dataclasses import fields, is_dataclass
+from compiler import (
+    cache,
+    code_gen,
+    dce,
+    fold,
+    inline,
+    ir,
+    peephole,
+)
+from compiler.arch import Arch
+from compiler.ir import Instruction, Opcode
+from compiler.lexer import Token
+from compiler.parser import NodeFunction, NodeLet, NodeProgram
+
+Unit = namedtuple("Unit", "name statements exports key")
+
+# Files of a unit's cache entry
+FILES = ("unit.s", "unit.o")
+
+
+def units(program, **options):
+    """Units of a program, keyed for a build with options"""
+    functions = [
+        statement
+        for statement in program.statements
+        if isinstance(statement, NodeFunction)
+    ]
+    signatures = {
+        function.identifier.token.text: len(function.parameters)
+        for function in functions
+    }
+    statements = [
+        statement
+        for statement in program.statements
+        if not isinstance(statement, NodeFunction)
+    ]
+    lets = [
+        statement.identifier.token.text
+        for statement in statements
+        if isinstance(statement, NodeLet)
+    ]
+    result = [
+        unit(
+            function.identifier.token.text,
+            [function],
+            [function.identifier.token.text],
+            signatures,
+            options,
+        )
+        for function in functions
+    ]
+    result.append(
+        unit("_start", statements, lets, signatures, options)
+    )
+    return result
+
+
+def unit(name, statements, exports, signatures, options):
+    # A callee's parameter count is all a caller depends on
+    callees = sorted(
+        (callee, signatures.get(callee))
+        for callee in inline.callees(statements)
+    )
+    key = cache.key(
+        fingerprint(statements).encode(),
+        unit=name,
+        exports=exports,
+        callees=callees,
+        **options,
+    )
+    return Unit(name, statements, exports, key)
+
+
+def fingerprint(node):
+    """Text of a tree of nodes without their source positions
+
+    Nodes are written in preorder with their type and lists with
+    their length, so different trees have different text.
+    """
+    parts = []
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            parts.append(f"[{len(node)}")
+            pending += reversed(node)
+        elif isinstance(node, Token):
+            parts.append(f"{node.kind.name} {node.text!r}")
+        elif is_dataclass(node):
+            parts.append(type(node).__name__)
+            pending += reversed(
+                [
+                    getattr(node, field.name)
+                    for field in fields(node)
+                    if field.compare
+                ]
+            )
+        else:
+            parts.append(repr(node))
+    return "\n".join(parts)
+
+
+def lower(unit):
+    """IR of a unit on its own"""
+    instructions = ir.visit(NodeProgram(unit.statements))
+    exports = [
+        Instruction(Opcode.GLOBAL, name, None, None)
+        for name in unit.exports
+    ]
+    if unit.name == "_start":
+        # As for a stream, lets are kept for the other units
+        return [
+            *exports,
+            *dce.reachable(fold.propagate(instructions)),
+        ]
+    return [
+        *exports,
+        *(
+            instruction
+            for instruction in dce.eliminate(
+                fold.fold(instructions)
+            )
+            # Only the _start unit has a program entry
+            if instruction[0] != Opcode.GLOBAL
+            and instruction[:2] != (Opcode.LABEL, "_start")
+        ),
+    ]
+
+
+def build(program, arch: Arch, store, directory, assemble):
+    """Objects of the units of program, in link order, and the
+    number of units rebuilt
+
+    Each unit's files are restored from store, a cache.Cache, or
+    lowered and assembled by assemble(source, output) and stored.
+    They are placed in a directory of directory named by the unit.
+    """
+    backend = (
+        code_gen.aarch64_lines
+        if arch == Arch.aarch64
+        else code_gen.gas_lines
+    )
+    objects = []
+    rebuilt = 0
+    for unit in units(program, arch=arch.value):
+        target = os.path.join(directory, unit.name)
+        os.makedirs(target, exist_ok=True)
+        if not store.restore(
+            unit.key, FILES, target, count=False
+        ):
+            lines = peephole.optimise(backend(lower(unit)), arch)
+            source, output = (
+                os.path.join(target, name) for name in FILES
+            )
+            with open(source, "w") as stream:
+                for line in lines:
+                    stream.write(line + "\n")
+            assemble(source, output)
+            store.store(unit.key, FILES, target, evict=False)
+            rebuilt += 1
+        objects.append(os.path.join(target, FILES[1]))
+    store.count(hits=len(objects) - rebuilt, misses=rebuilt)
+    if rebuilt:
+        store.evict()
+    return objects, rebuilt
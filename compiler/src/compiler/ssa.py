@@ -0,0 +1,251 @@
+"""
+Static single assignment form
+
+Built from the pseudo code of pseudo.Visitor, whose registers are
+reused from one statement to the next, by giving every definition
+a fresh Value. Code is straight-line apart from calls, so blocks
+never join and no phi nodes are needed.
+"""
+
+from __future__ import annotations
+
+from collections import namedtuple
+from dataclasses import dataclass, field
+from compiler import pseudo
+
+Value = namedtuple("Value", "index")
+
+# Instructions ending a block
+TERMINATORS = {"ret", "tailcall"}
+
+# Binary operations of pseudo code, kept as they are
+ARITHMETIC = {"add", "sub", "mul", "div", "pow"}
+
+
+@dataclass(slots=True)
+class Instruction:
+    """Three-address instruction, result = op operands"""
+
+    op: str
+    result: Value | None
+    operands: tuple
+
+
+@dataclass(slots=True)
+class Block:
+    label: str
+    instructions: list[Instruction] = field(default_factory=list)
+    predecessors: list[Block] = field(default_factory=list)
+    successors: list[Block] = field(default_factory=list)
+
+    def terminated(self):
+        return (
+            len(self.instructions) > 0
+            and self.instructions[-1].op in TERMINATORS
+        )
+
+
+@dataclass(slots=True)
+class Function:
+    """Blocks of a function with the def-use chains of its values"""
+
+    name: str
+    parameters: int = 0
+    blocks: list[Block] = field(default_factory=list)
+    definitions: list[Instruction] = field(default_factory=list)
+    uses: list[list[Instruction]] = field(default_factory=list)
+
+    def instructions(self):
+        for block in self.blocks:
+            yield from block.instructions
+
+    def append(self, op, *operands, result=True):
+        """Add an instruction to the last block, with a new Value
+
+        The instruction is recorded as the definition of its result
+        and as a use of each Value among its operands.
+        """
+        if result:
+            instruction = self.define(op, *operands)
+        else:
+            instruction = Instruction(op, None, operands)
+        for operand in operands:
+            if type(operand) is Value:
+                self.uses[operand.index].append(instruction)
+        self.blocks[-1].instructions.append(instruction)
+        return instruction.result
+
+    def define(self, op, *operands):
+        # Instruction defining a new Value, for the caller to place
+        # in a block
+        value = Value(len(self.definitions))
+        instruction = Instruction(op, value, operands)
+        self.definitions.append(instruction)
+        self.uses.append([])
+        return instruction
+
+    def link(self):
+        """Rebuild the def-use chains from the instructions
+
+        Values whose definitions were removed keep them.
+        """
+        self.uses = [[] for _ in self.definitions]
+        for instruction in self.instructions():
+            for operand in instruction.operands:
+                if type(operand) is Value:
+                    self.uses[operand.index].append(instruction)
+
+    def definition(self, value):
+        return self.definitions[value.index]
+
+    def users(self, value):
+        return self.uses[value.index]
+
+
+@dataclass(slots=True)
+class Module:
+    functions: list[Function]
+    # Names of global variables, top-level lets
+    globals: list[str]
+
+
+def build(ast: pseudo.AST) -> Module:
+    """SSA form of a pseudo program
+
+    Functions are built from their pseudo code on their own.
+    Top-level statements form the _start function, where a return
+    is the exit status of the program.
+    """
+    visitor = pseudo.Visitor()
+    globals_ = {}
+    start = Builder(Function("_start"), globals_, top_level=True)
+    start.begin("_start")
+    functions = []
+    for statement in ast.statements:
+        instructions = visitor.visit_statement(statement)
+        if visitor.is_fn(statement):
+            builder = Builder(
+                Function(statement.id.data, len(statement.args)),
+                globals_,
+            )
+            builder.build(instructions)
+            functions.append(builder.finish())
+        else:
+            start.build(instructions)
+    functions.append(start.finish())
+    return Module(functions, list(globals_))
+
+
+class Builder:
+    """Renames the registers and variables of pseudo code to Values"""
+
+    def __init__(self, function, globals_, top_level=False):
+        self.function = function
+        # Global variables in order of first mention
+        self.globals = globals_
+        self.top_level = top_level
+        self.registers = {}
+        self.variables = {}
+        self.arguments = {}
+        self.returned = None
+
+    def begin(self, label):
+        block = Block(label)
+        self.function.blocks.append(block)
+        return block
+
+    def build(self, instructions):
+        for instruction in instructions:
+            if (
+                self.function.blocks
+                and self.function.blocks[-1].terminated()
+            ):
+                # Code after a return is unreachable
+                self.begin(
+                    f"{self.function.name}.{len(self.function.blocks)}"
+                )
+            op = instruction[0]
+            if op == "label":
+                self.begin(instruction[1])
+            elif op == "mov":
+                self.move(*instruction[1:])
+            elif op == "call":
+                arguments = [
+                    self.arguments[i]
+                    for i in range(len(self.arguments))
+                ]
+                self.arguments = {}
+                self.returned = self.function.append(
+                    "call", instruction[1], *arguments
+                )
+            elif op in ARITHMETIC:
+                lhs, rhs, out = instruction[1:]
+                self.registers[out] = self.function.append(
+                    op, self.registers[lhs], self.registers[rhs]
+                )
+            else:
+                raise Exception(
+                    f"Unknown instruction: {instruction}"
+                )
+
+    def move(self, destination, source):
+        value = self.value(source)
+        if type(destination) is pseudo.register:
+            self.registers[destination] = value
+        elif type(destination) is pseudo.parameter:
+            self.arguments[destination.i] = value
+        elif destination == "rax":
+            self.function.append("ret", value, result=False)
+        else:
+            self.variables[destination] = value
+            if self.top_level:
+                self.globals[destination] = None
+                self.function.append(
+                    "store", destination, value, result=False
+                )
+
+    def value(self, source):
+        if type(source) is int:
+            return self.function.append("const", source)
+        elif type(source) is pseudo.register:
+            return self.registers[source]
+        elif type(source) is pseudo.parameter:
+            return self.function.append("parameter", source.i)
+        elif source == "rax":
+            return self.returned
+        elif source in self.variables:
+            return self.variables[source]
+        self.globals[source] = None
+        return self.function.append("load", source)
+
+    def finish(self):
+        # Falling off the end returns 0
+        if not self.function.blocks[-1].terminated():
+            zero = self.function.append("const", 0)
+            self.function.append("ret", zero, result=False)
+        if not self.top_level:
+            tail_calls(self.function)
+        return self.function
+
+
+def tail_calls(function):
+    """Turn calls whose value is returned into tail calls
+
+    A tail call ends its block and returns the callee's value
+    itself, so the caller's frame can be reused. The return of
+    _start exits the program instead, so it has none.
+    """
+    for block in function.blocks:
+        if len(block.instructions) < 2:
+            continue
+        call, ret = block.instructions[-2:]
+        if (
+            call.op == "call"
+            and ret.op == "ret"
+            and ret.operands == (call.result,)
+            and function.users(call.result) == [ret]
+        ):
+            function.users(call.result).clear()
+            call.op = "tailcall"
+            call.result = None
+            block.instructions.pop()
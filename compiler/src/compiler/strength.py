@@ -0,0 +1,206 @@
+"""
+Strength reduction over SSA form
+
+Arithmetic with a constant operand is rewritten into cheaper
+instructions, which the backends lower for their architecture:
+
+    muli value factor       shifts, lea or add with a shifted
+                            operand, multiply by an immediate
+    divi value divisor      shifts for powers of two, otherwise a
+                            multiply by the divisor's magic number
+    madd lhs rhs addend     a multiply whose value is only added,
+                            one instruction on aarch64
+
+A power with a constant exponent is expanded into multiplies by
+square and multiply. Run after lvn.number, so operands equal to
+constants are the same Value.
+"""
+
+# Operations of constants, as fold evaluates them
+from compiler.ir import divide, power, wrap
+
+WORD = 2**64
+
+
+def reduce(module):
+    """Module with arithmetic by constants reduced"""
+    for function in module.functions:
+        reduce_function(function)
+    return module
+
+
+def reduce_function(function):
+    replaced = {}
+    for block in function.blocks:
+        instructions = []
+        for instruction in block.instructions:
+            instruction.operands = tuple(
+                replaced.get(operand, operand)
+                for operand in instruction.operands
+            )
+            value = REDUCERS.get(instruction.op, keep)(
+                function, instruction, instructions
+            )
+            if value is not None:
+                replaced[instruction.result] = value
+        block.instructions = instructions
+    function.link()
+    # Constants now immediates are left unused
+    for block in function.blocks:
+        block.instructions = [
+            instruction
+            for instruction in block.instructions
+            if instruction.op != "const"
+            or function.users(instruction.result)
+        ]
+    fuse(function)
+    return function
+
+
+def constant(function, value):
+    """Integer a Value is defined as, None if not a constant"""
+    if type(value) is not int:
+        definition = function.definition(value)
+        if definition.op == "const":
+            return definition.operands[0]
+    return None
+
+
+def keep(function, instruction, instructions):
+    instructions.append(instruction)
+
+
+def emit(function, instructions, op, *operands):
+    instruction = function.define(op, *operands)
+    instructions.append(instruction)
+    return instruction.result
+
+
+def reduce_mul(function, instruction, instructions):
+    lhs, rhs = instruction.operands
+    lhs_constant = constant(function, lhs)
+    rhs_constant = constant(function, rhs)
+    if lhs_constant is not None and rhs_constant is not None:
+        return emit(
+            function,
+            instructions,
+            "const",
+            wrap(lhs_constant * rhs_constant),
+        )
+    if lhs_constant is not None:
+        lhs, rhs, rhs_constant = rhs, lhs, lhs_constant
+    if rhs_constant is None:
+        return keep(function, instruction, instructions)
+    if rhs_constant == 0:
+        return emit(function, instructions, "const", 0)
+    if rhs_constant == 1:
+        return lhs
+    instruction.op = "muli"
+    instruction.operands = (lhs, rhs_constant)
+    instructions.append(instruction)
+
+
+def reduce_div(function, instruction, instructions):
+    lhs, rhs = instruction.operands
+    lhs_constant = constant(function, lhs)
+    divisor = constant(function, rhs)
+    if not divisor:
+        # Division by zero faults at run time as it did
+        return keep(function, instruction, instructions)
+    if lhs_constant is not None:
+        return emit(
+            function,
+            instructions,
+            "const",
+            wrap(divide(lhs_constant, divisor)),
+        )
+    if divisor == 1:
+        return lhs
+    instruction.op = "divi"
+    instruction.operands = (lhs, divisor)
+    instructions.append(instruction)
+
+
+def reduce_pow(function, instruction, instructions):
+    base, exponent = instruction.operands
+    base_constant = constant(function, base)
+    exponent = constant(function, exponent)
+    if exponent is None or exponent < 0:
+        return keep(function, instruction, instructions)
+    if base_constant is not None:
+        return emit(
+            function,
+            instructions,
+            "const",
+            wrap(power(base_constant, exponent)),
+        )
+    if exponent == 0:
+        return emit(function, instructions, "const", 1)
+    # Bits of the exponent from the highest, squaring for each
+    # and multiplying by the base for each set one
+    value = base
+    for bit in bin(exponent)[3:]:
+        value = emit(function, instructions, "mul", value, value)
+        if bit == "1":
+            value = emit(
+                function, instructions, "mul", value, base
+            )
+    return value
+
+
+REDUCERS = {
+    "mul": reduce_mul,
+    "div": reduce_div,
+    "pow": reduce_pow,
+}
+
+
+def fuse(function):
+    """Fold multiplies only added into madd instructions
+
+    The multiply is removed and the add takes its operands, so
+    they are live until the add.
+    """
+    fused = set()
+    for instruction in function.instructions():
+        if instruction.op != "add":
+            continue
+        for product, addend in (
+            instruction.operands,
+            reversed(instruction.operands),
+        ):
+            definition = function.definition(product)
+            if definition.op == "mul" and function.users(
+                product
+            ) == [instruction]:
+                instruction.op = "madd"
+                instruction.operands = (
+                    *definition.operands,
+                    addend,
+                )
+                fused.add(id(definition))
+                break
+    if fused:
+        for block in function.blocks:
+            block.instructions = [
+                instruction
+                for instruction in block.instructions
+                if id(instruction) not in fused
+            ]
+        function.link()
+
+
+def magic(divisor):
+    """Magic number and shift of a signed 64 bit division
+
+    For a divisor above 1 that is not a power of two, the quotient
+    of n is the high word of n * magic shifted right by shift,
+    plus n when magic is negative, plus one when negative. After
+    Hacker's Delight, 10-1.
+    """
+    # Largest dividend whose remainder is divisor - 1
+    limit = WORD // 2 - 1 - (WORD // 2) % divisor
+    shift = 64
+    while 2**shift <= limit * (divisor - 2**shift % divisor):
+        shift += 1
+    return wrap(-(-(2**shift) // divisor)), shift - 64
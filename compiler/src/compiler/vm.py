@@ -0,0 +1,435 @@
+"""
+Register bytecode virtual machine
+
+The IR of ir.visit or ir.visit_stream is translated to bytecode for
+a register machine, so programs run without an assembler, a linker
+or the target architecture. Each function has a register file,
+parameters first, then its lets, temporaries and the constants it
+uses. A call copies the callee's template register file, with its
+constants already in place, and the arguments into its first
+registers.
+
+Instructions are (op, a, b, c) tuples:
+
+    ADD, SUB, MUL, DIV, POW a b c   a = b op c
+    MOVE a b                        a = b
+    LOAD a b                        a = global b
+    STORE a b                       global a = b
+    CALL a callee arguments         a = callee(arguments)
+    RET a                           return a
+    PRINT a                         print a
+    EXIT a                          exit with status a
+"""
+
+import sys
+from collections import namedtuple
+from dataclasses import dataclass, field
+from compiler.ir import Expression, Opcode, StackSlot, divide
+
+ADD, SUB, MUL, DIV, POW, MOVE, LOAD, STORE = range(8)
+CALL, RET, PRINT, EXIT = range(8, 12)
+
+OPERATORS = {
+    "ADD": ADD,
+    "SUB": SUB,
+    "MUL": MUL,
+    "DIV": DIV,
+    "POW": POW,
+}
+
+# Frames a program may nest before it is taken to have overflowed
+# the stack
+DEPTH = 100_000
+
+WORD = 2**64
+LIMIT = 2**63
+
+
+class Fault(Exception):
+    """A program error a native program is killed by a signal for
+
+    status is that a shell reports, 128 plus the signal number.
+    """
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+# Marks where an operator is applied while translating an
+# expression
+Apply = namedtuple("Apply", "operator")
+
+
+@dataclass(slots=True)
+class Function:
+    """Bytecode of a function and its register file"""
+
+    name: str
+    parameters: int = 0
+    code: list = field(default_factory=list)
+    # Registers of parameters and lets by name
+    names: dict = field(default_factory=dict)
+    constants: dict = field(default_factory=dict)
+    registers: int = 0
+    free: list = field(default_factory=list)
+    temporaries: set = field(default_factory=set)
+    # First instruction, set when the program is linked
+    entry: int = 0
+
+    def register(self):
+        self.registers += 1
+        return self.registers - 1
+
+    def temporary(self):
+        register = (
+            self.free.pop() if self.free else self.register()
+        )
+        self.temporaries.add(register)
+        return register
+
+    def release(self, register):
+        if register in self.temporaries:
+            self.temporaries.remove(register)
+            self.free.append(register)
+
+    def constant(self, value):
+        register = self.constants.get(value)
+        if register is None:
+            register = self.constants[value] = self.register()
+        return register
+
+    def template(self):
+        registers = [0] * self.registers
+        for value, register in self.constants.items():
+            registers[register] = value
+        return registers
+
+
+@dataclass(slots=True)
+class Program:
+    code: list
+    # Register file of _start, where the program begins
+    registers: list
+    entry: int
+    globals: int
+
+
+def translate(instructions):
+    """Program of the IR instructions of a whole program"""
+    return Translator().translate(instructions)
+
+
+class Translator:
+    def __init__(self):
+        self.start = Function("_start")
+        # Global ints are initialised first, in the frame of _start
+        self.initialise = []
+        self.functions = {}
+        self.function = self.start
+        self.globals = {}
+        self.defined = set()
+        # Arguments of a call statement, stored before the call
+        self.arguments = []
+
+    def translate(self, instructions):
+        for instruction in instructions:
+            op, arg1, arg2, result = instruction
+            handler = HANDLERS.get(op)
+            if handler is not None:
+                handler(self, arg1, arg2, result)
+        return self.link()
+
+    def section(self, name, subsection, result):
+        if (name, subsection) == ("text", 1):
+            # visit_stream places the code of _start there
+            self.function = self.start
+
+    def label(self, name, arg2, result):
+        if name == "_start":
+            self.function = self.start
+        else:
+            self.function = self.functions[name] = Function(name)
+
+    def int_(self, name, value, result):
+        code, self.start.code = self.start.code, self.initialise
+        function, self.function = self.function, self.start
+        self.store(name, self.value(value))
+        self.start.code, self.function = code, function
+        self.defined.add(name)
+
+    def assign(self, name, value, result):
+        # Lets shadow globals of the same name, as in fold
+        function = self.function
+        register = function.names.get(name)
+        if register is not None:
+            self.value(value, register)
+            return
+        # The value may read a global of the same name, so the name
+        # is bound after it
+        register = self.value(value)
+        if register in function.temporaries:
+            function.temporaries.remove(register)
+        else:
+            source, register = register, function.register()
+            self.emit(MOVE, register, source)
+        function.names[name] = register
+
+    def parameter(self, index, size, name):
+        function = self.function
+        function.parameters = index
+        function.names[name] = function.register()
+
+    def store_parameter(self, index, value, result):
+        self.arguments.append(self.value(value))
+
+    def call(self, name, arg2, result):
+        arguments, self.arguments = self.arguments, []
+        self.function.release(self.emit_call(name, arguments))
+
+    def exit(self, value, arg2, result):
+        register = self.value(value)
+        self.emit(EXIT, register)
+        self.function.release(register)
+
+    def print_(self, value, arg2, result):
+        register = self.value(value)
+        self.emit(PRINT, register)
+        self.function.release(register)
+
+    def return_(self, value, arg2, result):
+        register = self.value(value)
+        # A return from _start exits the program
+        self.emit(
+            EXIT if self.function is self.start else RET,
+            register,
+        )
+        self.function.release(register)
+
+    def ret(self, arg1, arg2, result):
+        # Falling off the end of a function returns 0
+        self.emit(RET, self.function.constant(0))
+        self.function = self.start
+
+    def emit(self, op, a, b=None, c=None):
+        self.function.code.append((op, a, b, c))
+
+    def emit_call(self, name, arguments, target=None):
+        function = self.function
+        for register in arguments:
+            function.release(register)
+        if target is None:
+            target = function.temporary()
+        # The callee is resolved when the program is linked
+        self.emit(CALL, target, name, tuple(arguments))
+        return target
+
+    def store(self, name, register):
+        self.emit(STORE, self.global_(name), register)
+        self.function.release(register)
+
+    def global_(self, name):
+        index = self.globals.get(name)
+        if index is None:
+            index = self.globals[name] = len(self.globals)
+        return index
+
+    def leaf(self, value):
+        """Register holding an int, a name or a parameter"""
+        function = self.function
+        kind = type(value)
+        if kind is int:
+            return function.constant(value)
+        if kind is StackSlot:
+            return value.index - 1
+        register = function.names.get(value)
+        if register is None:
+            register = function.temporary()
+            self.emit(LOAD, register, self.global_(value))
+        return register
+
+    def value(self, value, target=None):
+        """Register holding a value, target when given
+
+        Expressions are translated with an explicit stack, as in
+        ir.visit_expression, so deep trees do not recurse.
+        """
+        function = self.function
+        registers = []
+        pending = [value]
+        while pending:
+            item = pending.pop()
+            kind = type(item)
+            if kind is Expression:
+                pending += (
+                    Apply(item.operator),
+                    item.rhs,
+                    item.lhs,
+                )
+            elif kind is Apply:
+                rhs = registers.pop()
+                lhs = registers.pop()
+                function.release(rhs)
+                function.release(lhs)
+                register = target
+                if pending or target is None:
+                    register = function.temporary()
+                self.emit(
+                    OPERATORS[item.operator], register, lhs, rhs
+                )
+                registers.append(register)
+            elif kind is list:
+                registers.append(
+                    self.call_value(
+                        item, None if pending else target
+                    )
+                )
+            else:
+                registers.append(self.leaf(item))
+        (register,) = registers
+        if target is not None and register != target:
+            self.emit(MOVE, target, register)
+            function.release(register)
+            return target
+        return register
+
+    def call_value(self, instructions, target=None):
+        # The instructions of a call used as a value
+        arguments = []
+        for op, arg1, arg2, _ in instructions:
+            if op == Opcode.STORE_PARAMETER:
+                arguments.append(self.value(arg2))
+            elif op == Opcode.CALL:
+                return self.emit_call(arg1, arguments, target)
+
+    def link(self):
+        # Program of the functions translated, calls resolved
+        undefined = set(self.globals) - self.defined
+        if undefined:
+            raise Exception(
+                f"Unknown symbols: {sorted(undefined)}"
+            )
+        start = self.start
+        start.code = self.initialise + start.code
+        # Falling off the end of the program exits with 0
+        start.code.append((EXIT, start.constant(0), None, None))
+        code = []
+        for function in (start, *self.functions.values()):
+            function.entry = len(code)
+            code += function.code
+        callees = {}
+        for pc, (op, a, b, c) in enumerate(code):
+            if op == CALL:
+                callee = self.functions.get(b)
+                if callee is None:
+                    raise Exception(f"Unknown function: {b}")
+                if b not in callees:
+                    callees[b] = (
+                        callee.entry,
+                        callee.template(),
+                    )
+                # Extra arguments have no parameter to go to
+                code[pc] = (
+                    CALL,
+                    a,
+                    callees[b],
+                    c[: callee.parameters],
+                )
+        return Program(
+            code,
+            start.template(),
+            start.entry,
+            len(self.globals),
+        )
+
+
+HANDLERS = {
+    Opcode.SECTION: Translator.section,
+    Opcode.LABEL: Translator.label,
+    Opcode.INT: Translator.int_,
+    Opcode.ASSIGN: Translator.assign,
+    Opcode.PARAMETER: Translator.parameter,
+    Opcode.STORE_PARAMETER: Translator.store_parameter,
+    Opcode.CALL: Translator.call,
+    Opcode.EXIT: Translator.exit,
+    Opcode.PRINT: Translator.print_,
+    Opcode.RETURN: Translator.return_,
+    Opcode.RET: Translator.ret,
+}
+
+
+def run(program, out=None):
+    """Exit status of a program, printing to out or stdout
+
+    Values wrap around to signed 64 bits and the status is the low
+    byte of the exit value, as on the native targets.
+    """
+    write = (out or sys.stdout).write
+    code = program.code
+    globals_ = [0] * program.globals
+    registers = program.registers.copy()
+    pc = program.entry
+    frames = []
+    # Opcodes as locals, the loop compares against them every step
+    add, sub, mul, move, load, store = (
+        ADD,
+        SUB,
+        MUL,
+        MOVE,
+        LOAD,
+        STORE,
+    )
+    call, ret, div, pow_, print_ = CALL, RET, DIV, POW, PRINT
+    while True:
+        op, a, b, c = code[pc]
+        pc += 1
+        if op == add:
+            value = registers[b] + registers[c]
+            if not -LIMIT <= value < LIMIT:
+                value = (value + LIMIT) % WORD - LIMIT
+            registers[a] = value
+        elif op == move:
+            registers[a] = registers[b]
+        elif op == load:
+            registers[a] = globals_[b]
+        elif op == call:
+            if len(frames) == DEPTH:
+                raise Fault("stack overflow", 128 + 11)
+            entry, template = b
+            frame = template.copy()
+            for index, register in enumerate(c):
+                frame[index] = registers[register]
+            frames.append((pc, registers, a))
+            registers = frame
+            pc = entry
+        elif op == ret:
+            value = registers[a]
+            pc, registers, result = frames.pop()
+            registers[result] = value
+        elif op == sub:
+            value = registers[b] - registers[c]
+            if not -LIMIT <= value < LIMIT:
+                value = (value + LIMIT) % WORD - LIMIT
+            registers[a] = value
+        elif op == mul:
+            value = registers[b] * registers[c]
+            if not -LIMIT <= value < LIMIT:
+                value = (value + LIMIT) % WORD - LIMIT
+            registers[a] = value
+        elif op == store:
+            globals_[a] = registers[b]
+        elif op == div:
+            value = divide(registers[b], registers[c])
+            if value is None or value == LIMIT:
+                # idiv faults on both, sdiv would not
+                raise Fault("division error", 128 + 8)
+            registers[a] = value
+        elif op == pow_:
+            # A negative exponent is taken as unsigned, as the
+            # backends' square and multiply loops do
+            value = pow(registers[b], registers[c] % WORD, WORD)
+            registers[a] = (value + LIMIT) % WORD - LIMIT
+        elif op == print_:
+            write(f"{registers[a]}\n")
+        else:
+            return registers[a] & 0xFF
@@ -3,10 +3,8 @@
 
 _start:
         mov x1, #0x1
-        mov x0, #0x2
-        add x1, x1, x0
-        mov x0, #0x3
-        add x1, x1, x0
+        add x1, x1, #0x2
+        add x1, x1, #0x3
         mov x8, #0x5d
         mov x0, x1
         svc 0
@@ -8,4 +8,3 @@ _start:
         mov x8, #0x5d
         ldr x0, [sp, #0x8]
         svc 0
-        add sp, sp, #0x10
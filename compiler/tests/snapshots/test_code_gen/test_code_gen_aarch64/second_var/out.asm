@@ -3,11 +3,8 @@
 
 _start:
         sub sp, sp, #0x10
-        mov x1, #0x2a
-        str x1, [sp, #0x8]
         mov x1, #0x7
-        str x1, [sp, #0x10]
+        str x1, [sp, #0x8]
         mov x8, #0x5d
-        ldr x0, [sp, #0x10]
+        ldr x0, [sp, #0x8]
         svc 0
-        add sp, sp, #0x10
@@ -3,10 +3,8 @@
 
 _start:
         mov x1, #0x7
-        mov x0, #0x3
-        sub x1, x1, x0
-        mov x0, #0x2
-        sub x1, x1, x0
+        sub x1, x1, #0x3
+        sub x1, x1, #0x2
         mov x8, #0x5d
         mov x0, x1
         svc 0
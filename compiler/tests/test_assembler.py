@@ -0,0 +1,186 @@
+import pytest
+from compiler import assembler
+from compiler.arch import Arch
+from compiler.assembler import AssemblerError, Fixup
+
+
+@pytest.mark.parametrize(
+    "line,code",
+    [
+        ("\tmov\t%rsp, %rbp", "4889e5"),
+        ("\tmov\t$60, %rax", "48c7c03c000000"),
+        ("\tmov\t%rdi, -8(%rbp)", "48897df8"),
+        ("\tmov\t-8(%rbp), %r12", "4c8b65f8"),
+        ("\tmovabs\t$0x123456789, %rax", "48b88967452301000000"),
+        ("\tlea\t(%rax,%rax,4), %r11", "4c8d1c80"),
+        ("\timul\t$12345, %rbx, %rcx", "4869cb39300000"),
+        ("\tidivq\t16(%rsp)", "48f77c2410"),
+        ("\tpush\t%r15", "4157"),
+        ("\tsar\t$63, %rdx", "48c1fa3f"),
+        ("\tcqo", "4899"),
+        ("\tsyscall", "0f05"),
+    ],
+)
+def test_encode(line, code):
+    # Bytes as the GNU assembler encodes them
+    program = assembler.assemble([line])
+    assert program.sections["text"].hex() == code
+
+
+@pytest.mark.parametrize(
+    "line,code",
+    [
+        ("stp x29, x30, [sp, #-16]!", "fd7bbfa9"),
+        ("ldp x29, x30, [sp], #16", "fd7bc1a8"),
+        ("mov x29, sp", "fd030091"),
+        ("mov x0, x13", "e0030daa"),
+        ("mov x8, #0x5d", "a80b80d2"),
+        ("mov x9, #-2", "29008092"),
+        ("add x16, sp, x16", "f063308b"),
+        ("add x9, x10, x11, lsr #63", "49fd4b8b"),
+        ("sub sp, sp, #0x20", "ff8300d1"),
+        ("madd x9, x10, x11, x16", "49410b9b"),
+        ("mul x9, x9, x9", "297d099b"),
+        ("smulh x16, x9, x16", "307d509b"),
+        ("sdiv x9, x10, x11", "490dcb9a"),
+        ("lsl x10, x9, #3", "2af17dd3"),
+        ("asr x16, x9, #63", "30fd7f93"),
+        ("ldr x9, [sp, #8]", "e90740f9"),
+        ("str x1, [sp, #-8]", "e1831ff8"),
+        ("svc 0", "010000d4"),
+        ("ret", "c0035fd6"),
+        # movz and movk rather than a literal pool load
+        ("ldr x16, =0x123456789", "30f18cd2b068a4f23000c0f2"),
+    ],
+)
+def test_encode_aarch64(line, code):
+    # Bytes as the LLVM assembler encodes them
+    program = assembler.assemble([line], Arch.aarch64)
+    assert program.sections["text"].hex() == code
+
+
+def test_symbols_and_fixups():
+    program = assembler.assemble(
+        [
+            ".global _start",
+            "\n.data",
+            "x: .int 0x2a",
+            "\n.text",
+            "_start:",
+            "\tmov\tx, %rdi",
+            "\tcall\tf\n",
+            "f:",
+            "\tret",
+        ]
+    )
+    assert program.globals == {"_start"}
+    assert program.symbols == {
+        "x": ("data", 0),
+        "_start": ("text", 0),
+        "f": ("text", 12),
+    }
+    assert program.sections["data"] == bytes([42, 0, 0, 0])
+    assert program.fixups == [
+        Fixup("text", 3, "x", -4),
+        Fixup("text", 8, "f", -4),
+    ]
+    sections = assembler.link(
+        program, {"text": 0x1000, "data": 0x3000}
+    )
+    # rip relative, from the end of each instruction
+    assert sections["text"][3:7] == (0x3000 - 0x1007).to_bytes(
+        4, "little"
+    )
+    assert sections["text"][8:12] == bytes(4)
+
+
+def test_subsections_follow_their_section():
+    program = assembler.assemble(
+        [".text 1", "a:", "\tret", ".text", "b:", "\tnop"]
+    )
+    assert program.sections["text"] == b"\x90\xc3"
+    assert program.symbols == {
+        "a": ("text", 1),
+        "b": ("text", 0),
+    }
+
+
+@pytest.mark.parametrize(
+    "lines",
+    [
+        ["\tfrobnicate\t%rax"],
+        [".weak x"],
+        ["\tmov\t%rax"],
+        ["\tmov\t%eax, %rbx"],
+        ["x:", "x:"],
+    ],
+    ids=[
+        "instruction",
+        "directive",
+        "operands",
+        "register",
+        "twice",
+    ],
+)
+def test_errors(lines):
+    with pytest.raises(AssemblerError):
+        assembler.assemble(lines)
+
+
+def test_link_unknown_symbol():
+    program = assembler.assemble(["\tcall\tmissing"])
+    with pytest.raises(AssemblerError):
+        assembler.link(program, {"text": 0})
+
+
+def test_link_aarch64():
+    program = assembler.assemble(
+        [
+            ".section .data",
+            ".balign 8",
+            "g: .quad 0",
+            ".section .text",
+            "_start:",
+            "adrp x9, g",
+            "ldr x9, [x9, :lo12:g]",
+            "cbnz x9, _start",
+            "bl _start",
+        ],
+        Arch.aarch64,
+    )
+    assert [fixup.kind for fixup in program.fixups] == [
+        "page21",
+        "lo12_64",
+        "branch19",
+        "branch26",
+    ]
+    sections = assembler.link(
+        program, {"text": 0x400FFC, "data": 0x412340}
+    )
+    words = [
+        int.from_bytes(sections["text"][i : i + 4], "little")
+        for i in range(0, 16, 4)
+    ]
+    # 0x12 pages on from the page of the adrp
+    assert (
+        words[0]
+        == 0x90000089 | (0x12 & 3) << 29 | (0x12 >> 2) << 5
+    )
+    assert words[1] == 0xF9400129 | (0x340 // 8) << 10
+    assert words[2] == 0xB5000009 | (-2 & 0x7FFFF) << 5
+    assert words[3] == 0x94000000 | (-3 & 0x3FFFFFF)
+
+
+def test_link_out_of_range():
+    program = assembler.assemble(
+        ["_start:", "tbz x0, #1, far"], Arch.aarch64
+    )
+    program.symbols["far"] = ("data", 0)
+    # tbz reaches 32 KiB either way
+    assembler.link(program, {"text": 0, "data": 0x7FFC})
+    with pytest.raises(AssemblerError):
+        assembler.link(program, {"text": 0, "data": 0x8000})
+    far = assembler.assemble(["b far"], Arch.aarch64)
+    far.symbols["far"] = ("data", 0)
+    with pytest.raises(AssemblerError):
+        assembler.link(far, {"text": 0, "data": 2**28})
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import pytest
+from compiler import cache, main
+from compiler.arch import Arch
+
+NAMES = ("a.txt", "b.txt")
+
+
+def write(directory, text):
+    for name in NAMES:
+        (directory / name).write_text(f"{name} {text}")
+
+
+def test_key():
+    key = cache.key(b"exit(1);", arch="x86_64")
+    assert key == cache.key(b"exit(1);", arch="x86_64")
+    assert key != cache.key(b"exit(2);", arch="x86_64")
+    assert key != cache.key(b"exit(1);", arch="aarch64")
+    assert key != cache.key(b"exit(1);")
+
+
+def test_file_digest(tmp_path, monkeypatch):
+    source = b"print(1);\n" * 100
+    (tmp_path / "a.lp").write_bytes(source)
+    # Hashed across several chunks
+    monkeypatch.setattr(cache, "CHUNK", 64)
+    assert (
+        cache.file_digest(tmp_path / "a.lp")
+        == hashlib.sha256(source).digest()
+    )
+
+
+def test_restore_and_store(tmp_path):
+    store = cache.Cache(tmp_path / "cache")
+    build = tmp_path / "build"
+    build.mkdir()
+    assert not store.restore("k", NAMES, build)
+    write(build, "first")
+    store.store("k", NAMES, build)
+    write(build, "changed")
+    assert store.restore("k", NAMES, build)
+    assert (build / "a.txt").read_text() == "a.txt first"
+    assert store.stats() == cache.Stats(hits=1, misses=1)
+    # Counts are kept in the cache, across instances
+    assert cache.Cache(tmp_path / "cache").stats().hits == 1
+
+
+def test_evict_least_recently_used(tmp_path):
+    store = cache.Cache(tmp_path / "cache", limit=50)
+    build = tmp_path / "build"
+    build.mkdir()
+    write(build, "entry")
+    for key, when in (("old", 1), ("used", 2), ("new", 3)):
+        store.store(key, NAMES, build)
+        os.utime(os.path.join(store.entries, key), (when, when))
+    # Entries are 22 bytes, two fit
+    store.restore("used", NAMES, build)
+    store.store("newest", NAMES, build)
+    assert sorted(os.listdir(store.entries)) == [
+        "newest",
+        "used",
+    ]
+    assert store.stats().evictions == 2
+
+
+@pytest.fixture
+def toolchain(monkeypatch):
+    """Commands run, faking the assembler and linker"""
+    commands = []
+
+    def check_call(command):
+        commands.append(command[0])
+        output = command[command.index("-o") + 1]
+        with open(output, "w") as stream:
+            stream.write(command[0])
+
+    monkeypatch.setattr(
+        main.subprocess, "check_call", check_call
+    )
+    return commands
+
+
+def test_main_cached_build(tmp_path, monkeypatch, toolchain):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.lp").write_text("exit(3);\n")
+    options = dict(arch=Arch.x86_64, cache_dir="cache")
+    main.main("a.lp", **options)
+    assert len(toolchain) == 2
+    os.remove("vinyl.exe")
+    main.main("a.lp", **options)
+    assert len(toolchain) == 2
+    assert os.path.exists("vinyl.exe")
+    # Other options are another build
+    main.main("a.lp", gcc_version=12, **options)
+    assert len(toolchain) == 4
+    stats = cache.Cache("cache").stats()
+    assert (stats.hits, stats.misses) == (1, 2)
@@ -1,6 +1,15 @@
 import pytest
+from compiler import assembler, ir
 from compiler.arch import Arch
-from compiler.code_gen import code_gen, stack_alignment
+from compiler.code_gen import (
+    CodeGenError,
+    aarch64_exit,
+    aarch64_lines,
+    aarch64_value,
+    code_gen,
+    stack_alignment,
+)
+from compiler.ir import Expression, StackSlot
 from compiler.parser import parse
 
 
@@ -66,3 +75,62 @@ def test_code_gen_aarch64(snapshot, program):
 )
 def test_stack_alignment(size, expected):
     assert stack_alignment(size) == expected
+
+
+@pytest.mark.parametrize(
+    "status,line",
+    [
+        (0xFFFF, "mov x0, #0xffff"),
+        (-2, "mov x0, #-0x2"),
+        (0x10000, "ldr x0, =0x10000"),
+        (-(2**63) + 1, "ldr x0, =-0x7fffffffffffffff"),
+    ],
+)
+def test_aarch64_exit_constants(status, line):
+    # 9223372036854775807 + 2 folds to the last
+    lines = aarch64_exit(status, None, None)
+    assert lines[1] == line
+    assembler.assemble(lines, Arch.aarch64)
+
+
+@pytest.mark.parametrize(
+    "value,lines",
+    [
+        (7, ("mov x0, #0x7",)),
+        (
+            "g",
+            ("adrp x0, g", "ldr x0, [x0, :lo12:g]"),
+        ),
+        (
+            StackSlot("parameter", 2, 8),
+            ("ldr x0, [x29, #-0x10]",),
+        ),
+    ],
+    ids=["immediate", "global", "parameter"],
+)
+def test_aarch64_value(value, lines):
+    assert aarch64_value("x0", value) == lines
+    assembler.assemble(
+        [".data", "g: .quad 1", ".text", *lines], Arch.aarch64
+    )
+
+
+def test_aarch64_value_unsupported():
+    with pytest.raises(CodeGenError, match="expression"):
+        aarch64_value("x0", Expression("ADD", "x", 1))
+
+
+def test_aarch64_too_many_arguments():
+    # x0 to x7 pass arguments, x8 is the system call number
+    for source in (
+        "fn f(a, b, c, d, e, f, g, h, i) { return i; }",
+        "f(1, 2, 3, 4, 5, 6, 7, 8, 9);",
+    ):
+        instructions = ir.visit(parse(source))
+        with pytest.raises(CodeGenError, match="at most 8"):
+            list(aarch64_lines(instructions))
+    list(
+        aarch64_lines(
+            ir.visit(parse("f(1, 2, 3, 4, 5, 6, 7, 8);"))
+        )
+    )
@@ -0,0 +1,63 @@
+from compiler import dce, fold, ir, parser
+
+
+def compile(source):
+    return dce.eliminate(
+        fold.fold(ir.visit(parser.parse(source)))
+    )
+
+
+def test_unused_local_lets():
+    instructions = compile(
+        "fn f(a) { let u = a + 1; let v = a * 2; return v; }\n"
+        "exit(f(1));"
+    )
+    assert [i[0] for i in instructions[2:7]] == [
+        "label",
+        "prolog",
+        "parameter",
+        "=",
+        "return",
+    ]
+    assert not any(i[1] == "u" for i in instructions)
+
+
+def test_lets_with_calls_are_kept():
+    instructions = compile(
+        "fn f(a) { let u = g(a); return a; }\nexit(f(1));"
+    )
+    assert any(i[:2] == ("=", "u") for i in instructions)
+
+
+def test_after_exit_and_return():
+    instructions = compile(
+        "fn f(a) { return a; let b = a; return b; }\n"
+        "exit(f(1));\nfoo();"
+    )
+    ops = [i[0] for i in instructions]
+    assert ops.count("return") == 1
+    assert ops.count("ret") == 1
+    assert ops[-1] == "exit"
+
+
+def test_unused_globals():
+    # Globals only read by dead lets are dead too
+    instructions = compile(
+        "fn f(a) { let b = a + c; return a; }\n"
+        "let c = f(2);\nexit(0);"
+    )
+    assert not any(i[1] in ("b", "c") for i in instructions)
+
+
+def test_live_statements():
+    statements = parser.parse(
+        "let x = 1;\nlet y = 2;\n{ let z = 3; exit(y); }\n"
+        "exit(y);\nexit(x);"
+    ).statements
+    live = dce.live_statements(statements)
+    assert [type(statement) for statement in live] == [
+        parser.NodeLet,
+        parser.NodeBlock,
+        parser.NodeExit,
+    ]
+    assert live[0].identifier.token.text == "y"
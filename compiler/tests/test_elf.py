@@ -0,0 +1,206 @@
+import platform
+import shutil
+import io
+import subprocess
+import pytest
+from compiler import assembler, code_gen, dce, elf, fold, ir
+from compiler import lvn, parser, peephole, ssa, strength, vm
+from compiler.arch import Arch
+from compiler.assembler import AssemblerError
+from compiler.pseudo import (
+    AST,
+    Add,
+    Call,
+    Fn,
+    Id,
+    Int,
+    Let,
+    Return,
+)
+
+native = pytest.mark.skipif(
+    platform.machine() != "x86_64", reason="needs an x86_64 host"
+)
+
+
+def lines(source):
+    instructions = dce.eliminate(
+        fold.fold(ir.visit(parser.parse(source)))
+    )
+    return list(
+        peephole.optimise(
+            code_gen.gas_lines(instructions), Arch.x86_64
+        )
+    )
+
+
+def header(data):
+    fields = elf.HEADER.unpack_from(data)
+    return {
+        "machine": fields[2],
+        "entry": fields[4],
+        "segments": fields[10],
+    }
+
+
+LINES = [
+    ".section .data",
+    "g: .quad 42",
+    ".section .text",
+    "nop",
+    "_start:",
+    "ret",
+]
+
+
+@pytest.mark.parametrize(
+    "arch,machine", [(Arch.x86_64, 62), (Arch.aarch64, 183)]
+)
+def test_header(arch, machine):
+    program = assembler.assemble(LINES, arch)
+    data = elf.executable(program, arch)
+    assert data[:4] == b"\x7fELF"
+    fields = header(data)
+    assert fields["machine"] == machine
+    assert fields["segments"] == 2
+    # Entered at _start, in the text segment loaded at the base
+    text = elf.HEADER.size + 2 * elf.SEGMENT.size
+    assert fields["entry"] == elf.BASE + text + (
+        program.symbols["_start"][1]
+    )
+    _, flags, offset, address = elf.SEGMENT.unpack_from(
+        data, elf.HEADER.size + elf.SEGMENT.size
+    )[:4]
+    assert flags == elf.PF_R | elf.PF_W
+    assert (address - offset) % elf.PAGES[arch] == 0
+
+
+def test_no_start():
+    program = assembler.assemble(["f:", "ret"])
+    with pytest.raises(AssemblerError):
+        elf.executable(program, Arch.x86_64)
+
+
+@native
+@pytest.mark.parametrize(
+    "source,status",
+    [
+        ("let a = 100;\nlet b = 42;\nexit(a + b);", 142),
+        ("exit(300);", 300 & 0xFF),
+        (
+            "fn f(x) { return x; }\n"
+            + "f(1);\n" * 100
+            + "let y = 9;\nexit(y);",
+            9,
+        ),
+    ],
+    ids=["example", "status byte", "calls"],
+)
+def test_run(tmp_path, source, status):
+    path = tmp_path / "vinyl.exe"
+    elf.write(
+        assembler.assemble(lines(source)), Arch.x86_64, path
+    )
+    assert subprocess.run([path]).returncode == status
+
+
+@native
+def test_tail_call(tmp_path):
+    # Returned calls jump, the recursion runs until it is stopped
+    # rather than overflowing the stack
+    path = tmp_path / "vinyl.exe"
+    code = lines("fn g(a) { return g(a); }\ng(1);")
+    assert "\tjmp\tg\n" in code
+    elf.write(assembler.assemble(code), Arch.x86_64, path)
+    with pytest.raises(subprocess.TimeoutExpired):
+        subprocess.run([path], timeout=1)
+
+
+@native
+def test_print_matches_vm(tmp_path):
+    source = (
+        "fn f(x) { print(x); return x; }\n"
+        "print(9223372036854775807);\nprint(0 - 10);\n"
+        "f(5);\nexit(3);"
+    )
+    out = io.StringIO()
+    status = vm.run(
+        vm.translate(
+            dce.eliminate(
+                fold.fold(ir.visit(parser.parse(source)))
+            )
+        ),
+        out,
+    )
+    path = tmp_path / "vinyl.exe"
+    elf.write(
+        assembler.assemble(lines(source)), Arch.x86_64, path
+    )
+    result = subprocess.run(
+        [path], capture_output=True, text=True
+    )
+    assert (result.returncode, result.stdout) == (
+        status,
+        out.getvalue(),
+    )
+
+
+@native
+def test_run_ssa(tmp_path):
+    ast = AST(
+        [
+            Let(Id("g"), Int(40)),
+            Fn(
+                Id("f"),
+                [Id("x")],
+                [Return(Add(Id("x"), Id("g")))],
+            ),
+            Fn(
+                Id("h"),
+                [Id("x")],
+                [Return(Call(Id("f"), [Id("x")]))],
+            ),
+            Return(Call(Id("h"), [Int(2)])),
+        ]
+    )
+    module = strength.reduce(lvn.number(ssa.build(ast)))
+    code = peephole.optimise(
+        code_gen.gas_ssa_lines(module), Arch.x86_64
+    )
+    path = tmp_path / "vinyl.exe"
+    elf.write(assembler.assemble(code), Arch.x86_64, path)
+    assert subprocess.run([path]).returncode == 42
+
+
+@native
+@pytest.mark.skipif(
+    not (shutil.which("as") and shutil.which("ld")),
+    reason="needs as and ld",
+)
+def test_matches_toolchain(tmp_path):
+    source = (
+        "let a = 42;\nfn f(x, y) { return x; }\n"
+        "f(a, 2);\nexit(a);"
+    )
+    code = lines(source)
+    (tmp_path / "vinyl.asm").write_text("\n".join(code) + "\n")
+    subprocess.check_call(
+        [
+            "as",
+            tmp_path / "vinyl.asm",
+            "-o",
+            tmp_path / "vinyl.o",
+        ]
+    )
+    subprocess.check_call(
+        ["ld", tmp_path / "vinyl.o", "-o", tmp_path / "ld.exe"]
+    )
+    elf.write(
+        assembler.assemble(code),
+        Arch.x86_64,
+        tmp_path / "vinyl.exe",
+    )
+    assert [
+        subprocess.run([tmp_path / name]).returncode
+        for name in ("ld.exe", "vinyl.exe")
+    ] == [42, 42]
@@ -0,0 +1,97 @@
+from compiler import fold, ir, parser
+import pytest
+
+
+def compile(source):
+    return fold.fold(ir.visit(parser.parse(source)))
+
+
+@pytest.mark.parametrize(
+    "source,status",
+    [
+        (
+            "let a = 100;\nlet b = 42;\nlet c = a + b;\nexit(c);",
+            142,
+        ),
+        ("let a = 7;\nexit(a - 10);", -3),
+        ("let a = 2;\nlet b = a ^ 10 / 3;\nexit(b * a);", 682),
+        ("let a = 2 ^ 63;\nexit(a - 1);", 2**63 - 1),
+        (
+            "let a = 0;\nexit(" + "a + 1 + " * 50_000 + "a);",
+            50_000,
+        ),
+    ],
+    ids=["example", "subtract", "chain", "wraps", "deep"],
+)
+def test_fold_exit(source, status):
+    assert compile(source) == [
+        ("global", "start", None, None),
+        ("section", "text", None, None),
+        ("label", "_start", None, None),
+        ("exit", status, None, None),
+    ]
+
+
+def test_fold_division_by_zero():
+    assert compile("let a = 1;\nexit(a / 0);") == [
+        ("global", "start", None, None),
+        ("section", "text", None, None),
+        ("label", "_start", None, None),
+        ("exit", ("DIV", 1, 0), None, None),
+    ]
+
+
+def test_fold_local_lets():
+    instructions = compile(
+        "let x = 5;\n"
+        "fn foo() { let x = 2; return x + 1; }\n"
+        "fn bar() { let x = foo(); return x; }\n"
+        "exit(x);"
+    )
+    # bar returns its own x, the global one is folded away
+    assert instructions == [
+        ("global", "start", None, None),
+        ("section", "text", None, None),
+        ("label", "foo", None, None),
+        ("return", 3, None, None),
+        ("ret", None, None, None),
+        ("label", "bar", None, None),
+        ("=", "x", [("call", "foo", None, None)], None),
+        ("return", "x", None, None),
+        ("ret", None, None, None),
+        ("label", "_start", None, None),
+        ("exit", 5, None, None),
+    ]
+
+
+def test_fold_call_arguments():
+    instructions = compile("let a = 3;\nfoo(a * a, a);")
+    assert instructions[-3:] == [
+        ("store_parameter", 1, 9, None),
+        ("store_parameter", 2, 3, None),
+        ("call", "foo", None, None),
+    ]
+
+
+def test_propagate_stream():
+    statements = parser.parse(
+        "let a = 4;\nexit(a + 1);"
+    ).statements
+    instructions = list(
+        fold.propagate(ir.visit_stream(iter(statements)))
+    )
+    assert instructions[-1] == ("exit", 5, None, None)
+    assert ("int", "a", 4, None) in instructions
+
+
+def test_fold_parameters_shadow_globals():
+    instructions = compile(
+        "let k = 6;\nfn g(k) { return k + k; }\nexit(k);"
+    )
+    assert (
+        "return",
+        ("ADD", "k", "k"),
+        None,
+        None,
+    ) in instructions
+    assert instructions[-1] == ("exit", 6, None, None)
@@ -0,0 +1,134 @@
+from compiler import dce, fold, inline, ir, parser
+from compiler.parser import NodeCall, NodeReturn
+
+
+def compile(source):
+    program = inline.inline(parser.parse(source))
+    return dce.eliminate(fold.fold(ir.visit(program)))
+
+
+def body(program, name):
+    (function,) = [
+        statement
+        for statement in program.statements
+        if isinstance(statement, parser.NodeFunction)
+        and statement.identifier.token.text == name
+    ]
+    return function.body.statements
+
+
+def test_inlined_calls_fold():
+    instructions = compile(
+        "fn add(a, b) { return a + b; }\n"
+        "fn square(x) { let y = x * x; return y; }\n"
+        "exit(add(square(3), 33));"
+    )
+    # Both functions are dropped once inlined
+    assert instructions == [
+        ("global", "start", None, None),
+        ("section", "text", None, None),
+        ("label", "_start", None, None),
+        ("exit", 42, None, None),
+    ]
+
+
+def test_recursive_functions_are_not_inlined():
+    program = inline.inline(
+        parser.parse(
+            "fn fact(n) { return n * fact(n - 1); }\n"
+            "fn even(n) { return odd(n - 1); }\n"
+            "fn odd(n) { return even(n - 1); }\n"
+            "exit(fact(3) + even(4));"
+        )
+    )
+    (status,) = [
+        s
+        for s in program.statements
+        if isinstance(s, parser.NodeExit)
+    ]
+    assert isinstance(status.status.lhs, NodeCall)
+    assert isinstance(status.status.rhs, NodeCall)
+
+
+def test_names_are_not_captured():
+    # f reads the global k, which g's parameter would capture
+    program = inline.inline(
+        parser.parse(
+            "let k = 1;\n"
+            "fn f(x) { return x + k; }\n"
+            "fn g(k) { return f(k); }\n"
+            "fn h(z) { return f(z); }\n"
+            "exit(g(1));"
+        )
+    )
+    (ret,) = body(program, "g")
+    assert isinstance(ret.expression, NodeCall)
+    (ret,) = body(program, "h")
+    assert ret == NodeReturn(
+        parser.parse("exit(z + k);").statements[0].status
+    )
+
+
+def test_large_functions_are_not_inlined():
+    terms = " + ".join(f"x * {i}" for i in range(20))
+    program = inline.inline(
+        parser.parse(
+            f"fn f(x) {{ return {terms}; }}\nexit(f(2));"
+        )
+    )
+    assert isinstance(program.statements[-1].status, NodeCall)
+
+
+def test_call_statements():
+    program = inline.inline(
+        parser.parse(
+            "fn pure(x) { return x; }\n"
+            "fn loud(x) { print(x); return x; }\n"
+            "pure(1);\nloud(2);"
+        )
+    )
+    calls = [
+        s.identifier.token.text
+        for s in program.statements
+        if isinstance(s, NodeCall)
+    ]
+    assert calls == ["loud"]
+
+
+def test_print_inlines():
+    instructions = compile(
+        "fn f(a) { return a + 1; }\nprint(f(2));"
+    )
+    assert ("print", 3, None, None) in instructions
+    assert not any(i[:2] == ("label", "f") for i in instructions)
+
+
+def test_inline_stream():
+    statements = parser.parse(
+        "fn f(x) { return x + 1; }\n"
+        "let a = f(2);\nlet b = g(3);\n"
+        "fn g(x) { return x; }\nexit(g(a));"
+    ).statements
+    a, b, g, status = inline.inline_stream(statements)
+    # Only calls after a definition inline, g is kept for the call
+    # before it and f, inlined at every call, is dropped
+    assert g == statements[3]
+    assert (
+        a.value
+        == parser.parse("exit(2 + 1);").statements[0].status
+    )
+    assert isinstance(b.value, NodeCall)
+    assert status.status == a.identifier
+
+
+def test_inline_stream_held_functions():
+    statements = parser.parse(
+        "fn f(x) { return x + 1; }\n"
+        "fn h(x) { print(x); return x; }\n"
+        "exit(f(2));\nlet a = f(h(1));"
+    ).statements
+    # f waits for the call a keeps, h can not inline
+    h, status, f, a = inline.inline_stream(statements)
+    assert (h, f) == (statements[1], statements[0])
+    assert status == parser.parse("exit(2 + 1);").statements[0]
+    assert isinstance(a.value, NodeCall)
@@ -35,7 +35,7 @@ import pytest
                 ("section", "text", None, None),
                 ("label", "foo", None, None),
                 ("prolog", 8, None, None),
-                ("parameter", 1, 8, None),
+                ("parameter", 1, 8, "x"),
                 ("return", ("parameter", 1, 8), None, None),
                 ("epilog", 8, None, None),
                 ("ret", None, None, None),
@@ -53,6 +53,16 @@ import pytest
             ],
             id="global integer",
         ),
+        pytest.param(
+            ["print(6 * 7);"],
+            [
+                ("global", "start", None, None),
+                ("section", "text", None, None),
+                ("label", "_start", None, None),
+                ("print", 42, None, None),
+            ],
+            id="print",
+        ),
         pytest.param(
             ["let x = 3;", "exit(x);"],
             [
@@ -126,9 +136,9 @@ def test_ir_code_gen():
 
 def test_ir_return():
     instructions = [("return", 42, None, None)]
+    # The function's ret follows its epilog
     assert list(code_gen.aarch64_lines(instructions)) == [
         "mov x0, #0x2a",
-        "ret",
     ]
     assert list(code_gen.gas_lines(instructions)) == [
         "\tmov\t$42, %rax",
@@ -158,3 +168,158 @@ def test_ir_return():
 )
 def test_gas_lines(instructions, expect):
     assert list(code_gen.gas_lines(instructions)) == expect
+
+
+@pytest.mark.parametrize(
+    "source,message",
+    [
+        ("print(1 / 0);", "can not lower the expression"),
+        (
+            "fn f(a) { return a; }\nfn g(b) { return f(f(b)); }",
+            "can not lower the value of a call",
+        ),
+        (
+            "fn f(a, b, c, d, e, f, g) { return g; }",
+            "can not pass 7 arguments, at most 6",
+        ),
+        ("f(1, 2, 3, 4, 5, 6, 7);", "at most 6"),
+    ],
+    ids=["expression", "call", "parameters", "arguments"],
+)
+def test_gas_lines_unsupported(source, message):
+    instructions = ir.visit(parser.parse(source))
+    with pytest.raises(code_gen.CodeGenError, match=message):
+        list(code_gen.gas_lines(instructions))
+
+
+def test_visit_parameters():
+    # Parameters are read from the frame, not a global's name
+    instructions = list(
+        ir.visit(parser.parse("fn f(x) { g(x); exit(x); }"))
+    )
+    slot = ir.StackSlot("parameter", 1, 8)
+    assert ("store_parameter", 1, slot, None) in instructions
+    assert ("exit", slot, None, None) in instructions
+    lines = list(code_gen.gas_lines(instructions))
+    assert "\tmov\t-8(%rbp), %rdi" in lines
+
+
+def test_visit_stream():
+    statements = parser.parse(
+        "foo();\nlet x = 1;\nfn foo() { return 5; }\nexit(x);"
+    ).statements
+    assert list(ir.visit_stream(iter(statements))) == [
+        ("global", "start", None, None),
+        ("section", "text", 1, None),
+        ("label", "_start", None, None),
+        ("call", "foo", None, None),
+        ("section", "data", None, None),
+        ("int", "x", 1, None),
+        ("section", "text", None, None),
+        ("label", "foo", None, None),
+        ("return", 5, None, None),
+        ("ret", None, None, None),
+        ("section", "text", 1, None),
+        ("exit", "x", None, None),
+    ]
+
+
+@pytest.mark.parametrize(
+    "expression,value",
+    [
+        ("1 + " * 100_000 + "1", 100_001),
+        ("(" * 100_000 + "1 + 2" + ")" * 100_000, 3),
+        # 2**50001 - 2 wrapped
+        ("2 * (1 + " * 50_000 + "0" + ")" * 50_000, -2),
+        ("x + 1", ("ADD", "x", 1)),
+        ("2 * 3 + 4", 10),
+        ("10 - 3 * 4", -2),
+        ("7 / 2", 3),
+        ("0 - 7 / 2", -3),
+        ("(0 - 7) / 2", -3),
+        ("2 ^ 3 ^ 2", 512),
+        ("2 ^ 64", 0),
+        ("3 ^ (0 - 1)", ("POW", 3, -1)),
+        ("1 / 0", ("DIV", 1, 0)),
+        ("9223372036854775807 + 1", -(2**63)),
+        ("(0 - 9223372036854775807 - 1) / (0 - 1)", -(2**63)),
+    ],
+    ids=[
+        "long",
+        "nested",
+        "alternating",
+        "symbol",
+        "mixed",
+        "subtract",
+        "divide",
+        "divide negative",
+        "truncate",
+        "power",
+        "power wraps",
+        "negative exponent",
+        "divide by zero",
+        "add wraps",
+        "divide wraps",
+    ],
+)
+def test_visit_expression(expression, value):
+    (let,) = parser.parse(f"let y = {expression};").statements
+    assert ir.visit_expression(let.value) == value
+
+
+def test_visit_nested_blocks():
+    ast = parser.parse("fn foo(x) { { { return x; } } }")
+    assert list(ir.visit(ast))[4:7] == [
+        ("parameter", 1, 8, "x"),
+        ("return", ("parameter", 1, 8), None, None),
+        ("epilog", 8, None, None),
+    ]
+
+
+def test_visit_typed_instructions():
+    ast = parser.parse(
+        "fn foo(x) { return x; }\nfoo(1);\nfoo(1);"
+    )
+    instructions = list(ir.visit(ast))
+    assert all(
+        isinstance(instruction, ir.Instruction)
+        and isinstance(instruction.op, ir.Opcode)
+        for instruction in instructions
+    )
+    # Equal instructions are shared
+    assert instructions[-1] is instructions[-3]
+    rewritten = instructions[6]._replace(
+        op=ir.Opcode.EXIT, arg1=0
+    )
+    assert rewritten == ("exit", 0, None, None)
+
+
+@pytest.mark.parametrize(
+    "operand,kind",
+    [
+        (3, ir.OperandKind.IMMEDIATE),
+        ("x", ir.OperandKind.SYMBOL),
+        (ir.Register(0), ir.OperandKind.REGISTER),
+        (
+            ir.StackSlot("parameter", 1, 8),
+            ir.OperandKind.STACK_SLOT,
+        ),
+        (("ADD", 1, "x"), None),
+    ],
+)
+def test_operand_kind(operand, kind):
+    assert ir.operand_kind(operand) is kind
+
+
+@pytest.mark.parametrize(
+    "lines", [code_gen.gas_lines, code_gen.aarch64_lines]
+)
+def test_lines_dispatch_on_opcode(lines):
+    typed = [
+        ir.Instruction(ir.Opcode.LABEL, "main", None, None),
+        ir.Instruction(ir.Opcode.CALL, "foo", None, None),
+        ir.Instruction(ir.Opcode.RET, None, None, None),
+    ]
+    untyped = [tuple(instruction) for instruction in typed]
+    assert list(lines(typed)) == list(lines(untyped))
+    assert len(list(lines(typed))) == 3
@@ -0,0 +1,119 @@
+import io
+import pytest
+from compiler import code_gen, dce, fold, ir, jit, lvn, parser
+from compiler import peephole, ssa, strength, vm
+from compiler.arch import Arch
+from compiler.pseudo import (
+    AST,
+    Add,
+    Call,
+    Fn,
+    Id,
+    Int,
+    Let,
+    Return,
+)
+
+pytestmark = pytest.mark.skipif(
+    not jit.available(), reason="needs an x86_64 host"
+)
+
+
+def compile_source(source):
+    instructions = dce.eliminate(
+        fold.fold(ir.visit(parser.parse(source)))
+    )
+    return jit.Program(
+        peephole.optimise(
+            code_gen.gas_lines(instructions), Arch.x86_64
+        )
+    )
+
+
+@pytest.mark.parametrize(
+    "source,status",
+    [
+        ("let a = 100;\nlet b = 42;\nexit(a + b);", 142),
+        ("exit(300);", 300 & 0xFF),
+        ("let x = 7;", 0),
+        ("print(1);", 0),
+        (
+            "fn f(x) { return x; }\n"
+            + "f(1);\n" * 100
+            + "let y = 9;\nexit(y);",
+            9,
+        ),
+        (
+            "fn f(x) { return x; }\nfn g() { return f(6); }\n"
+            "print(g());\nexit(f(5));",
+            5,
+        ),
+    ],
+    ids=[
+        "example",
+        "status byte",
+        "falls off",
+        "prints and falls off",
+        "calls",
+        "call values",
+    ],
+)
+def test_run(source, status):
+    program = compile_source(source)
+    # Runs are independent and the host carries on after exit
+    assert [program() for _ in range(3)] == [status] * 3
+
+
+def test_print_matches_vm(capfd):
+    source = (
+        "fn f(x) { print(x); return x; }\n"
+        "print(65);\nprint(0 - 7);\nprint(0);\n"
+        "print(0 - 9223372036854775807 - 1);\n"
+        "let g = 12;\nf(3);\nprint(g);\nexit(4);"
+    )
+    instructions = list(
+        dce.eliminate(fold.fold(ir.visit(parser.parse(source))))
+    )
+    out = io.StringIO()
+    status = vm.run(vm.translate(instructions), out)
+    assert compile_source(source)() == status
+    assert capfd.readouterr().out == out.getvalue()
+    assert (
+        out.getvalue()
+        == "65\n-7\n0\n-9223372036854775808\n3\n12\n"
+    )
+
+
+def test_run_ssa():
+    ast = AST(
+        [
+            Let(Id("g"), Int(40)),
+            Fn(
+                Id("f"),
+                [Id("x")],
+                [Return(Add(Id("x"), Id("g")))],
+            ),
+            Fn(
+                Id("h"),
+                [Id("x")],
+                [Return(Call(Id("f"), [Id("x")]))],
+            ),
+            Return(Call(Id("h"), [Int(2)])),
+        ]
+    )
+    module = strength.reduce(lvn.number(ssa.build(ast)))
+    program = jit.Program(
+        peephole.optimise(
+            code_gen.gas_ssa_lines(module), Arch.x86_64
+        )
+    )
+    assert program() == 42
+    assert program() == 42
+
+
+def test_lower_exit():
+    lines = ["\tmov\t$60, %rax", "\tsyscall"]
+    assert list(jit.lower_exit(lines)) == [
+        "\tmov\t$60, %rax",
+        "\tcall\t__jit_syscall",
+    ]
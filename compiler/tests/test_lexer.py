@@ -1,5 +1,13 @@
 import pytest
-from compiler.lexer import lex, Token, TokenKind
+from compiler.lexer import (
+    lex,
+    tokenize,
+    LineIndex,
+    TokenStream,
+    Position,
+    Token,
+    TokenKind,
+)
 
 
 @pytest.mark.parametrize(
@@ -21,7 +29,94 @@ from compiler.lexer import lex, Token, TokenKind
         ("main", [Token(TokenKind.IDENTIFIER, "main")]),
         ("print", [Token(TokenKind.PRINT, "print")]),
         ("return", [Token(TokenKind.RETURN, "return")]),
+        ("letter", [Token(TokenKind.IDENTIFIER, "letter")]),
+        ("fnord", [Token(TokenKind.IDENTIFIER, "fnord")]),
+        ("exit2", [Token(TokenKind.IDENTIFIER, "exit2")]),
+        ("# note\n", [Token(TokenKind.COMMENT, "# note\n")]),
+        (
+            "let x = 42;",
+            [
+                Token(TokenKind.LET, "let"),
+                Token(TokenKind.IDENTIFIER, "x"),
+                Token(TokenKind.EQUAL, "="),
+                Token(TokenKind.INT, "42"),
+                Token(TokenKind.SEMICOLON, ";"),
+            ],
+        ),
     ],
 )
 def test_lex(content, tokens):
     assert list(lex(content)) == tokens
+
+
+def test_tokenize():
+    tokens = tokenize("let x = 42; # answer\nexit(x);")
+    assert len(tokens) == 10
+    assert list(tokens.kinds[:5]) == [
+        TokenKind.LET,
+        TokenKind.IDENTIFIER,
+        TokenKind.EQUAL,
+        TokenKind.INT,
+        TokenKind.SEMICOLON,
+    ]
+    assert (tokens.starts[3], tokens.ends[3]) == (8, 10)
+    assert tokens.kind(5) == TokenKind.EXIT
+    assert tokens.text(3) == "42"
+    assert tokens[8] == Token(TokenKind.RIGHT_PAREN, ")")
+
+
+def test_lex_offsets():
+    tokens = list(lex("let x\n  = 42;"))
+    assert [token.offset for token in tokens] == [
+        0,
+        4,
+        8,
+        10,
+        12,
+    ]
+
+
+@pytest.mark.parametrize(
+    "offset,position",
+    [
+        (0, Position(1, 1)),
+        (3, Position(1, 4)),
+        (4, Position(2, 1)),
+        (5, Position(3, 1)),
+        (7, Position(3, 3)),
+    ],
+)
+def test_line_index(offset, position):
+    assert (
+        LineIndex("let\n\nx = 1;").position(offset) == position
+    )
+
+
+def test_tokens_position():
+    tokens = tokenize("fn foo() {\n    return 5;\n}")
+    assert tokens.position(5) == Position(2, 5)
+    assert tokens.token(5).offset == 15
+
+
+@pytest.mark.parametrize(
+    "content", ["let x = 42; # answer\nexit(x);", b"let x = 42;"]
+)
+def test_token_stream(content):
+    tokens = TokenStream(content)
+    assert tokens.has(4)
+    assert tokens.end == 5
+    assert tokens.kinds[3] == TokenKind.INT
+    assert tokens.token(3) == Token.int("42")
+    assert tokens.token(3).offset == 8
+
+
+def test_token_stream_release():
+    tokens = TokenStream("let x = 42;\nexit(x);")
+    assert tokens.has(5)
+    tokens.release(5)
+    assert tokens.base == 5
+    assert tokens.kind(5) == TokenKind.EXIT
+    assert tokens.position(5) == Position(2, 1)
+    with pytest.raises(IndexError):
+        tokens.kinds[4]
+    assert not tokens.has(10)
@@ -0,0 +1,162 @@
+from compiler import code_gen, lvn, ssa
+from compiler.pseudo import (
+    Add,
+    AST,
+    Call,
+    Fn,
+    Int,
+    Id,
+    Let,
+    Mul,
+    Return,
+)
+from compiler.ssa import Value
+from tests.test_ssa import instructions
+
+
+def test_number_reuses_expressions():
+    module = lvn.number(
+        ssa.build(
+            AST(
+                [
+                    Fn(
+                        Id("f"),
+                        [Id("a"), Id("b")],
+                        [
+                            Let(
+                                Id("x"),
+                                Add(
+                                    Mul(Id("a"), Id("b")), Int(1)
+                                ),
+                            ),
+                            Let(
+                                Id("y"),
+                                Add(
+                                    Mul(Id("b"), Id("a")), Int(2)
+                                ),
+                            ),
+                            Return(Add(Id("x"), Id("y"))),
+                        ],
+                    )
+                ]
+            )
+        )
+    )
+    f, _ = module.functions
+    ops = [instruction.op for instruction in f.instructions()]
+    # b * a is a * b, the parameters are read once
+    assert ops.count("mul") == 1
+    assert ops.count("parameter") == 2
+    (mul,) = [i for i in f.instructions() if i.op == "mul"]
+    assert len(f.users(mul.result)) == 2
+
+
+def test_number_reuses_constants_and_loads():
+    module = lvn.number(
+        ssa.build(
+            AST(
+                [
+                    Fn(
+                        Id("f"),
+                        [],
+                        [
+                            Return(
+                                Add(
+                                    Id("k"), Mul(Id("k"), Int(2))
+                                )
+                            )
+                        ],
+                    ),
+                    Fn(
+                        Id("g"),
+                        [],
+                        [Return(Add(Int(2), Int(2)))],
+                    ),
+                ]
+            )
+        )
+    )
+    f, g, _ = module.functions
+    assert [i.op for i in f.instructions()].count("load") == 1
+    assert instructions(g) == [
+        ("const", Value(0), (2,)),
+        ("add", Value(2), (Value(0), Value(0))),
+        ("ret", None, (Value(2),)),
+    ]
+
+
+def test_number_reloads_after_calls():
+    module = lvn.number(
+        ssa.build(
+            AST(
+                [
+                    Fn(
+                        Id("f"),
+                        [],
+                        [
+                            Let(Id("x"), Id("k")),
+                            Let(Id("y"), Call(Id("g"), [])),
+                            Return(
+                                Add(
+                                    Id("x"),
+                                    Add(Id("y"), Id("k")),
+                                )
+                            ),
+                        ],
+                    )
+                ]
+            )
+        )
+    )
+    f, _ = module.functions
+    assert [i.op for i in f.instructions()].count("load") == 2
+
+
+def test_number_forwards_stores():
+    module = lvn.number(
+        ssa.build(
+            AST(
+                [
+                    Let(Id("x"), Add(Id("k"), Int(1))),
+                    Let(Id("y"), Add(Id("k"), Int(1))),
+                    Return(Add(Id("x"), Id("y"))),
+                ]
+            )
+        )
+    )
+    (start,) = module.functions
+    assert instructions(start) == [
+        ("load", Value(0), ("k",)),
+        ("const", Value(1), (1,)),
+        ("add", Value(2), (Value(0), Value(1))),
+        ("store", None, ("x", Value(2))),
+        ("store", None, ("y", Value(2))),
+        ("add", Value(6), (Value(2), Value(2))),
+        ("ret", None, (Value(6),)),
+    ]
+
+
+def test_number_keeps_backends_working():
+    module = lvn.number(
+        ssa.build(
+            AST(
+                [
+                    Fn(
+                        Id("f"),
+                        [Id("a")],
+                        [
+                            Return(
+                                Add(
+                                    Mul(Id("a"), Id("a")),
+                                    Mul(Id("a"), Id("a")),
+                                )
+                            )
+                        ],
+                    ),
+                    Return(Call(Id("f"), [Int(3)])),
+                ]
+            )
+        )
+    )
+    lines = list(code_gen.gas_ssa_lines(module))
+    assert sum("imul" in line for line in lines) == 1
@@ -0,0 +1,147 @@
+import platform
+import shutil
+import subprocess
+import pytest
+import typer
+from compiler import code_gen, main
+from compiler.arch import Arch
+
+native = pytest.mark.skipif(
+    platform.machine() != "x86_64", reason="needs an x86_64 host"
+)
+
+
+def test_stream_instructions_inline(tmp_path):
+    src = tmp_path / "program.lp"
+    src.write_text(
+        "fn f(x) { return x; }\nlet a = f(3);\nexit(a);\n"
+    )
+    # The call value is inlined, which gas_lines can lower
+    assert list(
+        code_gen.gas_lines(main.stream_instructions(src))
+    )[-4:] == [
+        "\n.text 1",
+        "\tmov\t$60, %rax",
+        "\tmov\t$3, %rdi",
+        "\tsyscall",
+    ]
+
+
+def test_stream_instructions_stopped_early(tmp_path):
+    src = tmp_path / "program.lp"
+    src.write_text("let a = 1;\nlet b = 2;\nexit(a);\n")
+    streamed = main.stream_instructions(src)
+    # Stopped with the lexer part way through the source
+    for _ in range(5):
+        next(streamed)
+    streamed.close()
+
+
+@native
+def test_print_inlined_call(tmp_path, monkeypatch, capfd):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.lp").write_text(
+        "fn f(a) { return a + 1; }\nprint(f(2));\nexit(f(4));\n"
+    )
+    for mode in ("run", "use_jit"):
+        with pytest.raises(SystemExit) as status:
+            main.main("a.lp", arch=Arch.x86_64, **{mode: True})
+        assert status.value.code == 5
+        assert capfd.readouterr().out == "3\n"
+    main.main("a.lp", arch=Arch.x86_64, builtin=True)
+    executables = ["./vinyl.exe"]
+    if shutil.which("as") and shutil.which("ld"):
+        # The same assembly through the host's toolchain
+        subprocess.check_call(
+            ["as", "vinyl.asm", "-o", "vinyl.o"]
+        )
+        subprocess.check_call(["ld", "vinyl.o", "-o", "ld.exe"])
+        executables.append("./ld.exe")
+    for executable in executables:
+        result = subprocess.run(
+            [executable], capture_output=True, text=True
+        )
+        assert (result.returncode, result.stdout) == (5, "3\n")
+
+
+@native
+def test_streaming_build(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.lp").write_text(
+        "fn f(a) { return a + 1; }\nexit(f(2));\n"
+    )
+    for mode in ("run", "use_jit"):
+        with pytest.raises(SystemExit) as status:
+            main.main(
+                "a.lp",
+                arch=Arch.x86_64,
+                streaming=True,
+                **{mode: True},
+            )
+        assert status.value.code == 3
+    # f is inlined at its only call and not lowered
+    main.main(
+        "a.lp", arch=Arch.x86_64, streaming=True, builtin=True
+    )
+    assert "f:" not in (tmp_path / "vinyl.asm").read_text()
+    assert subprocess.run(["./vinyl.exe"]).returncode == 3
+
+
+@native
+@pytest.mark.parametrize(
+    "source,status",
+    [
+        (
+            "let g = 10;\n"
+            "fn f(x, y) { let t = x * y - g; return t / 2 + x ^ 2; }\n"
+            "fn h(a) { return f(a, a + 1) - f(a - 1, 3); }\n"
+            "exit(h(5) - 7);",
+            11,
+        ),
+        # Inlined into a constant before SSA form
+        ("fn f(a) { return a + 1; }\nexit(f(2));", 3),
+    ],
+    ids=["expressions", "inlined"],
+)
+def test_ssa_build(tmp_path, monkeypatch, source, status):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.lp").write_text(source)
+    # The VM runs the IR, the JIT the SSA backend's code
+    for options in (
+        {"run": True},
+        {"use_jit": True, "use_ssa": True},
+    ):
+        with pytest.raises(SystemExit) as raised:
+            main.main("a.lp", arch=Arch.x86_64, **options)
+        assert raised.value.code == status
+    main.main(
+        "a.lp", arch=Arch.x86_64, builtin=True, use_ssa=True
+    )
+    assert subprocess.run(["./vinyl.exe"]).returncode == status
+    # aarch64 builds, though the host can not run it
+    main.main(
+        "a.lp", arch=Arch.aarch64, builtin=True, use_ssa=True
+    )
+
+
+@native
+def test_ssa_tail_call(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.lp").write_text(
+        "fn g(a) { return g(a); }\nexit(0);"
+    )
+    # x86_64 last, its executable is run
+    for arch, jump in (
+        (Arch.aarch64, "b g"),
+        (Arch.x86_64, "\tjmp\tg"),
+    ):
+        lines = list(main.ssa_lines("a.lp", arch))
+        g = lines[lines.index("g:") : lines.index("_start:")]
+        assert g[-1] == jump
+        main.main("a.lp", arch=arch, builtin=True, use_ssa=True)
+    assert subprocess.run(["./vinyl.exe"]).returncode == 0
+
+
+def test_ssa_needs_whole_program():
+    with pytest.raises(typer.BadParameter):
+        main.main("a.lp", use_ssa=True, streaming=True)
@@ -1,8 +1,12 @@
 import pytest
 from compiler import parser
-from compiler.lexer import lex
+from compiler.lexer import tokenize, TokenStream
 from compiler.parser import (
     parse,
+    parse_statements,
+    ParseError,
+    reparse,
+    Edit,
     parse_op,
     parse_binary,
     literal,
@@ -238,17 +242,252 @@ def test_parse(content, statements):
                 literal("4"),
             ),
         ),
+        (
+            "1 + 2 * 3",
+            NodeBinOp(
+                Op("+", 1, Associative.LEFT),
+                literal("1"),
+                NodeBinOp(
+                    Op("*", 2, Associative.LEFT),
+                    literal("2"),
+                    literal("3"),
+                ),
+            ),
+        ),
+        (
+            "2 ^ 3 ^ 2",
+            NodeBinOp(
+                Op("^", 3, Associative.RIGHT),
+                literal("2"),
+                NodeBinOp(
+                    Op("^", 3, Associative.RIGHT),
+                    literal("3"),
+                    literal("2"),
+                ),
+            ),
+        ),
+        (
+            "(1 + 2) * 3",
+            NodeBinOp(
+                Op("*", 2, Associative.LEFT),
+                NodeBinOp(
+                    Op("+", 1, Associative.LEFT),
+                    literal("1"),
+                    literal("2"),
+                ),
+                literal("3"),
+            ),
+        ),
+        (
+            "1 - (2 - 3)",
+            NodeBinOp(
+                Op("-", 1, Associative.LEFT),
+                literal("1"),
+                NodeBinOp(
+                    Op("-", 1, Associative.LEFT),
+                    literal("2"),
+                    literal("3"),
+                ),
+            ),
+        ),
+        ("((7))", literal("7")),
+        ("(1 + 2", None),
     ],
 )
 def test_parse_binary_expression(code, ast):
-    tokens = list(lex(code))
+    tokens = tokenize(code)
     node, _ = parse_binary(tokens, 0)
     assert node == ast
 
 
 def test_parse_op():
-    tokens = list(lex("10 * 2 ^ 8"))
+    tokens = tokenize("10 * 2 ^ 8")
     assert parse_op(tokens, 1)[0] == Op("*", 2, Associative.LEFT)
     assert parse_op(tokens, 3)[0] == Op(
         "^", 3, Associative.RIGHT
     )
+
+
+def test_parse_positions():
+    program = parse("let x = 1;\nexit(x);")
+    status = program.statements[1].status.token
+    assert program.lines.position(status.offset) == (2, 6)
+
+
+def test_parse_statements_releases_tokens():
+    content = "fn f(a) { return a; }\n" + "let x = 1;\n" * 100
+    tokens = TokenStream(content)
+    window = 0
+    statements = []
+    for statement in parse_statements(tokens):
+        window = max(window, tokens.end - tokens.base)
+        statements.append(statement)
+    assert statements == parse(content).statements
+    assert window <= 12
+
+
+def depth(node):
+    count = 0
+    while isinstance(node, NodeBinOp):
+        node = (
+            node.rhs
+            if node.operator.operator == "^"
+            else node.lhs
+        )
+        count += 1
+    return count
+
+
+def test_parse_long_expression():
+    operands = 200_000
+    node, _ = parse_binary(
+        tokenize(" - ".join(["1"] * operands)), 0
+    )
+    assert depth(node) == operands - 1
+
+
+def test_parse_nested_expression():
+    nesting = 100_000
+    code = "(" * nesting + "2 ^ 2" + ")" * nesting
+    node, cursor = parse_binary(tokenize(code), 0)
+    assert depth(node) == 1
+    assert cursor == 2 * nesting + 3
+
+
+def test_parse_call_in_expression():
+    (statement,) = parse("exit(foo(1) + 2);").statements
+    assert statement.status == NodeBinOp(
+        Op("+", 1, Associative.LEFT),
+        parser.NodeCall(
+            NodeIdentifier(Token.identifier("foo")),
+            [literal("1")],
+        ),
+        literal("2"),
+    )
+
+
+@pytest.mark.parametrize(
+    "content,messages",
+    [
+        (")", ["1:1: unexpected ')'"]),
+        ("let = 1;", ["1:1: invalid statement at 'let'"]),
+        ("let x", ["1:1: unexpected end of input in 'let'"]),
+        ("{", ["1:1: unexpected end of input in '{'"]),
+        (
+            "fn f(x) {",
+            ["1:9: unexpected end of input in '{'"],
+        ),
+        (
+            "let a = 1;\n{ let b = 2; ",
+            ["2:1: unexpected end of input in '{'"],
+        ),
+        (
+            "let = 1;\n) 2;\nfn f() { = }\nexit(0);",
+            [
+                "1:1: invalid statement at 'let'",
+                "2:1: unexpected ')'",
+                "3:10: unexpected '='",
+            ],
+        ),
+    ],
+)
+def test_parse_errors(content, messages):
+    with pytest.raises(ParseError) as error:
+        parse(content)
+    assert error.value.messages == messages
+
+
+@pytest.mark.parametrize(
+    "content", ["{", "fn f(x) {", "{ let a = 1; "]
+)
+def test_parse_unclosed_block(content):
+    with pytest.raises(ParseError):
+        parse(content)
+
+
+def test_parse_error_resynchronises():
+    content = "let = 1;\nexit(0);"
+    tokens = tokenize(content)
+    statements = []
+    with pytest.raises(ParseError):
+        for statement in parse_statements(tokens):
+            statements.append(statement)
+    assert statements == [exit("0")]
+
+
+SOURCE = (
+    "let a = 1;\n"
+    "fn f(x) {\n"
+    "    return x;\n"
+    "}\n"
+    "let b = 2;\n"
+    "# note\n"
+    "exit(b);\n"
+)
+
+
+def edited(source, edit):
+    offset, deleted, inserted = edit
+    return (
+        source[:offset] + inserted + source[offset + deleted :]
+    )
+
+
+@pytest.mark.parametrize(
+    "edit,reused",
+    [
+        pytest.param(Edit(8, 1, "10"), [1, 2, 3], id="literal"),
+        pytest.param(Edit(32, 1, "7"), [0, 2, 3], id="fn-body"),
+        pytest.param(
+            Edit(37, 0, "print(3);\n"), [0, 1, 2, 3], id="insert"
+        ),
+        pytest.param(Edit(37, 11, ""), [0, 1, 3], id="delete"),
+        pytest.param(Edit(54, 1, " "), [0, 1, 2], id="comment"),
+        pytest.param(
+            Edit(64, 0, "exit(0);"), [0, 1, 2, 3], id="append"
+        ),
+        pytest.param(
+            Edit(0, 0, "#"), [1, 2, 3], id="comment-out"
+        ),
+    ],
+)
+@pytest.mark.parametrize("segment", [1024, 2])
+def test_reparse(monkeypatch, segment, edit, reused):
+    monkeypatch.setattr(parser.Spans, "SEGMENT", segment)
+    program = parse(SOURCE)
+    content = edited(SOURCE, edit)
+    expected = parse(content)
+    actual = reparse(program, edit)
+    assert actual.statements == expected.statements
+    assert actual.spans == expected.spans
+    assert actual.lines.content == content
+    for statement in program.statements:
+        if any(
+            statement is other for other in actual.statements
+        ):
+            index = program.statements.index(statement)
+            assert index in reused
+    for index in reused:
+        assert any(
+            program.statements[index] is statement
+            for statement in actual.statements
+        )
+
+
+def test_reparse_repeated_edits(monkeypatch):
+    monkeypatch.setattr(parser.Spans, "SEGMENT", 3)
+    content = "".join(f"let x{i} = {i};\n" for i in range(20))
+    program = parse(content)
+    for i in range(20):
+        offset = content.index(f"= {i};") + 2
+        edit = Edit(offset, len(str(i)), f"{i} + {i}")
+        content = edited(content, edit)
+        program = reparse(program, edit)
+        assert program.spans == parse(content).spans
+    assert program.statements == parse(content).statements
+
+
+def test_identifiers_interned():
+    let, call = parse("let value = 1;\nfoo(value);").statements
+    assert not hasattr(let, "__dict__")
+    assert let.identifier.token.text is call.values[0].token.text
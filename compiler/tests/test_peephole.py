@@ -0,0 +1,176 @@
+from collections import Counter
+import pytest
+from compiler import peephole
+from compiler.arch import Arch
+
+
+def optimise(lines, arch):
+    hits = Counter()
+    return list(peephole.optimise(lines, arch, hits)), hits
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "\tmov\t$60, %rax",
+        "\tcall\tfoo\n",
+        "\tret\n",
+        "        str x1, [sp, #0x8]",
+        "ldr x9, [x9, :lo12:name]",
+        "svc #0",
+    ],
+)
+def test_render_parse(line):
+    assert peephole.render(peephole.parse(line)) == line
+
+
+@pytest.mark.parametrize(
+    "line",
+    ["_start:", ".global _start", "\n.text", "x: .int 0x1", ""],
+)
+def test_parse_other_lines(line):
+    assert peephole.parse(line) is None
+
+
+@pytest.mark.parametrize(
+    "arch,lines,expect,rule",
+    [
+        (
+            Arch.aarch64,
+            ["mov x1, x1", "mov w1, w1"],
+            ["mov w1, w1"],
+            "self_move",
+        ),
+        (
+            Arch.aarch64,
+            ["str x1, [sp, #0x8]", "ldr x0, [sp, #0x8]"],
+            ["str x1, [sp, #0x8]", "mov x0, x1"],
+            "store_load",
+        ),
+        (
+            Arch.aarch64,
+            [
+                "mov x0, #0x2",
+                "add x1, x1, x0",
+                "mov x0, x1",
+                "svc 0",
+            ],
+            ["add x1, x1, #0x2", "mov x0, x1", "svc 0"],
+            "immediate",
+        ),
+        (
+            Arch.aarch64,
+            ["sub sp, sp, #0x10", "add sp, sp, #0x10", "ret"],
+            ["ret"],
+            "empty_frame",
+        ),
+        (
+            Arch.aarch64,
+            ["mov x0, #0x1", "mov x0, #0x2", "svc 0"],
+            ["mov x0, #0x2", "svc 0"],
+            "dead_move",
+        ),
+        (
+            Arch.x86_64,
+            ["\tmov\t%rax, %rax"],
+            [],
+            "self_move",
+        ),
+        (
+            Arch.x86_64,
+            ["\tmov\t%rdi, -8(%rbp)", "\tmov\t-8(%rbp), %rax"],
+            ["\tmov\t%rdi, -8(%rbp)", "\tmov\t%rdi, %rax"],
+            "store_load",
+        ),
+        (
+            Arch.x86_64,
+            [
+                "\tmov\t$3, %rcx",
+                "\tadd\t%rcx, %rax",
+                "\tmov\t$0, %rcx",
+                "\tsyscall",
+            ],
+            ["\tadd\t$3, %rax", "\tmov\t$0, %rcx", "\tsyscall"],
+            "immediate",
+        ),
+        (
+            Arch.x86_64,
+            [
+                "\tsub\t$0, %rsp",
+                "\tsub\t$16, %rsp",
+                "\tadd\t$16, %rsp",
+            ],
+            [],
+            "empty_frame",
+        ),
+        (
+            Arch.aarch64,
+            [
+                "str x30, [sp, #-16]!",
+                "bl f",
+                "ldr x30, [sp], #16",
+                "mov sp, x29",
+                "ldp x29, x30, [sp], #16",
+                "ret",
+            ],
+            ["mov sp, x29", "ldp x29, x30, [sp], #16", "b f"],
+            "tail_call",
+        ),
+        (
+            Arch.x86_64,
+            [
+                "\tcall\tf",
+                "\tmov\t%rbp, %rsp",
+                "\tpop\t%rbp",
+                "\tret",
+            ],
+            ["\tmov\t%rbp, %rsp", "\tpop\t%rbp", "\tjmp\tf"],
+            "tail_call",
+        ),
+    ],
+    ids=[
+        "aarch64-self-move",
+        "aarch64-store-load",
+        "aarch64-immediate",
+        "aarch64-empty-frame",
+        "aarch64-dead-move",
+        "gas-self-move",
+        "gas-store-load",
+        "gas-immediate",
+        "gas-empty-frame",
+        "aarch64-tail-call",
+        "gas-tail-call",
+    ],
+)
+def test_rules(arch, lines, expect, rule):
+    optimised, hits = optimise(lines, arch)
+    assert optimised == expect
+    assert hits[rule] > 0
+
+
+def test_live_registers_are_kept():
+    # x0 is read by the system call, the move can not be folded
+    lines = ["mov x0, #0x2", "add x1, x1, x0", "svc 0"]
+    assert optimise(lines, Arch.aarch64) == (lines, Counter())
+
+
+def test_rules_stop_at_labels():
+    lines = ["sub sp, sp, #0x10", "foo:", "add sp, sp, #0x10"]
+    assert optimise(lines, Arch.aarch64) == (lines, Counter())
+
+
+def test_rewrites_cascade():
+    # The move store_load leaves is a self move
+    lines = [
+        "sub sp, sp, #0x10",
+        "str x1, [sp, #0x8]",
+        "ldr x1, [sp, #0x8]",
+        "add sp, sp, #0x10",
+    ]
+    optimised, hits = optimise(lines, Arch.aarch64)
+    assert optimised == [
+        "sub sp, sp, #0x10",
+        "str x1, [sp, #0x8]",
+        "add sp, sp, #0x10",
+    ]
+    assert hits == Counter(store_load=1, self_move=1)
@@ -0,0 +1,148 @@
+import pytest
+from compiler import pseudo, regalloc, ssa
+from compiler.arch import Arch
+from compiler.pseudo import (
+    AST,
+    Add,
+    BinOp,
+    Call,
+    Fn,
+    Id,
+    Int,
+    Let,
+    Return,
+    register,
+)
+from compiler.ssa import Value
+
+
+def function(body, parameters=()):
+    module = ssa.build(
+        AST([Fn(Id("f"), [Id(p) for p in parameters], body)])
+    )
+    return module.functions[0]
+
+
+def total(names):
+    expression = Id(names[0])
+    for name in names[1:]:
+        expression = Add(expression, Id(name))
+    return expression
+
+
+def test_live_intervals():
+    f = function(
+        [Let(Id("x"), Int(1)), Return(Add(Id("x"), Id("a")))],
+        ["a"],
+    )
+    intervals = regalloc.live_intervals(f)
+    assert [(i.value, i.start, i.end) for i in intervals] == [
+        (Value(0), 0, 2),
+        (Value(1), 1, 2),
+        (Value(2), 2, 3),
+    ]
+
+
+@pytest.mark.parametrize("arch", list(Arch))
+def test_registers_are_reused(arch):
+    # Values die one after another, two registers are enough
+    lets = [Let(Id("x"), Int(0))] + [
+        Let(Id("x"), Add(Id("x"), Int(i))) for i in range(50)
+    ]
+    f = function(lets + [Return(Id("x"))])
+    allocation = regalloc.allocate(
+        f, regalloc.REGISTER_FILES[arch]
+    )
+    assert allocation.slots == {}
+    assert len(set(allocation.registers.values())) <= 3
+
+
+@pytest.mark.parametrize("arch", list(Arch))
+def test_spills_under_pressure(arch):
+    registers = regalloc.REGISTER_FILES[arch]
+    names = [f"v{i}" for i in range(20)]
+    f = function(
+        [Let(Id(name), Int(i)) for i, name in enumerate(names)]
+        + [Return(total(names))]
+    )
+    allocation = regalloc.allocate(f, registers)
+    count = len(registers.caller_saved + registers.callee_saved)
+    assert len(allocation.slots) > 0
+    assert len(allocation.registers) + len(
+        allocation.slots
+    ) == len(f.definitions)
+    # Live values at the peak either have a register or a slot
+    assert len(allocation.slots) >= 20 - count
+    assert allocation.saved == list(registers.callee_saved)
+
+
+def test_values_across_calls_are_callee_saved():
+    registers = regalloc.REGISTER_FILES[Arch.x86_64]
+    f = function(
+        [
+            Let(Id("p"), Add(Id("a"), Int(1))),
+            Let(Id("q"), Call(Id("g"), [Id("p")])),
+            Return(Add(Id("p"), Id("q"))),
+        ],
+        ["a"],
+    )
+    allocation = regalloc.allocate(f, registers)
+    intervals = regalloc.live_intervals(f)
+    across = [i.value for i in intervals if i.across_call]
+    assert across
+    for value in across:
+        assert (
+            allocation.registers[value] in registers.callee_saved
+        )
+    assert allocation.saved == ["rbx"]
+
+
+def peak(instructions):
+    return 1 + max(
+        operand.i
+        for instruction in instructions
+        for operand in instruction[1:]
+        if type(operand) is pseudo.register
+    )
+
+
+def right(size):
+    node = Int(0)
+    for i in range(1, size):
+        node = Add(Int(i), node)
+    return node
+
+
+def test_sethi_ullman_order():
+    instructions, addr = pseudo.Visitor().visit_value(
+        right(100), 0
+    )
+    assert addr == register(0)
+    assert peak(instructions) == 2
+    f = function([Return(right(100))])
+    allocation = regalloc.allocate(
+        f, regalloc.REGISTER_FILES[Arch.x86_64]
+    )
+    assert allocation.slots == {}
+
+
+def test_sethi_ullman_keeps_operands():
+    # The heavier rhs is evaluated first, sub still takes lhs first
+    node = BinOp(Id("a"), Add(Id("b"), Id("c")), "sub")
+    instructions, _ = pseudo.Visitor().visit_value(node, 0)
+    assert instructions == [
+        ("mov", register(0), "b"),
+        ("mov", register(1), "c"),
+        ("add", register(0), register(1), register(0)),
+        ("mov", register(1), "a"),
+        ("sub", register(1), register(0), register(0)),
+    ]
+
+
+def test_calls_keep_source_order():
+    node = Add(
+        Call(Id("g"), []), Add(Id("b"), Call(Id("h"), []))
+    )
+    instructions, _ = pseudo.Visitor().visit_value(node, 0)
+    calls = [i[1] for i in instructions if i[0] == "call"]
+    assert calls == ["g", "h"]
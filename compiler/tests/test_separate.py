@@ -0,0 +1,147 @@
+import os
+import platform
+import shutil
+import subprocess
+import pytest
+from compiler import assembler, cache, code_gen, separate
+from compiler.arch import Arch
+from compiler.parser import parse
+
+SOURCE = """
+let g = 40;
+fn f(x) { return x; }
+fn k() { return g; }
+f(1);
+exit(g);
+"""
+
+
+def keys(source):
+    return {
+        unit.name: unit.key
+        for unit in separate.units(parse(source), arch="x86_64")
+    }
+
+
+def test_units():
+    units = separate.units(parse(SOURCE))
+    assert [unit.name for unit in units] == ["f", "k", "_start"]
+    assert [unit.exports for unit in units] == [
+        ["f"],
+        ["k"],
+        ["g"],
+    ]
+
+
+def test_keys_ignore_positions():
+    moved = "\n\n" + SOURCE.replace("fn f", "fn  f")
+    assert keys(moved) == keys(SOURCE)
+
+
+def test_keys_follow_changes():
+    before = keys(SOURCE)
+    # A callee's body is not part of its callers' keys
+    after = keys(SOURCE.replace("return x;", "return 2;"))
+    assert {n for n in before if before[n] != after[n]} == {"f"}
+    # Its parameter count is
+    after = keys(
+        SOURCE.replace("fn f(x)", "fn f(x, y)").replace(
+            "f(1)", "f(1, 2)"
+        )
+    )
+    assert {n for n in before if before[n] != after[n]} == {
+        "f",
+        "_start",
+    }
+    assert keys(SOURCE) != keys(SOURCE.replace("40", "41"))
+
+
+def test_lower_exports():
+    f, k, start = separate.units(parse(SOURCE))
+    assert separate.lower(k) == [
+        ("global", "k", None, None),
+        ("section", "text", None, None),
+        ("label", "k", None, None),
+        ("return", "g", None, None),
+        ("ret", None, None, None),
+    ]
+    # Lets stay for the other units to read
+    assert ("int", "g", 40, None) in separate.lower(start)
+
+
+def test_lower_aarch64():
+    f, k, start = separate.units(parse(SOURCE))
+    lines = list(code_gen.aarch64_lines(separate.lower(k)))
+    # Globals are read from memory
+    assert lines[-3:] == [
+        "adrp x0, g",
+        "ldr x0, [x0, :lo12:g]",
+        "ret",
+    ]
+    for unit in (f, k, start):
+        assembler.assemble(
+            code_gen.aarch64_lines(separate.lower(unit)),
+            Arch.aarch64,
+        )
+
+
+def test_build_rebuilds_changed_units(tmp_path):
+    store = cache.Cache(tmp_path / "cache")
+    assembled = []
+
+    def assemble(source, output):
+        assembled.append(
+            os.path.basename(os.path.dirname(source))
+        )
+        shutil.copy(source, output)
+
+    def build(source):
+        return separate.build(
+            parse(source),
+            Arch.x86_64,
+            store,
+            tmp_path / "units",
+            assemble,
+        )
+
+    objects, rebuilt = build(SOURCE)
+    assert rebuilt == 3
+    assert objects == [
+        os.path.join(tmp_path / "units", name, "unit.o")
+        for name in ("f", "k", "_start")
+    ]
+    assert build(SOURCE)[1] == 0
+    assert (
+        build(SOURCE.replace("return x;", "return 2;"))[1] == 1
+    )
+    assert assembled == ["f", "k", "_start", "f"]
+
+
+@pytest.mark.skipif(
+    platform.machine() != "x86_64"
+    or not (shutil.which("as") and shutil.which("ld")),
+    reason="needs as and ld for an x86_64 host",
+)
+@pytest.mark.parametrize(
+    "source,status",
+    [
+        (SOURCE, 40),
+        # The call's value is used, it can not inline across units
+        ("fn f(a) { return a; }\nexit(f(2));", 2),
+    ],
+    ids=["globals", "call value"],
+)
+def test_build_links(tmp_path, source, status):
+    def assemble(source, output):
+        subprocess.check_call(["as", source, "-o", output])
+
+    objects, _ = separate.build(
+        parse(source),
+        Arch.x86_64,
+        cache.Cache(tmp_path / "cache"),
+        tmp_path / "units",
+        assemble,
+    )
+    executable = tmp_path / "vinyl.exe"
+    subprocess.check_call(["ld", *objects, "-o", executable])
+    assert subprocess.run([executable]).returncode == status
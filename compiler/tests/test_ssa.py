@@ -0,0 +1,280 @@
+import pytest
+from compiler import code_gen, parser, pseudo, ssa
+from compiler.pseudo import (
+    Add,
+    AST,
+    Call,
+    Fn,
+    Int,
+    Id,
+    Let,
+    Mul,
+    Return,
+    Sub,
+)
+from compiler.ssa import Value
+
+
+def instructions(function):
+    return [
+        (
+            instruction.op,
+            instruction.result,
+            instruction.operands,
+        )
+        for instruction in function.instructions()
+    ]
+
+
+def test_build_renames_registers():
+    # Both statements use pseudo register 0
+    module = ssa.build(
+        AST([Let(Id("x"), Int(1)), Return(Add(Id("x"), Int(2)))])
+    )
+    (start,) = module.functions
+    assert instructions(start) == [
+        ("const", Value(0), (1,)),
+        ("store", None, ("x", Value(0))),
+        ("const", Value(1), (2,)),
+        ("add", Value(2), (Value(0), Value(1))),
+        ("ret", None, (Value(2),)),
+    ]
+    assert module.globals == ["x"]
+
+
+def test_build_functions():
+    module = ssa.build(
+        AST(
+            [
+                Fn(
+                    Id("f"),
+                    [Id("a"), Id("b")],
+                    [Return(Mul(Id("a"), Id("k")))],
+                ),
+                Let(Id("y"), Call(Id("f"), [Int(2), Int(3)])),
+            ]
+        )
+    )
+    f, start = module.functions
+    assert (f.name, f.parameters) == ("f", 2)
+    assert instructions(f) == [
+        ("parameter", Value(0), (0,)),
+        ("parameter", Value(1), (1,)),
+        ("load", Value(2), ("k",)),
+        ("mul", Value(3), (Value(0), Value(2))),
+        ("ret", None, (Value(3),)),
+    ]
+    assert instructions(start) == [
+        ("const", Value(0), (2,)),
+        ("const", Value(1), (3,)),
+        ("call", Value(2), ("f", Value(0), Value(1))),
+        ("store", None, ("y", Value(2))),
+        ("const", Value(3), (0,)),
+        ("ret", None, (Value(3),)),
+    ]
+    assert module.globals == ["k", "y"]
+
+
+def test_def_use_chains():
+    module = ssa.build(
+        AST(
+            [Let(Id("x"), Int(3)), Return(Mul(Id("x"), Id("x")))]
+        )
+    )
+    (start,) = module.functions
+    x = Value(0)
+    assert start.definition(x).op == "const"
+    # One use per operand
+    assert [user.op for user in start.users(x)] == [
+        "store",
+        "mul",
+        "mul",
+    ]
+    (product,) = [
+        value
+        for value in map(Value, range(len(start.definitions)))
+        if start.definition(value).op == "mul"
+    ]
+    assert [user.op for user in start.users(product)] == ["ret"]
+
+
+def test_blocks_after_return():
+    module = ssa.build(
+        AST(
+            [
+                Fn(
+                    Id("f"),
+                    [],
+                    [Return(Int(1)), Return(Int(2))],
+                )
+            ]
+        )
+    )
+    f, _ = module.functions
+    assert [block.label for block in f.blocks] == ["f", "f.1"]
+    assert all(block.terminated() for block in f.blocks)
+    assert f.blocks[1].predecessors == []
+
+
+@pytest.mark.parametrize(
+    "lines,expect",
+    [
+        (
+            code_gen.gas_ssa_lines,
+            [
+                ".global _start",
+                "\n.text",
+                "_start:",
+                "\tmov\t%rsp, %rbp",
+                "\tmovq\t$42, %r10",
+                "\tmov\t%r10, %rdi",
+                "\tmov\t$60, %rax",
+                "\tsyscall",
+            ],
+        ),
+        (
+            code_gen.aarch64_ssa_lines,
+            [
+                ".global _start",
+                ".section .text",
+                "_start:",
+                "mov x29, sp",
+                "mov x11, #42",
+                "mov x0, x11",
+                "mov x8, #93",
+                "svc #0",
+            ],
+        ),
+    ],
+)
+def test_ssa_lines(lines, expect):
+    module = ssa.build(AST([Return(Int(42))]))
+    assert list(lines(module)) == expect
+
+
+def test_tail_calls():
+    module = ssa.build(
+        AST(
+            [
+                Fn(
+                    Id("f"),
+                    [Id("n")],
+                    [
+                        Return(
+                            Call(Id("f"), [Add(Id("n"), Int(1))])
+                        )
+                    ],
+                ),
+                Fn(
+                    Id("g"),
+                    [Id("n")],
+                    [
+                        Return(
+                            Add(Call(Id("f"), [Id("n")]), Int(1))
+                        )
+                    ],
+                ),
+                Return(Call(Id("f"), [Int(0)])),
+            ]
+        )
+    )
+    f, g, start = module.functions
+    assert instructions(f)[-1] == (
+        "tailcall",
+        None,
+        ("f", Value(2)),
+    )
+    assert f.blocks[-1].terminated()
+    # The value of g's call is used, _start exits with its value
+    assert "tailcall" not in [i.op for i in g.instructions()]
+    assert "tailcall" not in [i.op for i in start.instructions()]
+
+
+@pytest.mark.parametrize(
+    "lines,jump",
+    [
+        (code_gen.gas_ssa_lines, "\tjmp\tg"),
+        (code_gen.aarch64_ssa_lines, "b g"),
+    ],
+)
+def test_tail_call_lines(lines, jump):
+    module = ssa.build(
+        AST(
+            [
+                Fn(Id("g"), [Id("a")], [Return(Id("a"))]),
+                Fn(
+                    Id("f"),
+                    [Id("a")],
+                    [Return(Call(Id("g"), [Id("a")]))],
+                ),
+            ]
+        )
+    )
+    output = list(lines(module))
+    f = output[output.index("f:") : output.index("_start:")]
+    # The frame is gone before the jump, nothing follows it
+    assert f[-1] == jump
+    assert not any("call" in line or "bl " in line for line in f)
+
+
+@pytest.mark.parametrize(
+    "lines,limit",
+    [
+        (code_gen.gas_ssa_lines, 6),
+        (code_gen.aarch64_ssa_lines, 8),
+    ],
+)
+def test_too_many_arguments(lines, limit):
+    names = [Id(f"a{i}") for i in range(limit + 1)]
+    values = [Int(i) for i in range(limit + 1)]
+    for statement in (
+        Fn(Id("f"), names, [Return(names[-1])]),
+        Call(Id("f"), values),
+    ):
+        module = ssa.build(AST([statement]))
+        with pytest.raises(
+            code_gen.CodeGenError, match=f"at most {limit}"
+        ):
+            list(lines(module))
+    # Up to the limit they are passed in registers
+    module = ssa.build(
+        AST(
+            [
+                Fn(Id("f"), names[:limit], [Return(names[-2])]),
+                Call(Id("f"), values[:limit]),
+            ]
+        )
+    )
+    list(lines(module))
+
+
+def test_from_program():
+    program = parser.parse(
+        "let g = 2;\nfn f(x) { { return x - g; } }\n"
+        "f(1);\nexit(f(5) * 3);"
+    )
+    assert pseudo.from_program(program) == AST(
+        [
+            Let(Id("g"), Int(2)),
+            Fn(
+                Id("f"),
+                [Id("x")],
+                [Return(Sub(Id("x"), Id("g")))],
+            ),
+            Call(Id("f"), [Int(1)]),
+            Return(Mul(Call(Id("f"), [Int(5)]), Int(3))),
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "source,message",
+    [
+        ("print(1);", "print"),
+        ("fn f(x) { exit(x); }", "exit in a function"),
+        ("{ let x = 1; }", "a block with lets"),
+    ],
+)
+def test_from_program_unsupported(source, message):
+    with pytest.raises(pseudo.Unsupported, match=message):
+        pseudo.from_program(parser.parse(source))
@@ -0,0 +1,165 @@
+import random
+import pytest
+from compiler import code_gen, lvn, ssa, strength
+from compiler.ir import divide
+from compiler.pseudo import (
+    Add,
+    AST,
+    Div,
+    Fn,
+    Int,
+    Id,
+    Mul,
+    Pow,
+    Return,
+)
+from compiler.ssa import Value
+from tests.test_ssa import instructions
+
+
+def reduced(value, parameters=("x",)):
+    module = strength.reduce(
+        lvn.number(
+            ssa.build(
+                AST(
+                    [
+                        Fn(
+                            Id("f"),
+                            [Id(p) for p in parameters],
+                            [Return(value)],
+                        )
+                    ]
+                )
+            )
+        )
+    )
+    return module.functions[0]
+
+
+def ops(function):
+    return [i.op for i in function.instructions()]
+
+
+def test_reduce_multiply_and_divide_by_constants():
+    f = reduced(Add(Mul(Int(8), Id("x")), Div(Id("x"), Int(7))))
+    assert instructions(f) == [
+        ("parameter", Value(0), (0,)),
+        ("muli", Value(2), (Value(0), 8)),
+        ("divi", Value(4), (Value(0), 7)),
+        ("add", Value(5), (Value(2), Value(4))),
+        ("ret", None, (Value(5),)),
+    ]
+
+
+def test_reduce_identities():
+    f = reduced(
+        Add(
+            Mul(Id("x"), Int(1)),
+            Add(Div(Id("x"), Int(1)), Mul(Id("x"), Int(0))),
+        )
+    )
+    assert ops(f).count("mul") == ops(f).count("div") == 0
+    assert "muli" not in ops(f) and "divi" not in ops(f)
+
+
+def test_reduce_constants():
+    f = reduced(Add(Div(Int(-7), Int(2)), Pow(Int(3), Int(4))))
+    assert [
+        i.operands for i in f.instructions() if i.op == "const"
+    ][-2:] == [(-3,), (81,)]
+
+
+def test_reduce_keeps_division_by_zero_and_variables():
+    f = reduced(
+        Add(Div(Id("x"), Int(0)), Div(Id("x"), Id("y"))),
+        ("x", "y"),
+    )
+    assert ops(f).count("div") == 2
+
+
+@pytest.mark.parametrize(
+    "exponent, multiplies", [(0, 0), (1, 0), (2, 1), (13, 5)]
+)
+def test_reduce_power_square_and_multiply(exponent, multiplies):
+    f = reduced(Pow(Id("x"), Int(exponent)))
+    assert "pow" not in ops(f)
+    assert ops(f).count("mul") == multiplies
+
+
+def test_reduce_fuses_multiply_add():
+    f = reduced(Add(Mul(Id("x"), Id("y")), Id("y")), ("x", "y"))
+    assert instructions(f)[-2:] == [
+        ("madd", Value(3), (Value(0), Value(1), Value(1))),
+        ("ret", None, (Value(3),)),
+    ]
+    # A product used elsewhere is kept
+    f = reduced(
+        Add(Mul(Id("x"), Id("y")), Mul(Id("x"), Id("y"))),
+        ("x", "y"),
+    )
+    assert "madd" not in ops(f)
+
+
+@pytest.mark.parametrize(
+    "divisor", [3, 5, 6, 7, 10, 641, 1000, 2**40 + 1, 2**63 - 1]
+)
+def test_magic(divisor):
+    number, shift = strength.magic(divisor)
+    rng = random.Random(divisor)
+    dividends = [0, 1, -1, 2**63 - 1, -(2**63)] + [
+        rng.randrange(-(2**63), 2**63) for _ in range(1000)
+    ]
+    for n in dividends:
+        # As the backends compute it
+        quotient = (number * n) >> 64
+        if number < 0:
+            quotient += n
+        quotient >>= shift
+        quotient += quotient < 0
+        assert quotient == divide(n, divisor)
+
+
+def lowered(backend, value, parameters=("x",)):
+    f = reduced(value, parameters)
+    module = ssa.Module([f], [])
+    return "\n".join(backend(module))
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (Mul(Id("x"), Int(8)), "shl\t$3"),
+        (Mul(Id("x"), Int(5)), "lea\t(%r10,%r10,4)"),
+        (Mul(Id("x"), Int(24)), "shl\t$3"),
+        (Mul(Id("x"), Int(-7)), "imul\t$7, %r10"),
+        (Div(Id("x"), Int(16)), "sar\t$4, %rax"),
+        (Div(Id("x"), Int(10)), "imulq\t%r10"),
+        (Div(Id("x"), Id("x")), "idivq"),
+        (Pow(Id("x"), Id("x")), "jnz"),
+    ],
+)
+def test_gas_lowering(value, expected):
+    lines = lowered(code_gen.gas_ssa_lines, value)
+    assert expected in lines
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (Mul(Id("x"), Int(8)), "lsl x12, x11, #3"),
+        (Mul(Id("x"), Int(9)), "add x12, x11, x11, lsl #3"),
+        (Mul(Id("x"), Int(7)), "sub x12, x12, x11"),
+        (Mul(Id("x"), Int(11)), "mul x12, x11, x16"),
+        (Div(Id("x"), Int(4)), "asr x12, x16, #2"),
+        (Div(Id("x"), Int(7)), "smulh x16, x11, x16"),
+        (Div(Id("x"), Id("x")), "sdiv"),
+        (Pow(Id("x"), Id("x")), "cbnz x10"),
+        (
+            Add(Mul(Id("x"), Id("x")), Id("x")),
+            "madd x12, x11, x11, x11",
+        ),
+    ],
+)
+def test_aarch64_lowering(value, expected):
+    lines = lowered(code_gen.aarch64_ssa_lines, value)
+    assert expected in lines
@@ -0,0 +1,103 @@
+import io
+import pytest
+from compiler import dce, fold, ir, main, parser, vm
+from compiler.lexer import TokenStream
+
+
+def run(source, streaming=False):
+    if streaming:
+        statements = parser.parse_statements(TokenStream(source))
+        instructions = dce.reachable(
+            fold.propagate(ir.visit_stream(statements))
+        )
+    else:
+        instructions = dce.eliminate(
+            fold.fold(ir.visit(parser.parse(source)))
+        )
+    out = io.StringIO()
+    status = vm.run(vm.translate(instructions), out)
+    return status, out.getvalue()
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+@pytest.mark.parametrize(
+    "source, status, output",
+    [
+        ("let a = 100;\nlet b = 42;\nexit(a + b);", 142, ""),
+        ("print(42);\nprint(7);", 0, "42\n7\n"),
+        ("exit(300);", 300 & 0xFF, ""),
+        (
+            "fn f(x, y) { let z = x * y; return z - 1; }\n"
+            "let a = f(3, 4);\nprint(a);\nexit(a);",
+            11,
+            "11\n",
+        ),
+        (
+            "fn sq(x) { return x * x; }\n"
+            "fn g(n) { return sq(n) + sq(n + 1); }\n"
+            "exit(g(10));",
+            221,
+            "",
+        ),
+        (
+            "fn f(x) { print(x); exit(x / 2); }\n"
+            "f(9);\nprint(1);",
+            4,
+            "9\n",
+        ),
+        ("fn f() { }\nexit(f() + 2);", 2, ""),
+        (
+            "let k = 5;\n"
+            "fn f(x) { let k = k + x; return k ^ 2; }\n"
+            "exit(f(2) - k);",
+            44,
+            "",
+        ),
+    ],
+)
+def test_run(source, status, output, streaming):
+    assert run(source, streaming) == (status, output)
+
+
+def test_run_wraps_to_64_bits():
+    source = (
+        "fn f(x) { return x * x; }\n"
+        "let a = f(4294967296) - 1;\nprint(a);"
+    )
+    assert run(source) == (0, "-1\n")
+
+
+def test_run_calls_nest_deeply():
+    source = "fn id(x) { return x; }\n" + (
+        "exit(" + "id(" * 50 + "7" + ")" * 51 + ";"
+    )
+    assert run(source) == (7, "")
+
+
+@pytest.mark.parametrize(
+    "source, status",
+    [
+        ("fn f(x) { return 1 / x; }\nexit(f(0));", 136),
+        ("fn f(x) { return f(x + 1); }\nexit(f(0));", 139),
+    ],
+)
+def test_run_faults(source, status):
+    with pytest.raises(vm.Fault) as error:
+        run(source)
+    assert error.value.status == status
+
+
+def test_translate_unknown_function():
+    with pytest.raises(Exception, match="Unknown function"):
+        run("exit(f(1));")
+
+
+def test_main_run(tmp_path, capsys):
+    path = tmp_path / "program.lp"
+    path.write_text(
+        "fn f(x) { print(x); return x + 1; }\nexit(f(6));"
+    )
+    with pytest.raises(SystemExit) as exit_:
+        main.main(str(path), run=True)
+    assert exit_.value.code == 7
+    assert capsys.readouterr().out == "6\n"